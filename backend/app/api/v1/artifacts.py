@@ -3,14 +3,17 @@
 Artifact endpoints.
 """
 
+import json
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
+from app.core.database import AsyncSessionLocal
 from app.dependencies import get_db
-from app.schemas.artifact import RegenerateRequest
-from app.services.artifact_service import ArtifactService
+from app.schemas.artifact import RegenerateRequest, RegenerateBatchRequest
+from app.services.artifact_service import ArtifactService, validate_feedback
 
 router = APIRouter(prefix="/artifacts", tags=["Artifacts"])
 
@@ -38,6 +41,7 @@ async def get_artifact(
 @router.post("/regenerate")
 async def regenerate_artifact(
     request: RegenerateRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -75,7 +79,8 @@ async def regenerate_artifact(
         new_artifact = await service.regenerate_artifact(
             artifact=artifact,
             feedback=request.feedback,
-            created_by=request.created_by
+            created_by=request.created_by,
+            background_tasks=background_tasks
         )
         
         return service.to_dict(new_artifact)
@@ -89,6 +94,111 @@ async def regenerate_artifact(
         raise HTTPException(status_code=500, detail=f"Regeneration failed: {str(e)}")
 
 
+@router.post("/regenerate/stream")
+async def regenerate_artifact_stream(
+    request: RegenerateRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Regenerate an artifact, streaming the new content as it is generated.
+    
+    The response is newline-delimited JSON: one {"type": "chunk", "content": ...}
+    line per piece of generated text, then a final {"type": "done", "artifact": ...}
+    line with the saved artifact version (or {"type": "error", ...} on failure).
+    
+    Args:
+        request: Contains artifact_id, feedback, and optional created_by
+        
+    Returns:
+        Streaming NDJSON response
+    """
+    try:
+        artifact_uuid = UUID(request.artifact_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid artifact ID format")
+    
+    # Validate up front; errors raised inside the stream can't change the status code
+    validate_feedback(request.feedback)
+    
+    artifact = await ArtifactService(db).get_artifact(artifact_uuid)
+    if not artifact:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    
+    async def events():
+        # The stream outlives the request-scoped session, so use its own
+        async with AsyncSessionLocal() as session:
+            service = ArtifactService(session)
+            # Attach the already-loaded row instead of selecting it again
+            source = await session.merge(artifact, load=False)
+            try:
+                async for item in service.regenerate_artifact_stream(
+                    artifact=source,
+                    feedback=request.feedback,
+                    created_by=request.created_by,
+                    background_tasks=background_tasks
+                ):
+                    if isinstance(item, str):
+                        yield json.dumps({"type": "chunk", "content": item}) + "\n"
+                    else:
+                        yield json.dumps({"type": "done", "artifact": service.to_dict(item)}) + "\n"
+            except Exception as e:
+                print(f"❌ Streaming regeneration failed: {str(e)}")
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield json.dumps({"type": "error", "detail": detail}) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.post("/regenerate/batch")
+async def regenerate_artifacts_batch(
+    request: RegenerateBatchRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Regenerate several artifacts in one request.
+    
+    Artifacts of the same type share a single AI call.
+    
+    Args:
+        request: List of artifact_id/feedback items and optional created_by
+        
+    Returns:
+        The new artifact versions, in request order
+    """
+    service = ArtifactService(db)
+    
+    items = []
+    for item in request.items:
+        try:
+            artifact_uuid = UUID(item.artifact_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid artifact ID format: {item.artifact_id}")
+        
+        artifact = await service.get_artifact(artifact_uuid)
+        if not artifact:
+            raise HTTPException(status_code=404, detail=f"Artifact not found: {item.artifact_id}")
+        items.append((artifact, item.feedback))
+    
+    try:
+        new_artifacts = await service.regenerate_artifacts_batch(
+            items=items,
+            created_by=request.created_by,
+            background_tasks=background_tasks
+        )
+        
+        return service.to_dicts(new_artifacts)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Batch regeneration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Batch regeneration failed: {str(e)}")
+
+
 # Project-scoped artifact endpoints
 @router.get("/project/{project_id}")
 async def list_project_artifacts(
@@ -111,7 +221,7 @@ async def list_project_artifacts(
             stage=stage,
             artifact_type=artifact_type
         )
-        return [service.to_dict(a) for a in artifacts]
+        return service.to_dicts(artifacts)
     except Exception as e:
         print(f"Error listing artifacts: {str(e)}")
         # Return empty array on error instead of raising exception
@@ -137,5 +247,5 @@ async def get_stage_artifacts(
         "project_id": project_id,
         "stage": stage,
         "count": len(artifacts),
-        "artifacts": [service.to_dict(a) for a in artifacts]
+        "artifacts": service.to_dicts(artifacts)
     }
\ No newline at end of file
@@ -3,9 +3,13 @@
 Define stage endpoints.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+import json
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.database import AsyncSessionLocal
 from app.dependencies import get_db
 from app.schemas.stage_define import DefineGenerateRequest
 from app.services.define_service import DefineService
@@ -16,6 +20,7 @@ router = APIRouter(prefix="/stages/define", tags=["Define Stage"])
 @router.post("/generate")
 async def generate_define_stage(
     request: DefineGenerateRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -47,7 +52,8 @@ async def generate_define_stage(
             project_id=request.project_id,
             problem_statement_artifact_id=request.problem_statement_artifact_id,
             stakeholder_analysis_artifact_id=request.stakeholder_analysis_artifact_id,
-            created_by=request.created_by
+            created_by=request.created_by,
+            background_tasks=background_tasks
         )
         return result
     except HTTPException:
@@ -57,4 +63,49 @@ async def generate_define_stage(
         print(f"❌ Error in define stage: {str(e)}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Define stage failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Define stage failed: {str(e)}")
+
+
+@router.post("/generate/stream")
+async def generate_define_stage_stream(
+    request: DefineGenerateRequest,
+    background_tasks: BackgroundTasks
+):
+    """
+    DEFINE STAGE: Generate BRD and User Stories, streaming them as they are written.
+    
+    The response is newline-delimited JSON: {"type": "chunk", "artifact": "brd" |
+    "user_stories", "content": ...} lines while the documents are generated, then
+    a final {"type": "done", "result": ...} line with the same payload as
+    /generate (or {"type": "error", ...} on failure).
+    
+    Args:
+        request: Same body as /generate
+        
+    Returns:
+        Streaming NDJSON response
+    """
+    async def events():
+        # The stream outlives the request, so it owns its session
+        async with AsyncSessionLocal() as session:
+            service = DefineService(session)
+            try:
+                async for item in service.generate_define_stage_stream(
+                    project_id=request.project_id,
+                    problem_statement_artifact_id=request.problem_statement_artifact_id,
+                    stakeholder_analysis_artifact_id=request.stakeholder_analysis_artifact_id,
+                    created_by=request.created_by,
+                    background_tasks=background_tasks
+                ):
+                    if isinstance(item, dict):
+                        yield json.dumps({"type": "done", "result": item}) + "\n"
+                    else:
+                        artifact, content = item
+                        yield json.dumps({"type": "chunk", "artifact": artifact, "content": content}) + "\n"
+            except Exception as e:
+                await session.rollback()
+                print(f"❌ Error in define stage stream: {str(e)}")
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield json.dumps({"type": "error", "detail": detail}) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
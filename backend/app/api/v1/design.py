@@ -3,7 +3,7 @@
 Design stage endpoints.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dependencies import get_db
@@ -61,6 +61,7 @@ async def generate_design(
 @router.post("/select")
 async def select_architecture(
     request: SelectArchitectureRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -83,7 +84,8 @@ async def select_architecture(
             project_id=request.project_id,
             selected_option_id=request.selected_option_id,
             options_data=request.options_data,
-            created_by=request.created_by
+            created_by=request.created_by,
+            background_tasks=background_tasks
         )
         return result
     except HTTPException:
@@ -3,7 +3,9 @@
 Develop stage endpoints - Ticket generation and implementation.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, Dict
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dependencies import get_db
@@ -15,6 +17,8 @@ from app.schemas.stage_develop import (
 )
 from app.services.develop_service import DevelopService
 
+# Endpoints declare their return type so FastAPI serializes the (often large)
+# ticket payloads straight to JSON bytes via Pydantic, skipping jsonable_encoder
 router = APIRouter(prefix="/stages/develop", tags=["Develop Stage"])
 
 
@@ -22,7 +26,7 @@ router = APIRouter(prefix="/stages/develop", tags=["Develop Stage"])
 async def generate_tickets(
     request: GenerateTicketsRequest,
     db: AsyncSession = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     DEVELOP STAGE: Generate development tickets from all project artifacts.
     
@@ -68,7 +72,7 @@ async def generate_tickets(
 async def get_tickets(
     project_id: str,
     db: AsyncSession = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     Get existing development tickets for a project.
     
@@ -88,7 +92,7 @@ async def update_ticket_status(
     ticket_key: str,
     request: UpdateTicketStatusRequest,
     db: AsyncSession = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     Update a ticket's status.
     
@@ -112,7 +116,7 @@ async def update_ticket_status(
 async def start_implementation(
     request: StartImplementationRequest,
     db: AsyncSession = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     Start implementing a ticket - updates status and returns context.
     
@@ -133,15 +137,15 @@ async def start_implementation(
 async def implement_ticket(
     request: ImplementTicketRequest,
     db: AsyncSession = Depends(get_db)
-):
+) -> Dict[str, Any]:
     """
     Full ticket implementation workflow.
     
     This is the main endpoint for automated code generation and PR creation.
     The workflow:
-    1. Creates a feature branch from default branch
-    2. Creates a GitHub Issue for the ticket
-    3. Generates code using AI based on ticket and architecture
+    1. Generates code using AI based on ticket and architecture
+    2. Creates a feature branch from default branch
+    3. Creates a GitHub Issue for the ticket
     4. Commits generated files to the feature branch
     5. Creates a Pull Request
     6. Links the PR to the Issue
@@ -151,6 +155,9 @@ async def implement_ticket(
     - Tickets must be generated
     - Architecture document must exist
     
+    Returns 409 while the ticket has a pending or in-progress implementation
+    job from either this route or /implement/async.
+    
     Args:
         request: Contains project_id, ticket_key, and optional created_by
         
@@ -160,7 +167,7 @@ async def implement_ticket(
     service = DevelopService(db)
     
     try:
-        result = await service.implement_ticket(
+        result = await service.implement_ticket_exclusive(
             project_id=request.project_id,
             ticket_key=request.ticket_key,
             created_by=request.created_by
@@ -173,3 +180,32 @@ async def implement_ticket(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Implementation failed: {str(e)}")
+
+
+@router.post("/implement/async")
+async def implement_ticket_async(
+    request: ImplementTicketRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+) -> Dict[str, Any]:
+    """
+    Queue the full ticket implementation workflow and return immediately.
+    
+    Runs the same workflow as /implement after the response is sent. Poll
+    GET /{project_id}/tickets and read the ticket's "implementation_job"
+    (pending, in_progress, completed or failed) to follow progress. A ticket
+    with a pending or in-progress job is rejected with 409.
+    
+    Args:
+        request: Contains project_id, ticket_key, and optional created_by
+        
+    Returns:
+        Dictionary containing the accepted job id
+    """
+    service = DevelopService(db)
+    return await service.queue_ticket_implementation(
+        project_id=request.project_id,
+        ticket_key=request.ticket_key,
+        background_tasks=background_tasks,
+        created_by=request.created_by
+    )
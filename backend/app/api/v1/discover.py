@@ -3,9 +3,13 @@
 Discover stage endpoints.
 """
 
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.database import AsyncSessionLocal
 from app.dependencies import get_db
 from app.schemas.stage_discover import DiscoverGenerateRequest
 from app.services.discover_service import DiscoverService
@@ -51,4 +55,44 @@ async def generate_discover_stage(
         print(f"❌ Error in discover stage: {str(e)}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Discover stage failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Discover stage failed: {str(e)}")
+
+
+@router.post("/generate/stream")
+async def generate_discover_stage_stream(request: DiscoverGenerateRequest):
+    """
+    DISCOVER STAGE: Generate Problem Statement and Stakeholder Analysis, streaming them as they are written.
+    
+    The response is newline-delimited JSON: {"type": "chunk", "artifact":
+    "problem_statement" | "stakeholder_analysis", "content": ...} lines while the
+    documents are generated, then a final {"type": "done", "result": ...} line
+    with the same payload as /generate (or {"type": "error", ...} on failure).
+    
+    Args:
+        request: Same body as /generate
+        
+    Returns:
+        Streaming NDJSON response
+    """
+    async def events():
+        # The stream outlives the request, so it owns its session
+        async with AsyncSessionLocal() as session:
+            service = DiscoverService(session)
+            try:
+                async for item in service.generate_discover_stage_stream(
+                    project_id=request.project_id,
+                    user_idea=request.user_idea,
+                    created_by=request.created_by
+                ):
+                    if isinstance(item, dict):
+                        yield json.dumps({"type": "done", "result": item}) + "\n"
+                    else:
+                        artifact, content = item
+                        yield json.dumps({"type": "chunk", "artifact": artifact, "content": content}) + "\n"
+            except Exception as e:
+                await session.rollback()
+                print(f"❌ Error in discover stage stream: {str(e)}")
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield json.dumps({"type": "error", "detail": detail}) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
@@ -3,6 +3,8 @@
 GitHub configuration endpoints.
 """
 
+from uuid import UUID
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -48,7 +50,7 @@ async def validate_github_credentials(
 
 @router.post("/projects/{project_id}/config")
 async def save_github_config(
-    project_id: str,
+    project_id: UUID,
     request: GitHubConfigRequest,
     db: AsyncSession = Depends(get_db)
 ):
@@ -94,7 +96,7 @@ async def save_github_config(
 
 @router.get("/projects/{project_id}/config")
 async def get_github_config(
-    project_id: str,
+    project_id: UUID,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -114,7 +116,7 @@ async def get_github_config(
 
 @router.delete("/projects/{project_id}/config")
 async def delete_github_config(
-    project_id: str,
+    project_id: UUID,
     db: AsyncSession = Depends(get_db)
 ):
     """
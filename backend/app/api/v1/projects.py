@@ -84,11 +84,11 @@ async def update_project(
     if request.description is not None:
         project.description = request.description
     if request.stages_config is not None:
-        await service.update_stages_config(project_uuid, request.stages_config)
-        await db.refresh(project)
+        await service.update_stages_config(project, request.stages_config)
     
+    # Sessions keep loaded state on commit and updated_at is set client-side,
+    # so the instance is already current without a refresh
     await db.commit()
-    await db.refresh(project)
     
     return service.to_dict(project)
 
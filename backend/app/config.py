@@ -23,15 +23,22 @@ class Settings(BaseSettings):
     app_name: str = "SDLC Studio API"
     app_version: str = "1.0.0"
     debug: bool = False
+    log_level: str = "INFO"
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./sdlc_studio.db"
+    # Connection pool (server databases only; SQLite keeps its default pool)
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800
     
     # Azure OpenAI
     azure_openai_api_key: Optional[str] = None
     azure_openai_endpoint: Optional[str] = None
     azure_openai_deployment: str = "gpt-4o-mini"
     azure_openai_api_version: str = "2024-12-01-preview"
+    # Completion requests in flight at once across the process
+    openai_max_concurrency: int = 32
     
     # Security
     encryption_key: Optional[str] = None
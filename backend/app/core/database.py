@@ -4,25 +4,47 @@ Async database configuration using SQLAlchemy 2.0 patterns.
 Supports SQLite for development and PostgreSQL for production.
 """
 
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
+
+import orjson
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 from app.config import settings
 
 
+# Pooling options for server databases: a pool sized for concurrent stage
+# requests, liveness checks on checkout, and recycling before server-side
+# idle timeouts drop connections
+_POOL_OPTIONS = {} if settings.is_sqlite else {
+    "pool_size": settings.db_pool_size,
+    "max_overflow": settings.db_max_overflow,
+    "pool_pre_ping": True,
+    "pool_recycle": settings.db_pool_recycle,
+}
+
+
 class Base(DeclarativeBase):
     """Base class for all SQLAlchemy models."""
     pass
 
 
+def _json_serializer(value: Any) -> str:
+    """Serialize JSON column values with orjson."""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 # Create async engine with appropriate settings
 engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
     future=True,
+    # meta_data / changes / stages_config JSON columns go through orjson
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
     # SQLite-specific: allow multi-threaded access
-    connect_args={"check_same_thread": False} if settings.is_sqlite else {}
+    connect_args={"check_same_thread": False} if settings.is_sqlite else {},
+    **_POOL_OPTIONS
 )
 
 # Create async session factory
@@ -41,6 +41,9 @@ def decrypt_token(encrypted: str) -> str:
     """
     Decrypt a previously encrypted token.
     
+    Not memoized: a module-level cache would keep plaintext tokens in memory
+    after their config is deleted.
+    
     Args:
         encrypted: Base64-encoded encrypted token
         
@@ -6,14 +6,33 @@ This is the main entry point for the SDLC Studio backend.
 Refactored from monolithic main.py into modular microservices architecture.
 """
 
+import logging
+import queue
 from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
 from app.core.database import init_db, close_db
 from app.api.v1 import api_router
+from app.services.artifact_service import artifact_dict_cache_scope
+from app.services.github_service import close_http_client
+
+
+# Service modules log through the standard logging module; set LOG_LEVEL=WARNING
+# in production to skip formatting of per-request progress messages. Records
+# are written to stderr by a listener thread, so request handlers only enqueue.
+# The thread runs for the lifespan; records logged before startup are queued
+# and written once it starts.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(message)s",
+    handlers=[QueueHandler(_log_queue)]
+)
 
 
 @asynccontextmanager
@@ -22,10 +41,11 @@ async def lifespan(app: FastAPI):
     Application lifespan manager.
     
     Handles startup and shutdown events:
-    - Startup: Initialize database, create tables
-    - Shutdown: Close database connections
+    - Startup: Start the log listener, initialize database, create tables
+    - Shutdown: Close database connections, stop the log listener
     """
     # Startup
+    _log_listener.start()
     print("🚀 Starting SDLC Studio API...")
     await init_db()
     print("✅ Database initialized")
@@ -36,7 +56,9 @@ async def lifespan(app: FastAPI):
     # Shutdown
     print("👋 Shutting down SDLC Studio API...")
     await close_db()
+    await close_http_client()
     print("✅ Database connections closed")
+    _log_listener.stop()
 
 
 def create_app() -> FastAPI:
@@ -65,6 +87,12 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # Scope per-request caches
+    @app.middleware("http")
+    async def request_cache_scope(request: Request, call_next):
+        with artifact_dict_cache_scope():
+            return await call_next(request)
+    
     # Include API routes
     app.include_router(api_router, prefix="/api")
     
@@ -4,9 +4,10 @@ Artifact model representing generated documents and code.
 """
 
 from datetime import datetime
+from typing import Optional
 from uuid import uuid4
 
-from sqlalchemy import Column, String, Text, Integer, DateTime, JSON, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, String, Text, Integer, DateTime, JSON, Enum as SQLEnum, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.core.database import Base
@@ -34,6 +35,24 @@ class Artifact(Base):
         meta_data: Additional metadata (model used, tokens, etc.)
     """
     __tablename__ = "artifacts"
+    __table_args__ = (
+        # Serves "artifacts of a project stage [of one type], oldest first";
+        # content is deliberately left out of the key (Text can exceed btree limits)
+        Index(
+            "ix_artifacts_project_stage_type_created",
+            "project_id", "stage", "artifact_type", "created_at"
+        ),
+        # Serves "latest artifact of each type across stages" (Develop tickets)
+        Index(
+            "ix_artifacts_project_type_created",
+            "project_id", "artifact_type", "created_at"
+        ),
+        # Serves "latest artifact of a stage by name" (Development Tickets)
+        Index(
+            "ix_artifacts_project_stage_name_created",
+            "project_id", "stage", "name", "created_at"
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     project_id = Column(String(255), ForeignKey("projects.id"), nullable=False)
@@ -47,5 +66,10 @@ class Artifact(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     meta_data = Column(JSON, default=dict)
     
+    @property
+    def artifact_subtype(self) -> Optional[str]:
+        """Subtype stored in meta_data (discover-stage documents share a type)."""
+        return (self.meta_data or {}).get("artifact_subtype")
+    
     def __repr__(self) -> str:
         return f"<Artifact(id={self.id}, type={self.artifact_type}, name='{self.name}')>"
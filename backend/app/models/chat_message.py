@@ -6,7 +6,7 @@ ChatMessage model representing AI specialist chat messages.
 from datetime import datetime
 from uuid import uuid4
 
-from sqlalchemy import Column, String, Text, DateTime, JSON, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, JSON, Enum as SQLEnum, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.core.database import Base
@@ -30,6 +30,10 @@ class ChatMessage(Base):
         meta_data: Additional metadata (model, tokens, etc.)
     """
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Serves "latest N messages for a project stage" (scanned backwards)
+        Index("ix_chat_messages_project_stage_created", "project_id", "stage", "created_at"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     project_id = Column(String(255), ForeignKey("projects.id"), nullable=False)
@@ -6,10 +6,15 @@ AI prompts for all SDLC stages.
 from app.prompts.discover_prompts import (
     PROBLEM_STATEMENT_PROMPT,
     STAKEHOLDER_ANALYSIS_PROMPT,
+    PROBLEM_AND_STAKEHOLDERS_PROMPT,
 )
 from app.prompts.define_prompts import (
     BRD_WITH_CONTEXT_PROMPT,
     TECH_WRITER_PROMPT,
+    BRD_CHAT_INSTRUCTIONS,
+    STORIES_CHAT_INSTRUCTIONS,
+    BRD_AND_STORIES_PROMPT,
+    BRD_AND_STORIES_CHAT_INSTRUCTIONS,
 )
 from app.prompts.design_prompts import (
     DESIGN_SYSTEM_PROMPT,
@@ -31,6 +36,7 @@ from app.prompts.test_prompts import (
 )
 from app.prompts.chat_prompts import (
     CHAT_SYSTEM_PROMPTS,
+    CHAT_SUMMARY_PROMPT,
     get_chat_system_prompt,
 )
 
@@ -38,9 +44,14 @@ __all__ = [
     # Discover
     "PROBLEM_STATEMENT_PROMPT",
     "STAKEHOLDER_ANALYSIS_PROMPT",
+    "PROBLEM_AND_STAKEHOLDERS_PROMPT",
     # Define
     "BRD_WITH_CONTEXT_PROMPT",
     "TECH_WRITER_PROMPT",
+    "BRD_CHAT_INSTRUCTIONS",
+    "STORIES_CHAT_INSTRUCTIONS",
+    "BRD_AND_STORIES_PROMPT",
+    "BRD_AND_STORIES_CHAT_INSTRUCTIONS",
     # Design
     "DESIGN_SYSTEM_PROMPT",
     "DESIGN_USER_PROMPT_TEMPLATE",
@@ -58,5 +69,6 @@ __all__ = [
     "RUN_TESTS_USER_PROMPT",
     # Chat
     "CHAT_SYSTEM_PROMPTS",
+    "CHAT_SUMMARY_PROMPT",
     "get_chat_system_prompt",
 ]
\ No newline at end of file
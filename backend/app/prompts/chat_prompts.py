@@ -8,6 +8,8 @@ The AI specialists should proactively gather specific details that will be
 incorporated into the generated documents.
 """
 
+from functools import lru_cache
+
 CHAT_SYSTEM_PROMPTS = {
     "discover": """You are a Business Analyst AI Specialist in SDLC Studio.
 
@@ -317,6 +319,21 @@ Keep responses concise and release-focused."""
 }
 
 
+CHAT_SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an SDLC AI specialist.
+The summary replaces older chat turns as context for document generation, so nothing important may be lost.
+
+Update the summary with the new turns provided. Preserve:
+- Specific requirements, features and acceptance criteria
+- Business rules, constraints and priorities
+- Decisions made and technology preferences
+- Stakeholders, users and integrations mentioned
+- Open questions that are still unresolved
+
+Write concise markdown bullet points grouped by topic. Do not invent details.
+Output ONLY the updated summary."""
+
+
+@lru_cache(maxsize=16)
 def get_chat_system_prompt(stage: str) -> str:
     """
     Get the system prompt for a specific stage.
@@ -87,3 +87,53 @@ Business Requirements Document:
 {brd_content}
 
 Generate comprehensive user stories in the format above. Each story should be detailed enough for a developer to implement."""
+
+
+# Static user-message preambles. The chat transcript is appended after them so
+# every call shares the longest possible identical prefix (system prompt +
+# preamble), which the model provider can serve from its prompt cache.
+BRD_CHAT_INSTRUCTIONS = """Generate a comprehensive Business Requirements Document that incorporates ALL context from artifacts and conversations.
+
+**CRITICAL**: Review the conversation history below carefully. 
+- Extract EVERY specific requirement mentioned
+- Include ALL business rules discussed
+- Note ALL constraints and priorities stated
+- Use exact terminology from conversations
+- Address ALL stakeholders mentioned
+
+"""
+
+STORIES_CHAT_INSTRUCTIONS = """Generate comprehensive user stories based on the BRD. 
+
+**CRITICAL**: Also review the conversation history below.
+- Include stories for EVERY feature discussed
+- Use exact field names and terminology from conversations
+- Capture ALL acceptance criteria mentioned
+- Address ALL edge cases discussed
+- Respect priorities stated by the user
+
+"""
+
+
+# Single-call variant: the BRD and the user stories derived from it in one
+# response, so the chat transcript is sent to the model only once. Built from
+# the two single-document prompts so the instructions cannot drift apart.
+BRD_AND_STORIES_PROMPT = (
+    "Produce TWO documents in one response.\n\n"
+    "PART 1 - Business Requirements Document. Follow these instructions:\n\n"
+    + BRD_WITH_CONTEXT_PROMPT
+    + "\n\nPART 2 - User Stories. Then follow these instructions, using the BRD "
+    "you wrote in PART 1 as the Business Requirements Document:\n\n"
+    + TECH_WRITER_PROMPT.replace("{brd_content}", "(the BRD from PART 1)")
+    + """
+
+Output format (exactly these markers, each on its own line, nothing outside them):
+<<<BRD>>>
+(the complete BRD)
+<<<END_BRD>>>
+<<<STORIES>>>
+(all user stories)
+<<<END_STORIES>>>"""
+)
+
+BRD_AND_STORIES_CHAT_INSTRUCTIONS = BRD_CHAT_INSTRUCTIONS + STORIES_CHAT_INSTRUCTIONS
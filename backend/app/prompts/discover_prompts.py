@@ -57,3 +57,27 @@ Problem Statement Context:
 {problem_statement}
 
 Generate a detailed Stakeholder Analysis in markdown format with the table and detailed descriptions."""
+
+
+# Single-call variant: the Problem Statement and the Stakeholder Analysis
+# derived from it in one response, so the chat transcript is sent only once.
+# Built from the two single-document prompts so they cannot drift apart.
+PROBLEM_AND_STAKEHOLDERS_PROMPT = (
+    "Produce TWO documents in one response.\n\n"
+    "PART 1 - Problem Statement. Follow these instructions:\n\n"
+    + PROBLEM_STATEMENT_PROMPT
+    + "\n\nPART 2 - Stakeholder Analysis. Then follow these instructions, using "
+    "the Problem Statement you wrote in PART 1 as the Problem Statement Context:\n\n"
+    + STAKEHOLDER_ANALYSIS_PROMPT.replace(
+        "{problem_statement}", "(the Problem Statement from PART 1)"
+    )
+    + """
+
+Output format (exactly these markers, each on its own line, nothing outside them):
+<<<PROBLEM>>>
+(the complete Problem Statement)
+<<<END_PROBLEM>>>
+<<<STAKEHOLDERS>>>
+(the complete Stakeholder Analysis)
+<<<END_STAKEHOLDERS>>>"""
+)
@@ -3,7 +3,7 @@
 Pydantic schemas for request/response validation.
 """
 
-from app.schemas.base import BaseSchema, UUIDMixin, TimestampMixin
+from app.schemas.base import BaseSchema, UUIDMixin, UUIDValidationMixin, TimestampMixin
 from app.schemas.project import (
     ProjectCreate,
     ProjectResponse,
@@ -14,6 +14,8 @@ from app.schemas.artifact import (
     ArtifactListResponse,
     ArtifactCreate,
     RegenerateRequest,
+    RegenerateBatchItem,
+    RegenerateBatchRequest,
     GenerationStatus,
 )
 from app.schemas.stage_discover import (
@@ -76,6 +78,7 @@ __all__ = [
     # Base
     "BaseSchema",
     "UUIDMixin",
+    "UUIDValidationMixin",
     "TimestampMixin",
     # Project
     "ProjectCreate",
@@ -86,6 +89,8 @@ __all__ = [
     "ArtifactListResponse",
     "ArtifactCreate",
     "RegenerateRequest",
+    "RegenerateBatchItem",
+    "RegenerateBatchRequest",
     "GenerationStatus",
     # Discover
     "DiscoverGenerateRequest",
@@ -60,6 +60,18 @@ class RegenerateRequest(BaseModel):
     created_by: Optional[str] = None
 
 
+class RegenerateBatchItem(BaseModel):
+    """Single artifact/feedback pair in a batch regeneration."""
+    artifact_id: str
+    feedback: str = Field(..., description="User's feedback on why they want to regenerate")
+
+
+class RegenerateBatchRequest(BaseModel):
+    """Schema for regenerating several artifacts in one request."""
+    items: List[RegenerateBatchItem] = Field(..., min_length=1, max_length=20)
+    created_by: Optional[str] = None
+
+
 class GenerationStatus(BaseModel):
     """Schema for tracking generation status."""
     task_id: str
@@ -27,6 +27,28 @@ class UUIDMixin(BaseModel):
         return v
 
 
+class UUIDValidationMixin(BaseModel):
+    """Mixin for request schemas whose ID fields must be well-formed UUIDs.
+
+    Malformed IDs are rejected with a 422 at the route layer, so services
+    can parse them once for binding without guarding against bad input.
+    """
+    
+    @field_validator(
+        'project_id',
+        'problem_statement_artifact_id',
+        'stakeholder_analysis_artifact_id',
+        mode='after',
+        check_fields=False
+    )
+    @classmethod
+    def validate_uuid_format(cls, v: Optional[str]) -> Optional[str]:
+        """Ensure the value parses as a UUID."""
+        if v is not None:
+            UUID(v)
+        return v
+
+
 class TimestampMixin(BaseModel):
     """Mixin for schemas with timestamp fields."""
     created_at: Optional[datetime] = None
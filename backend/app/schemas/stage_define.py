@@ -7,8 +7,10 @@ from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, Field
 
+from app.schemas.base import UUIDValidationMixin
 
-class DefineGenerateRequest(BaseModel):
+
+class DefineGenerateRequest(UUIDValidationMixin):
     """Request schema for generating define stage artifacts."""
     project_id: str
     problem_statement_artifact_id: Optional[str] = Field(
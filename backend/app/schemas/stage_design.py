@@ -7,6 +7,8 @@ from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
+from app.schemas.base import UUIDValidationMixin
+
 
 class DesignConstraints(BaseModel):
     """Constraints and preferences for architecture generation."""
@@ -27,7 +29,7 @@ class UploadedFile(BaseModel):
     content: str
 
 
-class DesignGenerateRequest(BaseModel):
+class DesignGenerateRequest(UUIDValidationMixin):
     """Request schema for generating architecture options."""
     project_id: str
     constraints: Optional[DesignConstraints] = None
@@ -35,7 +37,7 @@ class DesignGenerateRequest(BaseModel):
     created_by: Optional[str] = None
 
 
-class SelectArchitectureRequest(BaseModel):
+class SelectArchitectureRequest(UUIDValidationMixin):
     """Request schema for selecting an architecture option."""
     project_id: str
     selected_option_id: str  # option_1, option_2, option_3
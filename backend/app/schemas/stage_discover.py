@@ -7,8 +7,10 @@ from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, Field
 
+from app.schemas.base import UUIDValidationMixin
 
-class DiscoverGenerateRequest(BaseModel):
+
+class DiscoverGenerateRequest(UUIDValidationMixin):
     """Request schema for generating discover stage artifacts."""
     project_id: str
     user_idea: Optional[str] = Field(
@@ -3,16 +3,22 @@
 Service for logging project activities.
 """
 
+import logging
 from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from sqlalchemy import select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.database import AsyncSessionLocal
 from app.models.activity import Activity
+from app.models.commit import Commit
 from app.services.base import BaseService
 
 
+logger = logging.getLogger(__name__)
+
+
 class ActivityService(BaseService[Activity]):
     """Service for managing activity logs."""
     
@@ -91,3 +97,65 @@ async def log_activity(
     """
     service = ActivityService(db)
     await service.log(project_id, user_id, activity_type, data)
+
+
+def stage_activity(
+    db: AsyncSession,
+    project_id: str,
+    user_id: str,
+    activity_type: str,
+    data: Dict[str, Any]
+) -> Activity:
+    """
+    Add an activity to the session without flushing or committing.
+    
+    Use when the caller commits its own changes afterwards, so the
+    activity is written in the same transaction as everything else.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        user_id: ID of the user
+        activity_type: Type of activity
+        data: Additional activity data
+        
+    Returns:
+        The pending activity record
+    """
+    activity = Activity(
+        project_id=project_id,
+        user_id=user_id,
+        activity_type=activity_type,
+        data=data
+    )
+    db.add(activity)
+    return activity
+
+
+async def write_audit_records(
+    activity: Dict[str, Any],
+    commit_data: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Write an activity (and optional commit) row in a dedicated session.
+    
+    Intended for FastAPI BackgroundTasks, after the request's own session
+    has been closed, so audit writes stay off the response path.
+    
+    Args:
+        activity: log_activity keyword arguments (project_id, user_id,
+            activity_type, data)
+        commit_data: Optional Commit column values
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            if commit_data:
+                session.add(Commit(**commit_data))
+            await log_activity(session, **activity)
+    except Exception:
+        # Nothing awaits a background task, so the traceback is the only
+        # trace of the lost rows
+        logger.exception(
+            "⚠️ Failed to write audit records for %s (%s, commit: %s)",
+            activity.get("project_id"), activity.get("activity_type"), bool(commit_data)
+        )
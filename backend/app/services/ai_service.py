@@ -3,15 +3,78 @@
 Service for interacting with Azure OpenAI API.
 """
 
-import os
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import time
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 
 from fastapi import HTTPException
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 
 from app.config import settings
 
 
+# Seconds a cached completion stays valid
+COMPLETION_CACHE_TTL = 86400.0
+
+# Most completions kept; the oldest entry is evicted first
+COMPLETION_CACHE_MAX_ENTRIES = 256
+
+# sha256(prompt + params) -> (expires_at, content) for non-streaming
+# generations that opted in with use_cache and finished normally
+_completion_cache: Dict[str, Tuple[float, str]] = {}
+
+# Shared by every request so concurrent generations stay under one limit
+# matched to the deployment's rate tier instead of tripping 429s
+_openai_semaphore = asyncio.Semaphore(settings.openai_max_concurrency)
+
+
+def _completion_key(
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int,
+    temperature: float
+) -> str:
+    """Hash the fully rendered prompt and generation parameters."""
+    raw = "\x1e".join((system_prompt, user_message, str(max_tokens), str(temperature)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def clear_completion_cache() -> None:
+    """Drop every cached completion."""
+    _completion_cache.clear()
+
+
+def evict_completion(
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int = 4000,
+    temperature: float = 0.7
+) -> None:
+    """
+    Drop one cached completion, e.g. after the caller failed to parse it.
+    
+    Args:
+        system_prompt: System prompt of the cached generation
+        user_message: User message of the cached generation
+        max_tokens: Maximum tokens of the cached generation
+        temperature: Temperature of the cached generation
+    """
+    _completion_cache.pop(
+        _completion_key(system_prompt, user_message, max_tokens, temperature), None
+    )
+
+
+def _usage_dict(usage: Any) -> Dict[str, Optional[int]]:
+    """Flatten an OpenAI usage object, including prompt-cache hits."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "cached_prompt_tokens": getattr(details, "cached_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None)
+    }
+
+
 class AIService:
     """
     Service for AI generation using Azure OpenAI.
@@ -21,8 +84,8 @@ class AIService:
     """
     
     def __init__(self):
-        """Initialize the Azure OpenAI client."""
-        self.client = AzureOpenAI(
+        """Initialize the async Azure OpenAI client."""
+        self.async_client = AsyncAzureOpenAI(
             api_version=settings.azure_openai_api_version,
             azure_endpoint=settings.azure_openai_endpoint,
             api_key=settings.azure_openai_api_key,
@@ -39,7 +102,8 @@ class AIService:
         system_prompt: str,
         user_message: str,
         max_tokens: int = 4000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        use_cache: bool = False
     ) -> str:
         """
         Generate text using Azure OpenAI.
@@ -49,6 +113,8 @@ class AIService:
             user_message: User's input message
             max_tokens: Maximum tokens in response
             temperature: Creativity parameter (0-1)
+            use_cache: Serve and store the reply in the completion cache
+                (see generate_with_usage)
             
         Returns:
             Generated text content
@@ -56,24 +122,92 @@ class AIService:
         Raises:
             HTTPException: If AI generation fails
         """
+        content, _ = await self.generate_with_usage(
+            system_prompt,
+            user_message,
+            max_tokens,
+            temperature,
+            use_cache=use_cache
+        )
+        return content
+    
+    async def generate_with_usage(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        use_cache: bool = False
+    ) -> tuple[str, Dict[str, Any]]:
+        """
+        Generate text and report the token usage of the call.
+        
+        Azure OpenAI caches long prompt prefixes automatically; the number of
+        prompt tokens served from that cache is reported as cached_prompt_tokens.
+        
+        With use_cache, identical requests (same prompts and parameters) are
+        answered from an in-process completion cache for COMPLETION_CACHE_TTL
+        seconds, so retries of an unchanged generation skip the API call; usage
+        is then all None. Only replies that finished normally (finish_reason
+        "stop") are stored; callers that cannot parse a cached reply drop it
+        with evict_completion.
+        
+        Args:
+            system_prompt: System prompt defining AI behavior
+            user_message: User's input message
+            max_tokens: Maximum tokens in response
+            temperature: Creativity parameter (0-1)
+            use_cache: Serve and store the reply in the completion cache
+            
+        Returns:
+            Tuple of (generated text content, usage dict with prompt_tokens,
+            cached_prompt_tokens, completion_tokens and finish_reason, which
+            is "length" when the reply was cut off at max_tokens)
+            
+        Raises:
+            HTTPException: If AI generation fails
+        """
+        key = _completion_key(system_prompt, user_message, max_tokens, temperature)
+        if use_cache:
+            cached = _completion_cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1], {**_usage_dict(None), "finish_reason": "stop"}
+        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ]
-            )
+            async with _openai_semaphore:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_message}
+                    ]
+                )
             
+            content = None
+            finish_reason = None
             if hasattr(response, 'choices') and len(response.choices) > 0:
+                finish_reason = getattr(response.choices[0], 'finish_reason', None)
                 if hasattr(response.choices[0], 'message'):
-                    return response.choices[0].message.content
+                    content = response.choices[0].message.content
                 elif hasattr(response.choices[0], 'text'):
-                    return response.choices[0].text
+                    content = response.choices[0].text
             
-            raise ValueError("Unexpected response structure from Azure OpenAI")
+            if content is None:
+                raise ValueError("Unexpected response structure from Azure OpenAI")
+            
+            # Truncated or filtered replies are never cached, so a retry
+            # gets a fresh generation
+            if use_cache and finish_reason == "stop":
+                _completion_cache.pop(key, None)
+                if len(_completion_cache) >= COMPLETION_CACHE_MAX_ENTRIES:
+                    _completion_cache.pop(next(iter(_completion_cache)))
+                _completion_cache[key] = (time.monotonic() + COMPLETION_CACHE_TTL, content)
+            
+            usage = _usage_dict(getattr(response, 'usage', None))
+            usage["finish_reason"] = finish_reason
+            return content, usage
             
         except Exception as e:
             print(f"❌ Azure OpenAI Error: {str(e)}")
@@ -82,6 +216,61 @@ class AIService:
                 detail=f"Azure OpenAI API error: {str(e)}"
             )
     
+    async def generate_stream(
+        self,
+        system_prompt: str,
+        user_message: str,
+        max_tokens: int = 4000,
+        temperature: float = 0.7,
+        usage: Optional[Dict[str, Optional[int]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text from Azure OpenAI as it is produced.
+        
+        Args:
+            system_prompt: System prompt defining AI behavior
+            user_message: User's input message
+            max_tokens: Maximum tokens in response
+            temperature: Creativity parameter (0-1)
+            usage: Optional dict filled with the call's token usage once the
+                stream is exhausted
+            
+        Yields:
+            Text chunks in generation order
+            
+        Raises:
+            HTTPException: If the streaming request cannot be started
+        """
+        # The slot is held until the stream is exhausted (or the generator
+        # is closed), since the deployment is generating the whole time
+        async with _openai_semaphore:
+            try:
+                stream = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                    stream_options={"include_usage": True} if usage is not None else None,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_message}
+                    ]
+                )
+            except Exception as e:
+                print(f"❌ Azure OpenAI Stream Error: {str(e)}")
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Azure OpenAI API error: {str(e)}"
+                )
+            
+            async for event in stream:
+                # Azure sends an initial chunk with no choices (content filter results)
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+                # With include_usage the final chunk carries usage and no choices
+                if usage is not None and getattr(event, "usage", None):
+                    usage.update(_usage_dict(event.usage))
+    
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -103,12 +292,13 @@ class AIService:
             HTTPException: If AI generation fails
         """
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                messages=messages
-            )
+            async with _openai_semaphore:
+                response = await self.async_client.chat.completions.create(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    messages=messages
+                )
             
             content = response.choices[0].message.content
             tokens = response.usage.total_tokens if response.usage else None
@@ -130,7 +320,8 @@ ai_service = AIService()
 async def generate_with_openai(
     system_prompt: str,
     user_message: str,
-    max_tokens: int = 4000
+    max_tokens: int = 4000,
+    use_cache: bool = False
 ) -> str:
     """
     Convenience function for AI generation.
@@ -140,8 +331,55 @@ async def generate_with_openai(
         system_prompt: System prompt for AI behavior
         user_message: User's input message
         max_tokens: Maximum response tokens
+        use_cache: Serve and store the reply in the completion cache
         
     Returns:
         Generated text content
     """
-    return await ai_service.generate(system_prompt, user_message, max_tokens)
+    return await ai_service.generate(
+        system_prompt, user_message, max_tokens, use_cache=use_cache
+    )
+
+
+async def generate_with_openai_usage(
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int = 4000,
+    use_cache: bool = False
+) -> tuple[str, Dict[str, Any]]:
+    """
+    Convenience function for AI generation that also reports token usage.
+    
+    Args:
+        system_prompt: System prompt for AI behavior
+        user_message: User's input message
+        max_tokens: Maximum response tokens
+        use_cache: Serve and store the reply in the completion cache
+        
+    Returns:
+        Tuple of (generated text content, usage dict)
+    """
+    return await ai_service.generate_with_usage(
+        system_prompt, user_message, max_tokens, use_cache=use_cache
+    )
+
+
+def generate_with_openai_stream(
+    system_prompt: str,
+    user_message: str,
+    max_tokens: int = 4000,
+    usage: Optional[Dict[str, Optional[int]]] = None
+) -> AsyncIterator[str]:
+    """
+    Convenience function for streaming AI generation.
+    
+    Args:
+        system_prompt: System prompt for AI behavior
+        user_message: User's input message
+        max_tokens: Maximum response tokens
+        usage: Optional dict filled with token usage when the stream ends
+        
+    Returns:
+        Async iterator of generated text chunks
+    """
+    return ai_service.generate_stream(system_prompt, user_message, max_tokens, usage=usage)
@@ -4,9 +4,17 @@ Service for artifact CRUD operations and regeneration.
 Enhanced with chat history context for all artifact types.
 """
 
-from typing import Any, Dict, List, Optional
+import logging
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import lru_cache
+from string import Formatter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from uuid import UUID
 
+from fastapi import BackgroundTasks, HTTPException
 from sqlalchemy import select, desc, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -14,20 +22,30 @@ from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
 from app.services.base import BaseService
-from app.services.ai_service import generate_with_openai
-from app.services.activity_service import log_activity
+from app.services.ai_service import (
+    generate_with_openai,
+    generate_with_openai_stream,
+    generate_with_openai_usage,
+)
+from app.services.activity_service import log_activity, write_audit_records
+from app.services.chat_service import refresh_stage_summary
 from app.prompts import (
     PROBLEM_STATEMENT_PROMPT, 
     STAKEHOLDER_ANALYSIS_PROMPT,
 )
-from app.utils.converters import artifact_to_dict
+from app.utils.converters import artifact_to_dict, artifacts_to_dicts
 from app.utils.chat_context import (
     get_chat_history_for_stage,
     format_all_chat_history_for_prompt,
     get_all_chat_history,
+    count_tokens,
+    fit_chat_history,
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 # ============================================================================
 # REGENERATION PROMPTS - Used when user provides feedback to improve artifacts
 # ============================================================================
@@ -207,6 +225,222 @@ You must regenerate the document incorporating their feedback.
 Generate the COMPLETE improved document now:"""
 
 
+REGENERATE_BATCH_PROMPT = """You are an AI Specialist regenerating {count} {artifact_type} documents based on user feedback.
+
+## YOUR TASK
+Each document below has its own original content, user feedback and conversation context.
+Regenerate EVERY document independently, incorporating ONLY its own feedback and context.
+
+{documents}
+
+## INSTRUCTIONS
+1. CAREFULLY address each document's specific feedback
+2. If new sections or content are requested, add them appropriately
+3. Preserve all accurate and relevant content from each original
+4. Maintain consistent formatting with each original document style
+
+## OUTPUT FORMAT
+For each document i (1 to {count}), output a start marker line, the COMPLETE improved document, then an end marker line:
+===OUT i===
+<complete improved document i>
+===END OUT i===
+
+Output the sections in order, with nothing before the first marker:"""
+
+
+REGENERATE_BATCH_DOCUMENT = """===DOC {index} START===
+## ORIGINAL DOCUMENT
+{original_content}
+
+## USER FEEDBACK / ENHANCEMENT REQUEST
+{feedback}
+
+## CONVERSATION CONTEXT
+{chat_context}
+===DOC {index} END==="""
+
+
+# ============================================================================
+# COMPILED TEMPLATES - Parsed once at import instead of str.format per call
+# ============================================================================
+
+REGENERATE_FIELDS = ("original_content", "feedback", "chat_context", "artifact_type")
+
+CompiledTemplate = List[Tuple[str, Optional[int]]]
+
+
+def compile_template(template: str, fields: Sequence[str] = REGENERATE_FIELDS) -> CompiledTemplate:
+    """
+    Pre-parse a str.format template into literal chunks and field slots.
+    
+    Args:
+        template: Template using {field} placeholders
+        fields: Ordered field names; slots refer to positions in this sequence
+        
+    Returns:
+        List of (literal, field_index) tuples; field_index is None for literals
+    """
+    chunks: CompiledTemplate = []
+    for literal, field_name, _spec, _conversion in Formatter().parse(template):
+        if literal:
+            chunks.append((literal, None))
+        if field_name is not None:
+            chunks.append(("", fields.index(field_name)))
+    return chunks
+
+
+def render_template(template: CompiledTemplate, values: Sequence[str]) -> str:
+    """Render a compiled template with values ordered like its fields."""
+    return "".join(literal if index is None else values[index] for literal, index in template)
+
+
+_PROBLEM_STATEMENT_TEMPLATE = compile_template(REGENERATE_PROBLEM_STATEMENT_PROMPT)
+_STAKEHOLDER_TEMPLATE = compile_template(REGENERATE_STAKEHOLDER_PROMPT)
+_BRD_TEMPLATE = compile_template(REGENERATE_BRD_PROMPT)
+_USER_STORIES_TEMPLATE = compile_template(REGENERATE_USER_STORIES_PROMPT)
+_ARCHITECTURE_TEMPLATE = compile_template(REGENERATE_ARCHITECTURE_PROMPT)
+_GENERIC_TEMPLATE = compile_template(REGENERATE_GENERIC_PROMPT)
+_BATCH_DOCUMENT_TEMPLATE = compile_template(
+    REGENERATE_BATCH_DOCUMENT, ("original_content", "feedback", "chat_context", "index")
+)
+
+# Regeneration dispatch: artifact type -> (template, document type, user message, max tokens)
+_REGEN_DISPATCH: Dict[ArtifactType, Tuple[CompiledTemplate, str, str, int]] = {
+    ArtifactType.PROBLEM_STATEMENT: (_PROBLEM_STATEMENT_TEMPLATE, "", "Regenerate Problem Statement", 3000),
+    ArtifactType.STAKEHOLDER_ANALYSIS: (_STAKEHOLDER_TEMPLATE, "", "Regenerate Stakeholder Analysis", 3000),
+    ArtifactType.BRD: (_BRD_TEMPLATE, "", "Regenerate BRD", 6000),
+    ArtifactType.USER_STORIES: (_USER_STORIES_TEMPLATE, "", "Regenerate User Stories", 6000),
+    ArtifactType.ARCHITECTURE: (_ARCHITECTURE_TEMPLATE, "", "Regenerate Architecture", 6000),
+    ArtifactType.SDD: (_ARCHITECTURE_TEMPLATE, "", "Regenerate Architecture", 6000),
+    ArtifactType.SOLUTION_OPTIONS: (_ARCHITECTURE_TEMPLATE, "", "Regenerate Architecture", 6000),
+    ArtifactType.API_SPEC: (_GENERIC_TEMPLATE, "API Specification", "Regenerate API Spec", 6000),
+    ArtifactType.TEST_PLAN: (_GENERIC_TEMPLATE, "Test Plan", "Regenerate Test Plan", 4000),
+    ArtifactType.TEST_CASES: (_GENERIC_TEMPLATE, "Test Cases", "Regenerate Test Cases", 6000),
+}
+
+# Discover-stage artifacts are stored with a subtype that overrides artifact_type
+_REGEN_SUBTYPES: Dict[Optional[str], ArtifactType] = {
+    "problem_statement": ArtifactType.PROBLEM_STATEMENT,
+    "stakeholder_analysis": ArtifactType.STAKEHOLDER_ANALYSIS,
+}
+
+# Output cap of a regeneration without a dedicated prompt
+_GENERIC_MAX_TOKENS = 4000
+
+# One finished per-document section of a batch response; a section cut off
+# before its end marker is not matched
+_BATCH_OUTPUT_RE = re.compile(
+    r"^===OUT (\d+)===[ \t]*\n(.*?)^===END OUT \1===[ \t]*$",
+    re.MULTILINE | re.DOTALL
+)
+
+# Output token cap for a batched regeneration call. Each document gets the
+# cap of a single regeneration, so a call holds at most this many tokens'
+# worth of documents.
+BATCH_MAX_TOKENS = 16000
+
+
+# Prompt token budget for regeneration (template + document + feedback + chat)
+REGENERATION_TOKEN_BUDGET = 12000
+
+# Average chat message size, used to size the history fetch to the budget
+_AVG_MESSAGE_TOKENS = 150
+
+
+@lru_cache(maxsize=1)
+def _template_tokens() -> int:
+    """Token count of the largest regeneration template."""
+    return max(
+        count_tokens(template)
+        for template in (
+            REGENERATE_PROBLEM_STATEMENT_PROMPT,
+            REGENERATE_STAKEHOLDER_PROMPT,
+            REGENERATE_BRD_PROMPT,
+            REGENERATE_USER_STORIES_PROMPT,
+            REGENERATE_ARCHITECTURE_PROMPT,
+            REGENERATE_GENERIC_PROMPT,
+        )
+    )
+
+
+# SDLC stage whose chat history gives context for each artifact type
+ARTIFACT_STAGE_MAPPING: Dict[ArtifactType, StageType] = {
+    # Discover
+    ArtifactType.PROBLEM_STATEMENT: StageType.DISCOVER,
+    ArtifactType.STAKEHOLDER_ANALYSIS: StageType.DISCOVER,
+    # Define
+    ArtifactType.BRD: StageType.DEFINE,
+    ArtifactType.PRD: StageType.DEFINE,
+    ArtifactType.USER_STORIES: StageType.DEFINE,
+    # Design
+    ArtifactType.ARCHITECTURE: StageType.DESIGN,
+    ArtifactType.SDD: StageType.DESIGN,
+    ArtifactType.API_SPEC: StageType.DESIGN,
+    ArtifactType.SOLUTION_OPTIONS: StageType.DESIGN,
+    # Develop
+    ArtifactType.CODE: StageType.DEVELOP,
+    # Test
+    ArtifactType.TEST_PLAN: StageType.TEST,
+    ArtifactType.TEST_CASES: StageType.TEST,
+    # Build
+    ArtifactType.BUILD_CONFIG: StageType.BUILD,
+    # Deploy
+    ArtifactType.DEPLOYMENT: StageType.DEPLOY,
+    ArtifactType.RELEASE_NOTES: StageType.DEPLOY,
+}
+
+
+# meta_data keys that identify what an artifact is and must survive regeneration.
+# Everything else (generation context, option lists, approval) belongs to the
+# version that produced it and is not copied forward. Content-derived keys
+# (e.g. the Test stage "summary" and "plan_summary") would be stale
+# for the new content; their readers fall back to parsing it. "generated_at"
+# is set afresh for every version.
+META_CARRY_FORWARD = ("artifact_subtype", "type", "selected_option_id", "selected_option_name")
+
+
+def strip_version_suffix(name: str) -> str:
+    """Drop a trailing " v<N>" version suffix from an artifact name."""
+    head, sep, tail = name.rpartition(" v")
+    return head if sep and tail.isdigit() else name
+
+
+# Feedback shorter than this (after trimming) is too low-signal to regenerate from
+MIN_FEEDBACK_LENGTH = 3
+
+
+def validate_feedback(feedback: Optional[str]) -> None:
+    """
+    Reject empty or trivially short regeneration feedback before any AI call.
+    
+    Raises:
+        HTTPException: If the feedback is blank or shorter than MIN_FEEDBACK_LENGTH
+    """
+    if not feedback or len(feedback.strip()) < MIN_FEEDBACK_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Feedback required (at least {MIN_FEEDBACK_LENGTH} characters)"
+        )
+
+
+# Request-scoped cache of serialized artifacts, keyed by artifact id.
+# A single request often converts the same artifact several times; the scope
+# is opened per request by the HTTP middleware in app.main.
+_artifact_dict_cache: ContextVar[Optional[Dict[UUID, Dict[str, Any]]]] = ContextVar(
+    "artifact_dict_cache", default=None
+)
+
+
+@contextmanager
+def artifact_dict_cache_scope() -> Iterator[None]:
+    """Enable artifact dict memoization for the duration of the block."""
+    token = _artifact_dict_cache.set({})
+    try:
+        yield
+    finally:
+        _artifact_dict_cache.reset(token)
+
+
 class ArtifactService(BaseService[Artifact]):
     """Service for managing artifacts with enhanced regeneration."""
     
@@ -306,37 +540,33 @@ class ArtifactService(BaseService[Artifact]):
     
     def _get_stage_for_artifact_type(self, artifact_type: ArtifactType) -> StageType:
         """Map artifact type to its SDLC stage for fetching relevant chat history."""
-        stage_mapping = {
-            # Discover
-            ArtifactType.PROBLEM_STATEMENT: StageType.DISCOVER,
-            ArtifactType.STAKEHOLDER_ANALYSIS: StageType.DISCOVER,
-            # Define
-            ArtifactType.BRD: StageType.DEFINE,
-            ArtifactType.PRD: StageType.DEFINE,
-            ArtifactType.USER_STORIES: StageType.DEFINE,
-            # Design
-            ArtifactType.ARCHITECTURE: StageType.DESIGN,
-            ArtifactType.SDD: StageType.DESIGN,
-            ArtifactType.API_SPEC: StageType.DESIGN,
-            ArtifactType.SOLUTION_OPTIONS: StageType.DESIGN,
-            # Develop
-            ArtifactType.CODE: StageType.DEVELOP,
-            # Test
-            ArtifactType.TEST_PLAN: StageType.TEST,
-            ArtifactType.TEST_CASES: StageType.TEST,
-            # Build
-            ArtifactType.BUILD_CONFIG: StageType.BUILD,
-            # Deploy
-            ArtifactType.DEPLOYMENT: StageType.DEPLOY,
-            ArtifactType.RELEASE_NOTES: StageType.DEPLOY,
-        }
-        return stage_mapping.get(artifact_type, StageType.DISCOVER)
+        return ARTIFACT_STAGE_MAPPING.get(artifact_type, StageType.DISCOVER)
+    
+    def _fit_context(
+        self,
+        history: Dict[StageType, List[Dict[str, str]]],
+        reserved_tokens: int
+    ) -> Dict[StageType, List[Dict[str, str]]]:
+        """
+        Prune chat history to fit the regeneration token budget.
+        
+        See fit_chat_history for the pruning rules.
+        
+        Args:
+            history: Chat history by stage (oldest message first)
+            reserved_tokens: Tokens already used by template, document and feedback
+            
+        Returns:
+            Pruned chat history with the same stage keys
+        """
+        return fit_chat_history(history, REGENERATION_TOKEN_BUDGET - reserved_tokens)
     
     async def regenerate_artifact(
         self,
         artifact: Artifact,
         feedback: str,
-        created_by: Optional[str] = None
+        created_by: Optional[str] = None,
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> Artifact:
         """
         Regenerate an artifact based on user feedback.
@@ -346,12 +576,217 @@ class ArtifactService(BaseService[Artifact]):
         2. Uses the appropriate regeneration prompt based on artifact type
         3. Creates a new version that incorporates the feedback
         4. Maintains version history for traceability
+        
+        When background_tasks is given, the commit/activity audit rows are
+        written after the response instead of before it.
         """
-        print(f"🔄 Regenerating artifact: {artifact.name} (type: {artifact.artifact_type})")
-        print(f"   └── User feedback: {feedback[:100]}...")
+        validate_feedback(feedback)
+        
+        logger.info("🔄 Regenerating artifact: %s (type: %s)", artifact.name, artifact.artifact_type)
+        logger.info("   └── User feedback: %s...", feedback[:100])
+
+        chat_context, total_msgs = await self._build_chat_context(artifact, feedback)
 
+        # Select the appropriate regeneration prompt and generate
+        new_content = await self._generate_regenerated_content(
+            artifact=artifact,
+            feedback=feedback,
+            chat_context=chat_context
+        )
+
+        return await self._save_regenerated_artifact(
+            artifact, feedback, new_content, total_msgs, created_by, background_tasks
+        )
+    
+    async def regenerate_artifact_stream(
+        self,
+        artifact: Artifact,
+        feedback: str,
+        created_by: Optional[str] = None,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> AsyncIterator[Union[str, Artifact]]:
+        """
+        Regenerate an artifact, streaming the new content as it is generated.
+        
+        Args:
+            artifact: Artifact to regenerate
+            feedback: User feedback for the regeneration
+            created_by: Creator identifier
+            background_tasks: If given, audit rows are written after the response
+            
+        Yields:
+            Content chunks as they arrive, then the saved Artifact once the
+            full document has been persisted
+        """
+        validate_feedback(feedback)
+        
+        logger.info("🔄 Streaming regeneration: %s (type: %s)", artifact.name, artifact.artifact_type)
+        
+        chat_context, total_msgs = await self._build_chat_context(artifact, feedback)
+        prompt, user_message, max_tokens = self._build_regeneration_prompt(
+            artifact, feedback, chat_context
+        )
+        
+        chunks: List[str] = []
+        async for chunk in generate_with_openai_stream(prompt, user_message, max_tokens=max_tokens):
+            chunks.append(chunk)
+            yield chunk
+        
+        yield await self._save_regenerated_artifact(
+            artifact, feedback, "".join(chunks), total_msgs, created_by, background_tasks
+        )
+    
+    async def regenerate_artifacts_batch(
+        self,
+        items: List[Tuple[Artifact, str]],
+        created_by: Optional[str] = None,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> List[Artifact]:
+        """
+        Regenerate several artifacts, sharing one AI call per artifact type.
+        
+        Items of the same type are concatenated into a single numbered batch
+        prompt and the response is split back into per-document outputs.
+        Groups whose response cannot be parsed fall back to one call per item.
+        
+        Args:
+            items: List of (artifact, feedback) pairs
+            created_by: Creator identifier
+            background_tasks: If given, audit rows are written after the response
+            
+        Returns:
+            The new artifact versions, in the same order as items (an artifact
+            listed more than once is regenerated once, with its feedback merged)
+        """
+        for _, feedback in items:
+            validate_feedback(feedback)
+        
+        # The same artifact listed twice would otherwise get two "vN+1" versions
+        unique: Dict[UUID, Tuple[Artifact, str]] = {}
+        for artifact, feedback in items:
+            if artifact.id in unique:
+                first, merged = unique[artifact.id]
+                unique[artifact.id] = (first, f"{merged}\n\n{feedback}")
+            else:
+                unique[artifact.id] = (artifact, feedback)
+        position = {artifact_id: index for index, artifact_id in enumerate(unique)}
+        batch = list(unique.values())
+        
+        logger.info("🔄 Batch regenerating %d artifacts", len(batch))
+        
+        contexts = [await self._build_chat_context(artifact, feedback) for artifact, feedback in batch]
+        
+        groups: Dict[Optional[ArtifactType], List[int]] = {}
+        for index, (artifact, _) in enumerate(batch):
+            groups.setdefault(artifact.artifact_type, []).append(index)
+        
+        contents: Dict[int, str] = {}
+        for artifact_type, indexes in groups.items():
+            # Split the group so every document keeps its single-call cap
+            per_document = self._regeneration_max_tokens(batch[indexes[0]][0])
+            size = max(1, BATCH_MAX_TOKENS // per_document)
+            for start in range(0, len(indexes), size):
+                chunk = indexes[start:start + size]
+                outputs: List[Optional[str]] = [None] * len(chunk)
+                if len(chunk) > 1:
+                    outputs = await self._generate_batch_content(
+                        artifact_type,
+                        [(batch[i][0], batch[i][1], contexts[i][0]) for i in chunk],
+                        max_tokens=per_document * len(chunk)
+                    )
+                # Documents missing from (or cut off in) the batch reply get
+                # their own call
+                for i, output in zip(chunk, outputs):
+                    contents[i] = output or await self._generate_regenerated_content(
+                        artifact=batch[i][0],
+                        feedback=batch[i][1],
+                        chat_context=contexts[i][0]
+                    )
+        
+        saved = [
+            await self._save_regenerated_artifact(
+                artifact, feedback, contents[index], contexts[index][1], created_by, background_tasks
+            )
+            for index, (artifact, feedback) in enumerate(batch)
+        ]
+        return [saved[position[artifact.id]] for artifact, _ in items]
+    
+    async def _generate_batch_content(
+        self,
+        artifact_type: Optional[ArtifactType],
+        items: List[Tuple[Artifact, str, str]],
+        max_tokens: int = BATCH_MAX_TOKENS
+    ) -> List[Optional[str]]:
+        """
+        Regenerate several same-type documents with a single AI call.
+        
+        Only sections closed by their end marker are used, so a reply cut off
+        at max_tokens never yields a truncated document.
+        
+        Args:
+            artifact_type: Shared artifact type of the batch
+            items: List of (artifact, feedback, chat_context) tuples
+            max_tokens: Output cap of the call
+            
+        Returns:
+            Regenerated contents in item order; None for each document whose
+            section is missing or unfinished
+        """
+        documents = "\n\n".join(
+            render_template(_BATCH_DOCUMENT_TEMPLATE, (artifact.content, feedback, chat_context, str(index)))
+            for index, (artifact, feedback, chat_context) in enumerate(items, 1)
+        )
+        type_label = artifact_type.value.replace("_", " ").title() if artifact_type else "Document"
+        prompt = REGENERATE_BATCH_PROMPT.format(
+            count=len(items),
+            artifact_type=type_label,
+            documents=documents
+        )
+        
+        response, usage = await generate_with_openai_usage(
+            prompt,
+            f"Regenerate {len(items)} {type_label} documents",
+            max_tokens=max_tokens
+        )
+        
+        sections = {
+            int(match.group(1)): match.group(2).strip()
+            for match in _BATCH_OUTPUT_RE.finditer(response)
+        }
+        outputs = [sections.get(index) or None for index in range(1, len(items) + 1)]
+        missing = outputs.count(None)
+        if missing:
+            logger.warning(
+                "⚠️ %d of %d %s documents missing from batch response (finish_reason=%s); using single calls",
+                missing, len(items), type_label, usage.get("finish_reason")
+            )
+        return outputs
+    
+    async def _build_chat_context(self, artifact: Artifact, feedback: str) -> Tuple[str, int]:
+        """
+        Fetch and format the chat history used to regenerate an artifact.
+        
+        Args:
+            artifact: Artifact being regenerated
+            feedback: User feedback for the regeneration
+            
+        Returns:
+            Tuple of (formatted chat context, number of messages included)
+        """
         # Determine which stage's chat history to fetch
         stage_for_chat = self._get_stage_for_artifact_type(artifact.artifact_type)
+        
+        # Older turns are folded into a rolling summary; only newer ones are sent raw
+        summary, covers_until = await refresh_stage_summary(
+            self.db, str(artifact.project_id), stage_for_chat
+        )
+        
+        # Reserve tokens for the fixed parts of the prompt; chat fills the rest
+        reserved_tokens = _template_tokens() + count_tokens(artifact.content) + count_tokens(feedback)
+        if summary:
+            reserved_tokens += count_tokens(summary)
+        available_tokens = max(REGENERATION_TOKEN_BUDGET - reserved_tokens, 0)
+        limit_per_stage = min(100, max(20, available_tokens // _AVG_MESSAGE_TOKENS))
 
         # OPTION B: fetch dict[StageType, List[...]] so format_all_chat_history_for_prompt works
         # If you want ONLY the relevant stage, keep stages=[stage_for_chat].
@@ -360,33 +795,59 @@ class ArtifactService(BaseService[Artifact]):
             db=self.db,
             project_id=str(artifact.project_id),
             stages=[stage_for_chat],      # <- change to None to include multiple stages
-            limit_per_stage=100
+            limit_per_stage=limit_per_stage,
+            after=covers_until
         )
+        all_history = self._fit_context(all_history, reserved_tokens)
 
         # Format chat context with emphasis
-        chat_context = ""
         total_msgs = sum(len(msgs) for msgs in all_history.values()) if all_history else 0
 
         if total_msgs > 0:
             chat_context = format_all_chat_history_for_prompt(all_history)
-            print(f"   └── Including {total_msgs} chat messages for context")
-        else:
+            logger.info("   └── Including %d chat messages for context", total_msgs)
+        elif not summary:
             chat_context = "(No conversation history available)"
-            print(f"   └── No chat history found for {stage_for_chat.value} stage")
-
-        # Select the appropriate regeneration prompt and generate
-        new_content = await self._generate_regenerated_content(
-            artifact=artifact,
-            feedback=feedback,
-            chat_context=chat_context
-        )
-
+            logger.info("   └── No chat history found for %s stage", stage_for_chat.value)
+        else:
+            chat_context = ""
+        
+        if summary:
+            chat_context = f"### Summary of earlier conversation\n{summary}\n\n{chat_context}".rstrip()
+        
+        return chat_context, total_msgs
+    
+    async def _save_regenerated_artifact(
+        self,
+        artifact: Artifact,
+        feedback: str,
+        new_content: str,
+        total_msgs: int,
+        created_by: Optional[str] = None,
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> Artifact:
+        """
+        Persist regenerated content as a new artifact version.
+        
+        Args:
+            artifact: Artifact that was regenerated
+            feedback: User feedback used for the regeneration
+            new_content: Regenerated document content
+            total_msgs: Number of chat messages used as context
+            created_by: Creator identifier
+            background_tasks: If given, the Commit and activity rows are queued
+                here and written in their own session; otherwise inline
+            
+        Returns:
+            The new artifact version
+        """
         # Create new version
         new_version = artifact.version + 1
 
         # Determine new name (keep base name, update version)
-        base_name = artifact.name.split(" v")[0] if " v" in artifact.name else artifact.name
+        base_name = strip_version_suffix(artifact.name)
         new_name = f"{base_name} v{new_version}"
+        old_meta = artifact.meta_data or {}
 
         new_artifact = Artifact(
             project_id=artifact.project_id,
@@ -397,38 +858,35 @@ class ArtifactService(BaseService[Artifact]):
             version=new_version,
             created_by=created_by or artifact.created_by,
             meta_data={
-                **(artifact.meta_data or {}),
+                **{key: old_meta[key] for key in META_CARRY_FORWARD if key in old_meta},
                 "regenerated_from": str(artifact.id),
                 "regenerated_from_version": artifact.version,
                 "user_feedback": feedback,
                 "chat_messages_used": total_msgs,
-                "regeneration_count": (artifact.meta_data or {}).get("regeneration_count", 0) + 1
+                "regeneration_count": old_meta.get("regeneration_count", 0) + 1,
+                "generated_at": datetime.utcnow().isoformat()
             }
         )
 
         self.db.add(new_artifact)
 
-        # Create commit for traceability
-        commit = Commit(
-            project_id=artifact.project_id,
-            stage=artifact.stage,
-            author_id=created_by or "user",
-            message=f"Regenerated {base_name}: {feedback[:50]}{'...' if len(feedback) > 50 else ''}",
-            changes={
+        # Commit and activity rows for traceability
+        commit_data = {
+            "project_id": artifact.project_id,
+            "stage": artifact.stage,
+            "author_id": created_by or "user",
+            "message": f"Regenerated {base_name}: {feedback[:50]}{'...' if len(feedback) > 50 else ''}",
+            "changes": {
                 "added": [],
                 "modified": [f"{base_name} (v{artifact.version} → v{new_version})"],
                 "deleted": []
             }
-        )
-        self.db.add(commit)
-
-        # Log activity
-        await log_activity(
-            self.db,
-            artifact.project_id,
-            created_by or "system",
-            "artifact_regenerated",
-            {
+        }
+        activity = {
+            "project_id": artifact.project_id,
+            "user_id": created_by or "system",
+            "activity_type": "artifact_regenerated",
+            "data": {
                 "artifact_type": artifact.artifact_type.value if artifact.artifact_type else None,
                 "artifact_name": base_name,
                 "old_version": artifact.version,
@@ -436,12 +894,18 @@ class ArtifactService(BaseService[Artifact]):
                 "feedback_preview": feedback[:100],
                 "chat_messages_used": total_msgs
             }
-        )
+        }
 
-        await self.db.commit()
-        await self.db.refresh(new_artifact)
+        if background_tasks is not None:
+            # Only the artifact is on the response path; audit rows follow
+            await self.db.commit()
+            background_tasks.add_task(write_audit_records, activity, commit_data)
+        else:
+            self.db.add(Commit(**commit_data))
+            await log_activity(self.db, **activity)
+            await self.db.commit()
 
-        print(f"✅ Regeneration complete: {new_name}")
+        logger.info("✅ Regeneration complete: %s", new_name)
 
         return new_artifact
     
@@ -452,86 +916,67 @@ class ArtifactService(BaseService[Artifact]):
         chat_context: str
     ) -> str:
         """Generate the regenerated content based on artifact type."""
-        artifact_subtype = artifact.meta_data.get("artifact_subtype") if artifact.meta_data else None
-        
-        # Map to the correct prompt based on artifact type
-        if artifact_subtype == "problem_statement" or artifact.artifact_type == ArtifactType.PROBLEM_STATEMENT:
-            prompt = REGENERATE_PROBLEM_STATEMENT_PROMPT.format(
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate Problem Statement", max_tokens=3000)
-            
-        elif artifact_subtype == "stakeholder_analysis" or artifact.artifact_type == ArtifactType.STAKEHOLDER_ANALYSIS:
-            prompt = REGENERATE_STAKEHOLDER_PROMPT.format(
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate Stakeholder Analysis", max_tokens=3000)
-            
-        elif artifact.artifact_type == ArtifactType.BRD:
-            prompt = REGENERATE_BRD_PROMPT.format(
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate BRD", max_tokens=6000)
-            
-        elif artifact.artifact_type == ArtifactType.USER_STORIES:
-            prompt = REGENERATE_USER_STORIES_PROMPT.format(
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate User Stories", max_tokens=6000)
-            
-        elif artifact.artifact_type in [ArtifactType.ARCHITECTURE, ArtifactType.SDD, ArtifactType.SOLUTION_OPTIONS]:
-            prompt = REGENERATE_ARCHITECTURE_PROMPT.format(
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate Architecture", max_tokens=6000)
-            
-        elif artifact.artifact_type == ArtifactType.API_SPEC:
-            prompt = REGENERATE_GENERIC_PROMPT.format(
-                artifact_type="API Specification",
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate API Spec", max_tokens=6000)
-            
-        elif artifact.artifact_type == ArtifactType.TEST_PLAN:
-            prompt = REGENERATE_GENERIC_PROMPT.format(
-                artifact_type="Test Plan",
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate Test Plan", max_tokens=4000)
-            
-        elif artifact.artifact_type == ArtifactType.TEST_CASES:
-            prompt = REGENERATE_GENERIC_PROMPT.format(
-                artifact_type="Test Cases",
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
-            )
-            return await generate_with_openai(prompt, "Regenerate Test Cases", max_tokens=6000)
-            
-        else:
-            # Generic fallback for any artifact type
-            prompt = REGENERATE_GENERIC_PROMPT.format(
-                artifact_type=artifact.artifact_type.value if artifact.artifact_type else "Document",
-                original_content=artifact.content,
-                feedback=feedback,
-                chat_context=chat_context
+        prompt, user_message, max_tokens = self._build_regeneration_prompt(
+            artifact, feedback, chat_context
+        )
+        return await generate_with_openai(prompt, user_message, max_tokens=max_tokens)
+    
+    def _regeneration_max_tokens(self, artifact: Artifact) -> int:
+        """Output cap of a single regeneration of an artifact."""
+        artifact_type = _REGEN_SUBTYPES.get(artifact.artifact_subtype, artifact.artifact_type)
+        dispatch = _REGEN_DISPATCH.get(artifact_type)
+        return dispatch[3] if dispatch else _GENERIC_MAX_TOKENS
+    
+    def _build_regeneration_prompt(
+        self,
+        artifact: Artifact,
+        feedback: str,
+        chat_context: str
+    ) -> Tuple[str, str, int]:
+        """
+        Select the regeneration prompt for an artifact type.
+        
+        Returns:
+            Tuple of (system prompt, user message, max tokens)
+        """
+        artifact_type = _REGEN_SUBTYPES.get(artifact.artifact_subtype, artifact.artifact_type)
+        
+        # Generic fallback for any artifact type without a dedicated prompt
+        template, document_type, user_message, max_tokens = _REGEN_DISPATCH.get(
+            artifact_type,
+            (
+                _GENERIC_TEMPLATE,
+                artifact.artifact_type.value if artifact.artifact_type else "Document",
+                "Regenerate Document",
+                _GENERIC_MAX_TOKENS,
             )
-            return await generate_with_openai(prompt, "Regenerate Document", max_tokens=4000)
+        )
+        prompt = render_template(
+            template, (artifact.content, feedback, chat_context, document_type)
+        )
+        return prompt, user_message, max_tokens
     
     def to_dict(self, artifact: Artifact) -> Dict[str, Any]:
-        """Convert artifact to dictionary representation."""
-        return artifact_to_dict(artifact)
\ No newline at end of file
+        """Convert artifact to dictionary representation (memoized per request)."""
+        cache = _artifact_dict_cache.get()
+        if cache is None:
+            return artifact_to_dict(artifact)
+        
+        cached = cache.get(artifact.id)
+        if cached is None:
+            cached = cache[artifact.id] = artifact_to_dict(artifact)
+        return cached
+    
+    def to_dicts(self, artifacts: List[Artifact]) -> List[Dict[str, Any]]:
+        """Convert a list of artifacts in one pass (memoized per request)."""
+        cache = _artifact_dict_cache.get()
+        missing = artifacts if cache is None else [
+            artifact for artifact in artifacts if artifact.id not in cache
+        ]
+        converted = artifacts_to_dicts(missing)
+        
+        if cache is None:
+            return converted
+        for artifact, artifact_dict in zip(missing, converted):
+            cache[artifact.id] = artifact_dict
+        return [cache[artifact.id] for artifact in artifacts]
\ No newline at end of file
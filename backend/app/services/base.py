@@ -6,7 +6,6 @@ Base service class with common database operations.
 from typing import Any, Generic, Optional, Type, TypeVar
 from uuid import UUID
 
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import Base
@@ -37,10 +36,7 @@ class BaseService(Generic[ModelType]):
         Returns:
             The record if found, None otherwise
         """
-        result = await self.db.execute(
-            select(self.model).where(self.model.id == id)
-        )
-        return result.scalar_one_or_none()
+        return await self.db.get(self.model, id)
     
     async def create(self, **kwargs: Any) -> ModelType:
         """
@@ -55,7 +51,6 @@ class BaseService(Generic[ModelType]):
         instance = self.model(**kwargs)
         self.db.add(instance)
         await self.db.flush()
-        await self.db.refresh(instance)
         return instance
     
     async def update(self, instance: ModelType, **kwargs: Any) -> ModelType:
@@ -73,7 +68,6 @@ class BaseService(Generic[ModelType]):
             if hasattr(instance, key):
                 setattr(instance, key, value)
         await self.db.flush()
-        await self.db.refresh(instance)
         return instance
     
     async def delete(self, instance: ModelType) -> None:
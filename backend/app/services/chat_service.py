@@ -3,19 +3,373 @@
 Service for AI specialist chat functionality.
 """
 
-from typing import Any, Dict, List
-from uuid import UUID
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
 
 from fastapi import HTTPException
-from sqlalchemy import select, and_
+from sqlalchemy import select, insert, delete, desc, and_, event, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.project import Project
 from app.models.artifact import Artifact
 from app.models.chat_message import ChatMessage
 from app.models.enums import StageType
-from app.services.ai_service import AIService
-from app.prompts import get_chat_system_prompt
+from app.services.ai_service import AIService, generate_with_openai
+from app.prompts import CHAT_SUMMARY_PROMPT, get_chat_system_prompt
+from app.utils.chat_context import (
+    SUMMARY_ROLE,
+    created_after_condition,
+    fit_chat_history,
+    format_all_chat_history_for_prompt,
+    format_chat_history_for_prompt,
+    get_all_chat_history,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached project context string stays valid
+CONTEXT_CACHE_TTL = 30.0
+
+# (project_id, stage) -> (expires_at, context string) for chat system prompts
+_context_cache: Dict[Tuple[str, StageType], Tuple[float, str]] = {}
+
+
+def invalidate_chat_context(project_id: Any) -> None:
+    """Drop cached chat context for every stage of a project."""
+    project_id = str(project_id)
+    for key in [key for key in _context_cache if key[0] == project_id]:
+        _context_cache.pop(key, None)
+
+
+@event.listens_for(Artifact, "after_insert")
+@event.listens_for(Artifact, "after_update")
+@event.listens_for(Artifact, "after_delete")
+def _invalidate_on_artifact_write(mapper, connection, target: Artifact) -> None:
+    invalidate_chat_context(target.project_id)
+
+
+@event.listens_for(Project, "after_update")
+@event.listens_for(Project, "after_delete")
+def _invalidate_on_project_write(mapper, connection, target: Project) -> None:
+    invalidate_chat_context(target.id)
+
+
+# Most recent chat turns always kept verbatim after the rolling summary
+SUMMARY_KEEP_RECENT = 20
+
+# Older unsummarized turns needed before the summary is refreshed
+SUMMARY_MIN_NEW = 20
+
+# Chat transcripts longer than this (in characters) are formatted off the event loop
+CHAT_FORMAT_OFFLOAD_CHARS = 10_000
+
+# Formatted stage chat contexts kept for reuse (oldest evicted first)
+STAGE_CONTEXT_CACHE_MAX_ENTRIES = 128
+
+# (project_id, stages, budget, limit, per-stage turn fingerprint) ->
+# (formatted turns, raw turns by stage); chat messages are only ever
+# inserted or deleted, so an unchanged count and newest timestamp per stage
+# means the same turns
+_stage_context_cache: Dict[Tuple[Any, ...], Tuple[str, Dict[StageType, List[Dict[str, str]]]]] = {}
+
+
+def _summary_covers_until(summary: Optional[ChatMessage]) -> Optional[datetime]:
+    """Timestamp of the last turn folded into a summary row, if any."""
+    if summary and (summary.meta_data or {}).get("covers_until"):
+        return datetime.fromisoformat(summary.meta_data["covers_until"])
+    return None
+
+
+async def refresh_stage_summaries(
+    db: AsyncSession,
+    project_id: str,
+    stages: List[StageType]
+) -> Dict[StageType, Tuple[Optional[str], Optional[datetime]]]:
+    """
+    Fold older chat turns of several stages into their rolling summaries.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        stages: The SDLC stages
+        
+    Returns:
+        Dictionary of stage -> (summary text, timestamp of the last
+        summarized turn), both None if the stage has no summary yet
+    """
+    refreshed, _ = await _refresh_stage_summaries(db, project_id, stages)
+    return refreshed
+
+
+async def _refresh_stage_summaries(
+    db: AsyncSession,
+    project_id: str,
+    stages: List[StageType]
+) -> Tuple[
+    Dict[StageType, Tuple[Optional[str], Optional[datetime]]],
+    Dict[StageType, Tuple[int, datetime]]
+]:
+    """
+    Fold older chat turns of several stages into their rolling summaries.
+    
+    Each stage keeps at most one summary row (role "summary"). Once at least
+    SUMMARY_MIN_NEW turns beyond the newest SUMMARY_KEEP_RECENT are not yet
+    covered, they are merged into the summary with one AI call.
+    
+    The summary rows of all stages and their unsummarized turn counts are
+    read in two queries; turn contents are fetched only for stages that
+    are due for a refresh.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        stages: The SDLC stages
+        
+    Returns:
+        Tuple of (stage -> (summary text, timestamp of the last summarized
+        turn), both None if the stage has no summary yet; stage -> (count,
+        newest created_at) of the turns not covered by the summary, for
+        stages that have any)
+    """
+    result = await db.execute(
+        select(ChatMessage)
+        .where(
+            and_(
+                ChatMessage.project_id == project_id,
+                ChatMessage.stage.in_(stages),
+                ChatMessage.role == SUMMARY_ROLE
+            )
+        )
+    )
+    summaries = {summary.stage: summary for summary in result.scalars().all()}
+    covers_until = {stage: _summary_covers_until(summaries.get(stage)) for stage in stages}
+    
+    conditions = [
+        ChatMessage.project_id == project_id,
+        ChatMessage.stage.in_(stages),
+        ChatMessage.role != SUMMARY_ROLE,
+        created_after_condition(stages, covers_until)
+    ]
+    result = await db.execute(
+        select(ChatMessage.stage, func.count(), func.max(ChatMessage.created_at))
+        .where(and_(*conditions))
+        .group_by(ChatMessage.stage)
+    )
+    unsummarized = {stage: (count, newest) for stage, count, newest in result.all()}
+    
+    refreshed = {
+        stage: (summaries[stage].content if stage in summaries else None, covers_until[stage])
+        for stage in stages
+    }
+    due = [
+        stage for stage in stages
+        if unsummarized.get(stage, (0,))[0] - SUMMARY_KEEP_RECENT >= SUMMARY_MIN_NEW
+    ]
+    if not due:
+        return refreshed, unsummarized
+    
+    # Turns of every due stage in one query, oldest first
+    result = await db.execute(
+        select(ChatMessage.stage, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+        .where(
+            and_(
+                ChatMessage.project_id == project_id,
+                ChatMessage.stage.in_(due),
+                ChatMessage.role != SUMMARY_ROLE,
+                created_after_condition(due, covers_until)
+            )
+        )
+        .order_by(ChatMessage.created_at)
+    )
+    pending: Dict[StageType, List[Any]] = {stage: [] for stage in due}
+    for row in result.all():
+        pending[row.stage].append(row)
+    to_fold = {stage: pending[stage][:-SUMMARY_KEEP_RECENT] for stage in due}
+    for stage in due:
+        kept = pending[stage][-SUMMARY_KEEP_RECENT:]
+        unsummarized[stage] = (len(kept), kept[-1].created_at)
+    
+    # Stage summaries are independent, so their AI calls run concurrently
+    for stage in due:
+        logger.info("📝 Summarizing %d chat turns for %s stage", len(to_fold[stage]), stage.value)
+    contents = await asyncio.gather(*(
+        generate_with_openai(
+            CHAT_SUMMARY_PROMPT,
+            _summary_request(summaries.get(stage), to_fold[stage]),
+            max_tokens=1500
+        )
+        for stage in due
+    ))
+    
+    for stage, content in zip(due, contents):
+        refreshed[stage] = _store_summary(
+            db, project_id, stage, summaries.get(stage), to_fold[stage], content
+        )
+    await db.commit()
+    
+    return refreshed, unsummarized
+
+
+async def refresh_stage_summary(
+    db: AsyncSession,
+    project_id: str,
+    stage: StageType
+) -> Tuple[Optional[str], Optional[datetime]]:
+    """
+    Fold older chat turns of a stage into its rolling summary.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        stage: The SDLC stage
+        
+    Returns:
+        Tuple of (summary text, timestamp of the last summarized turn),
+        both None if the stage has no summary yet
+    """
+    return (await refresh_stage_summaries(db, project_id, [stage]))[stage]
+
+
+def _summary_request(summary: Optional[ChatMessage], to_fold: List[Any]) -> str:
+    """Build the summarization request for a stage's turns to fold."""
+    turns = format_chat_history_for_prompt(
+        [{"role": row.role, "content": row.content} for row in to_fold],
+        include_header=False
+    )
+    if summary:
+        return f"## CURRENT SUMMARY\n{summary.content}\n\n## NEW TURNS\n{turns}"
+    return f"## TURNS\n{turns}"
+
+
+def _store_summary(
+    db: AsyncSession,
+    project_id: str,
+    stage: StageType,
+    summary: Optional[ChatMessage],
+    folded: List[Any],
+    content: str
+) -> Tuple[str, datetime]:
+    """
+    Update or add a stage's summary row without committing.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        stage: The SDLC stage
+        summary: Existing summary row, if any
+        folded: Turns merged into the summary, oldest first
+        content: New summary text
+        
+    Returns:
+        Tuple of (summary text, timestamp of the last summarized turn)
+    """
+    covers_until = folded[-1].created_at
+    previously_summarized = (summary.meta_data or {}).get("messages_summarized", 0) if summary else 0
+    meta_data = {
+        "covers_until": covers_until.isoformat(),
+        "messages_summarized": previously_summarized + len(folded)
+    }
+    
+    if summary:
+        summary.content = content
+        summary.meta_data = meta_data
+    else:
+        db.add(ChatMessage(
+            project_id=project_id,
+            stage=stage,
+            role=SUMMARY_ROLE,
+            content=content,
+            meta_data=meta_data
+        ))
+    
+    return content, covers_until
+
+
+async def build_stage_chat_context(
+    db: AsyncSession,
+    project_id: str,
+    stages: List[StageType],
+    token_budget: int,
+    limit_per_stage: int = 75
+) -> Tuple[str, Dict[StageType, List[Dict[str, str]]]]:
+    """
+    Build the chat context for a stage-generation prompt.
+    
+    Older turns of each stage are represented by its rolling summary; only
+    turns newer than the summary are fetched raw and trimmed to token_budget.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project
+        stages: Stages whose conversations are included
+        token_budget: Tokens allowed for the raw (unsummarized) turns
+        limit_per_stage: Max raw turns fetched per stage
+        
+    Returns:
+        Tuple of (formatted chat context, raw turns included by stage)
+    """
+    refreshed, turns = await _refresh_stage_summaries(db, project_id, stages)
+    summaries = {stage: summary for stage, (summary, _) in refreshed.items()}
+    covers_until = {stage: until for stage, (_, until) in refreshed.items()}
+    
+    # Regenerations rebuild the same context; the unsummarized turn count and
+    # newest timestamp the refresh already read tell whether the turns changed
+    cache_key = (
+        str(project_id),
+        tuple(stages),
+        token_budget,
+        limit_per_stage,
+        tuple((stage, covers_until[stage], turns.get(stage)) for stage in stages)
+    )
+    
+    cached = _stage_context_cache.get(cache_key)
+    if cached is not None:
+        chat_context, history = cached
+    else:
+        history = await get_all_chat_history(
+            db,
+            project_id,
+            stages=stages,
+            limit_per_stage=limit_per_stage,
+            after=covers_until
+        )
+        history = fit_chat_history(history, token_budget)
+        
+        # Large transcripts are formatted on a worker thread so the event loop
+        # keeps serving other requests
+        chat_chars = sum(len(msg["content"]) for msgs in history.values() for msg in msgs)
+        if chat_chars > CHAT_FORMAT_OFFLOAD_CHARS:
+            chat_context = await asyncio.to_thread(format_all_chat_history_for_prompt, history)
+        else:
+            chat_context = format_all_chat_history_for_prompt(history)
+        
+        if len(_stage_context_cache) >= STAGE_CONTEXT_CACHE_MAX_ENTRIES:
+            _stage_context_cache.pop(next(iter(_stage_context_cache)))
+        _stage_context_cache[cache_key] = (chat_context, history)
+    
+    summary_context = "\n\n".join(
+        f"### Summary of earlier {stage.value} conversation\n{summary}"
+        for stage, summary in summaries.items() if summary
+    )
+    if summary_context:
+        chat_context = f"{summary_context}\n\n{chat_context}".rstrip()
+    
+    return chat_context, history
+
+
+def _message_response(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a chat message row for the API response."""
+    return {
+        "id": str(row["id"]),
+        "role": row["role"],
+        "content": row["content"],
+        "created_at": row["created_at"].isoformat()
+    }
 
 
 class ChatService:
@@ -42,106 +396,127 @@ class ChatService:
         Returns:
             Dictionary containing user and assistant messages
         """
-        # Validate project
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
         # Validate stage
         try:
             stage_enum = StageType(stage.lower())
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid stage: {stage}")
         
-        # Get chat history for context
+        # Project/artifact context (also validates the project exists)
+        context_addition = await self._get_context_addition(UUID(project_id), stage_enum)
+        
+        # Get the most recent chat history for context, oldest first
         history_result = await self.db.execute(
-            select(ChatMessage)
+            select(ChatMessage.role, ChatMessage.content)
             .where(
                 and_(
                     ChatMessage.project_id == project_id,
-                    ChatMessage.stage == stage_enum
+                    ChatMessage.stage == stage_enum,
+                    ChatMessage.role != SUMMARY_ROLE
                 )
             )
-            .order_by(ChatMessage.created_at)
+            .order_by(desc(ChatMessage.created_at))
             .limit(20)
         )
-        history = history_result.scalars().all()
+        history = list(reversed(history_result.all()))
         
-        # Get artifacts for this stage (for context)
-        artifacts_result = await self.db.execute(
-            select(Artifact)
-            .where(
-                and_(
-                    Artifact.project_id == project_id,
-                    Artifact.stage == stage_enum
-                )
-            )
-        )
-        stage_artifacts = artifacts_result.scalars().all()
-        
-        # Build system prompt with context
-        system_prompt = get_chat_system_prompt(stage)
-        context_addition = f"\n\nProject: {project.name}\nDescription: {project.description or 'No description'}"
-        if stage_artifacts:
-            context_addition += f"\n\nExisting artifacts in this stage: {', '.join([a.name for a in stage_artifacts])}"
-        
-        full_system_prompt = system_prompt + context_addition
+        # The user turn is built once and shared by the OpenAI payload and the DB row
+        user_turn = {"role": "user", "content": message}
+        user_sent_at = datetime.utcnow()
         
-        # Build messages array for OpenAI
-        messages = [{"role": "system", "content": full_system_prompt}]
-        for msg in history:
-            messages.append({"role": msg.role, "content": msg.content})
-        messages.append({"role": "user", "content": message})
-        
-        # Save user message to DB
-        user_message = ChatMessage(
-            project_id=project_id,
-            stage=stage_enum,
-            role="user",
-            content=message
-        )
-        self.db.add(user_message)
+        # Build messages array for OpenAI, system prompt with context first
+        messages = [
+            {"role": "system", "content": f"{get_chat_system_prompt(stage)}{context_addition}"},
+            *({"role": msg.role, "content": msg.content} for msg in history),
+            user_turn,
+        ]
         
         # Call OpenAI
         assistant_content, tokens = await self.ai_service.chat(messages, max_tokens=1000)
         
-        # Save assistant response to DB
-        assistant_message = ChatMessage(
-            project_id=project_id,
-            stage=stage_enum,
-            role="assistant",
-            content=assistant_content,
-            meta_data={
+        # Save both turns in one INSERT; ids and timestamps are set client-side
+        # so nothing has to be read back
+        user_message = {
+            **user_turn,
+            "id": uuid4(),
+            "project_id": project_id,
+            "stage": stage_enum,
+            "created_at": user_sent_at,
+            "meta_data": {}
+        }
+        assistant_message = {
+            "role": "assistant",
+            "content": assistant_content,
+            "id": uuid4(),
+            "project_id": project_id,
+            "stage": stage_enum,
+            "created_at": datetime.utcnow(),
+            "meta_data": {
                 "model": self.ai_service.model,
                 "tokens": tokens
             }
-        )
-        self.db.add(assistant_message)
-        
+        }
+        await self.db.execute(insert(ChatMessage).values([user_message, assistant_message]))
         await self.db.commit()
-        await self.db.refresh(user_message)
-        await self.db.refresh(assistant_message)
         
         return {
-            "user_message": {
-                "id": str(user_message.id),
-                "role": "user",
-                "content": user_message.content,
-                "created_at": user_message.created_at.isoformat()
-            },
-            "assistant_message": {
-                "id": str(assistant_message.id),
-                "role": "assistant",
-                "content": assistant_message.content,
-                "created_at": assistant_message.created_at.isoformat()
-            }
+            "user_message": _message_response(user_message),
+            "assistant_message": _message_response(assistant_message)
         }
     
+    async def _get_context_addition(self, project_uuid: UUID, stage: StageType) -> str:
+        """
+        Build the project context appended to the chat system prompt.
+        
+        Cached per (project, stage) for CONTEXT_CACHE_TTL seconds; artifact and
+        project writes invalidate the project's entries.
+        
+        Args:
+            project_uuid: ID of the project
+            stage: Current stage
+            
+        Returns:
+            Context string with project details and stage artifact names
+            
+        Raises:
+            HTTPException: If the project does not exist
+        """
+        project_id = str(project_uuid)
+        key = (project_id, stage)
+        cached = _context_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        # Validate project and collect this stage's artifact names in one query
+        result = await self.db.execute(
+            select(Project.name, Project.description, Artifact.name)
+            .outerjoin(
+                Artifact,
+                and_(
+                    # artifacts.project_id is a string column, so match on the id text
+                    Artifact.project_id == project_id,
+                    Artifact.stage == stage
+                )
+            )
+            .where(Project.id == project_uuid)
+        )
+        rows = result.all()
+        
+        if not rows:
+            raise HTTPException(status_code=404, detail="Project not found")
+        
+        project_name, project_description = rows[0][0], rows[0][1]
+        stage_artifact_names = [row[2] for row in rows if row[2] is not None]
+        
+        artifacts_line = (
+            f"\n\nExisting artifacts in this stage: {', '.join(stage_artifact_names)}"
+            if stage_artifact_names else ""
+        )
+        context_addition = f"\n\nProject: {project_name}\nDescription: {project_description or 'No description'}{artifacts_line}"
+        
+        _context_cache[key] = (time.monotonic() + CONTEXT_CACHE_TTL, context_addition)
+        return context_addition
+    
     async def get_history(
         self,
         project_id: str,
@@ -149,12 +524,12 @@ class ChatService:
         limit: int = 50
     ) -> Dict[str, Any]:
         """
-        Get chat history for a project stage.
+        Get the most recent chat history for a project stage.
         
         Args:
             project_id: ID of the project
             stage: Stage name
-            limit: Maximum number of messages to return
+            limit: Maximum number of (newest) messages to return, oldest first
             
         Returns:
             Dictionary containing chat messages
@@ -165,18 +540,25 @@ class ChatService:
         except ValueError:
             return {"project_id": project_id, "stage": stage, "messages": []}
         
+        # Only the serialized columns are needed; skip ORM instance loading
         result = await self.db.execute(
-            select(ChatMessage)
+            select(
+                ChatMessage.id,
+                ChatMessage.role,
+                ChatMessage.content,
+                ChatMessage.created_at
+            )
             .where(
                 and_(
                     ChatMessage.project_id == project_id,
-                    ChatMessage.stage == stage_enum
+                    ChatMessage.stage == stage_enum,
+                    ChatMessage.role != SUMMARY_ROLE
                 )
             )
-            .order_by(ChatMessage.created_at)
+            .order_by(desc(ChatMessage.created_at))
             .limit(limit)
         )
-        messages = result.scalars().all()
+        messages = list(reversed(result.all()))
         
         return {
             "project_id": project_id,
@@ -214,7 +596,7 @@ class ChatService:
             return {"deleted": 0, "project_id": project_id, "stage": stage}
         
         result = await self.db.execute(
-            select(ChatMessage)
+            delete(ChatMessage)
             .where(
                 and_(
                     ChatMessage.project_id == project_id,
@@ -222,11 +604,7 @@ class ChatService:
                 )
             )
         )
-        messages = result.scalars().all()
-        
-        count = len(messages)
-        for msg in messages:
-            await self.db.delete(msg)
+        count = result.rowcount
         
         await self.db.commit()
         
@@ -3,25 +3,70 @@
 Service for the Define stage - BRD and User Stories generation.
 """
 
-from typing import Any, Dict, List, Optional
-from uuid import UUID
+import re
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
-from fastapi import HTTPException
-from sqlalchemy import select, and_
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select, update, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.project import Project
 from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
-from app.services.ai_service import generate_with_openai
-from app.services.activity_service import log_activity
-from app.prompts import BRD_WITH_CONTEXT_PROMPT, TECH_WRITER_PROMPT
-from app.utils.chat_context import (
-    get_all_chat_history,
-    format_all_chat_history_for_prompt,
-    count_chat_messages
+from app.services.ai_service import (
+    generate_with_openai_usage,
+    generate_with_openai_stream
 )
+from app.services.activity_service import log_activity, write_audit_records
+from app.prompts import (
+    BRD_WITH_CONTEXT_PROMPT,
+    TECH_WRITER_PROMPT,
+    BRD_CHAT_INSTRUCTIONS,
+    STORIES_CHAT_INSTRUCTIONS,
+    BRD_AND_STORIES_PROMPT,
+    BRD_AND_STORIES_CHAT_INSTRUCTIONS,
+)
+from app.services.chat_service import build_stage_chat_context
+from app.utils.chat_context import count_chat_messages, count_tokens
+
+
+# Max tokens for the single call that writes both the BRD and the stories
+COMBINED_MAX_TOKENS = 16000
+
+# Splits the combined response into its BRD and user-stories sections
+_COMBINED_OUTPUT_RE = re.compile(
+    r"<<<BRD>>>(.*?)<<<END_BRD>>>\s*<<<STORIES>>>(.*?)<<<END_STORIES>>>",
+    re.DOTALL
+)
+
+# The BRD section alone, kept when the stories part of a reply is cut off
+_COMBINED_BRD_RE = re.compile(r"<<<BRD>>>(.*?)<<<END_BRD>>>", re.DOTALL)
+
+# Tokens of raw (unsummarized) chat turns sent with each Define prompt
+DEFINE_CHAT_TOKEN_BUDGET = 2000
+
+# Heading that opens every generated user story
+STORY_MARKER = "### STORY-"
+
+def _count_story_markers(chunk: str, carry: str) -> Tuple[int, str]:
+    """
+    Count story headings in a streamed chunk.
+    
+    The last len(STORY_MARKER) - 1 characters of each window are carried into
+    the next call so a marker split across chunks is still counted exactly once.
+    
+    Args:
+        chunk: Newly received text
+        carry: Carry returned by the previous call ("" for the first chunk)
+        
+    Returns:
+        Tuple of (markers completed in this chunk, carry for the next call)
+    """
+    window = carry + chunk
+    return window.count(STORY_MARKER), window[-(len(STORY_MARKER) - 1):]
 
 
 class DefineService:
@@ -38,23 +83,30 @@ class DefineService:
             project_id: ID of the project
             
         Returns:
-            Tuple of (problem_artifact, stakeholder_artifact)
+            Tuple of (problem_artifact, stakeholder_artifact) rows carrying
+            id, artifact_type and content
         """
-        # Fetch all Discover stage artifacts
+        # Only the two input types and the columns the prompts need; rows are
+        # oldest first so the latest version of each type wins
         result = await self.db.execute(
-            select(Artifact).where(
+            select(Artifact.id, Artifact.artifact_type, Artifact.content)
+            .where(
                 and_(
                     Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DISCOVER
+                    Artifact.stage == StageType.DISCOVER,
+                    Artifact.artifact_type.in_([
+                        ArtifactType.PROBLEM_STATEMENT,
+                        ArtifactType.STAKEHOLDER_ANALYSIS
+                    ])
                 )
             )
+            .order_by(Artifact.created_at)
         )
-        artifacts = result.scalars().all()
         
         problem_artifact = None
         stakeholder_artifact = None
         
-        for artifact in artifacts:
+        for artifact in result.all():
             if artifact.artifact_type == ArtifactType.PROBLEM_STATEMENT:
                 problem_artifact = artifact
             elif artifact.artifact_type == ArtifactType.STAKEHOLDER_ANALYSIS:
@@ -62,12 +114,63 @@ class DefineService:
         
         return problem_artifact, stakeholder_artifact
     
+    async def _generate_brd_and_stories(
+        self,
+        problem_statement: str,
+        stakeholder_analysis: str,
+        chat_context: str
+    ) -> Optional[Tuple[str, Optional[str], Dict[str, Any]]]:
+        """
+        Generate the BRD and user stories with a single AI call.
+        
+        The reply is never taken from the completion cache, so a retry after
+        an unusable reply always gets a fresh generation.
+        
+        Args:
+            problem_statement: Problem Statement content
+            stakeholder_analysis: Stakeholder Analysis content
+            chat_context: Formatted chat context
+            
+        Returns:
+            Tuple of (BRD, user stories, usage). The stories are None when the
+            reply was cut off (or malformed) after a complete BRD section, so
+            only they need a separate call. None if not even the BRD could be
+            taken from the reply.
+        """
+        prompt = BRD_AND_STORIES_PROMPT.format(
+            problem_statement=problem_statement,
+            stakeholder_analysis=stakeholder_analysis
+        )
+        content, usage = await generate_with_openai_usage(
+            prompt,
+            f"{BRD_AND_STORIES_CHAT_INSTRUCTIONS}{chat_context}",
+            max_tokens=COMBINED_MAX_TOKENS
+        )
+        
+        match = _COMBINED_OUTPUT_RE.search(content)
+        if (
+            usage.get("finish_reason") != "length"
+            and match and match.group(1).strip() and match.group(2).strip()
+        ):
+            return match.group(1).strip(), match.group(2).strip(), usage
+        
+        # A truncated reply can still carry a finished BRD; keep it rather
+        # than paying for the BRD a second time
+        brd_match = _COMBINED_BRD_RE.search(content)
+        if brd_match and brd_match.group(1).strip():
+            print("⚠️ Combined BRD/stories output incomplete; generating the stories separately")
+            return brd_match.group(1).strip(), None, usage
+        
+        print("⚠️ Combined BRD/stories output could not be split; using separate calls")
+        return None
+    
     async def generate_define_stage(
         self,
         project_id: str,
         problem_statement_artifact_id: Optional[str] = None,
         stakeholder_analysis_artifact_id: Optional[str] = None,
-        created_by: str = "AI Business Analyst"
+        created_by: str = "AI Business Analyst",
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> Dict[str, Any]:
         """
         Generate BRD and User Stories for the Define stage.
@@ -77,16 +180,78 @@ class DefineService:
             problem_statement_artifact_id: Optional ID of the problem statement artifact (auto-fetched if not provided)
             stakeholder_analysis_artifact_id: Optional ID of the stakeholder analysis artifact (auto-fetched if not provided)
             created_by: Creator identifier
+            background_tasks: If given, the Commit and activity rows are written
+                after the response instead of before it
             
         Returns:
             Dictionary containing both artifacts and status
         """
-        # Get project
+        # Chunks are not needed here; the pipeline ends with the result dict
+        async for item in self._run_define_stage(
+            project_id,
+            problem_statement_artifact_id,
+            stakeholder_analysis_artifact_id,
+            created_by,
+            background_tasks,
+            stream_brd=False
+        ):
+            result = item
+        return result
+    
+    def generate_define_stage_stream(
+        self,
+        project_id: str,
+        problem_statement_artifact_id: Optional[str] = None,
+        stakeholder_analysis_artifact_id: Optional[str] = None,
+        created_by: str = "AI Business Analyst",
+        background_tasks: Optional[BackgroundTasks] = None
+    ) -> AsyncIterator[Union[Tuple[str, str], Dict[str, Any]]]:
+        """
+        Generate BRD and User Stories, streaming both documents as they are written.
+        
+        Args:
+            project_id: ID of the project
+            problem_statement_artifact_id: Optional ID of the problem statement artifact (auto-fetched if not provided)
+            stakeholder_analysis_artifact_id: Optional ID of the stakeholder analysis artifact (auto-fetched if not provided)
+            created_by: Creator identifier
+            background_tasks: If given, audit rows are written after the response
+            
+        Returns:
+            Async iterator of ("brd" | "user_stories", text chunk) tuples, then
+            the same result dictionary as generate_define_stage
+        """
+        return self._run_define_stage(
+            project_id,
+            problem_statement_artifact_id,
+            stakeholder_analysis_artifact_id,
+            created_by,
+            background_tasks,
+            stream_brd=True
+        )
+    
+    async def _run_define_stage(
+        self,
+        project_id: str,
+        problem_statement_artifact_id: Optional[str],
+        stakeholder_analysis_artifact_id: Optional[str],
+        created_by: str,
+        background_tasks: Optional[BackgroundTasks],
+        stream_brd: bool
+    ) -> AsyncIterator[Union[Tuple[str, str], Dict[str, Any]]]:
+        """
+        Shared Define pipeline; yields document chunks, then the result.
+        
+        User stories are always streamed so they can be counted on arrival.
+        The BRD is streamed only when stream_brd is set; otherwise it goes
+        through the cached, non-streaming completion path.
+        """
+        # Get project. The ID was validated by the request schema; it is parsed
+        # once here because the UUID column only binds uuid objects on SQLite.
         project_uuid = UUID(project_id)
         result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
+            select(Project.id, Project.name).where(Project.id == project_uuid)
         )
-        project = result.scalar_one_or_none()
+        project = result.one_or_none()
         
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -107,33 +272,32 @@ class DefineService:
                     detail="Stakeholder Analysis not found. Complete Discover stage first."
                 )
         else:
-            # Fetch artifacts by provided IDs
-            problem_result = await self.db.execute(
-                select(Artifact).where(Artifact.id == UUID(problem_statement_artifact_id))
+            # Fetch both artifacts by provided IDs in one query
+            problem_uuid = UUID(problem_statement_artifact_id)
+            stakeholder_uuid = UUID(stakeholder_analysis_artifact_id)
+            result = await self.db.execute(
+                select(Artifact.id, Artifact.artifact_type, Artifact.content)
+                .where(Artifact.id.in_([problem_uuid, stakeholder_uuid]))
             )
-            problem_artifact = problem_result.scalar_one_or_none()
+            artifacts_by_id = {artifact.id: artifact for artifact in result.all()}
+            problem_artifact = artifacts_by_id.get(problem_uuid)
+            stakeholder_artifact = artifacts_by_id.get(stakeholder_uuid)
             
             if not problem_artifact:
                 raise HTTPException(status_code=404, detail="Problem Statement not found")
             
-            stakeholder_result = await self.db.execute(
-                select(Artifact).where(Artifact.id == UUID(stakeholder_analysis_artifact_id))
-            )
-            stakeholder_artifact = stakeholder_result.scalar_one_or_none()
-            
             if not stakeholder_artifact:
                 raise HTTPException(status_code=404, detail="Stakeholder Analysis not found")
         
-        # Fetch chat history from BOTH discover and define stages for comprehensive context
-        all_chat_history = await get_all_chat_history(
-            self.db, 
-            project_id, 
-            stages=[StageType.DISCOVER, StageType.DEFINE],
-            limit_per_stage=75  # Get more messages for better context
+        # Older turns of each stage live in its rolling summary; only newer
+        # turns are sent raw, trimmed to DEFINE_CHAT_TOKEN_BUDGET
+        chat_context, all_chat_history = await build_stage_chat_context(
+            self.db,
+            project_id,
+            [StageType.DISCOVER, StageType.DEFINE],
+            DEFINE_CHAT_TOKEN_BUDGET
         )
-        
-        # Format chat history with strong emphasis
-        chat_context = format_all_chat_history_for_prompt(all_chat_history)
+        chat_context_tokens = count_tokens(chat_context)
         
         # Get stats for logging
         chat_stats = count_chat_messages(all_chat_history)
@@ -145,27 +309,62 @@ class DefineService:
             if count > 0:
                 print(f"       • {stage}: {count} messages")
         
-        # Step 1: Generate BRD with comprehensive chat context
-        brd_prompt = BRD_WITH_CONTEXT_PROMPT.format(
-            problem_statement=problem_artifact.content,
-            stakeholder_analysis=stakeholder_artifact.content
-        )
+        # Non-streaming runs first ask for the BRD and stories in one call, so
+        # the chat transcript is sent once; a reply without both documents
+        # falls back to separate calls for whatever is missing
+        brd_content = stories_content = None
+        if not stream_brd:
+            combined = await self._generate_brd_and_stories(
+                problem_artifact.content,
+                stakeholder_artifact.content,
+                chat_context
+            )
+            if combined:
+                brd_content, stories_content, brd_usage = combined
+                # When one call served both documents, its prompt-cache hits
+                # are reported on the BRD only
+                stories_usage = {**brd_usage, "cached_prompt_tokens": None}
         
-        # Enrich user message with chat history from both stages
-        enriched_brd_message = f"""Generate a comprehensive Business Requirements Document that incorporates ALL context from artifacts and conversations.
-
-**CRITICAL**: Review the conversation history below carefully. 
-- Extract EVERY specific requirement mentioned
-- Include ALL business rules discussed
-- Note ALL constraints and priorities stated
-- Use exact terminology from conversations
-- Address ALL stakeholders mentioned
-
-{chat_context}"""
+        if brd_content is None:
+            # Step 1: Generate BRD with comprehensive chat context
+            brd_prompt = BRD_WITH_CONTEXT_PROMPT.format(
+                problem_statement=problem_artifact.content,
+                stakeholder_analysis=stakeholder_artifact.content
+            )
+            
+            # Static instructions lead and the growing chat transcript trails, so
+            # repeat generations reuse the cached prompt prefix
+            enriched_brd_message = f"{BRD_CHAT_INSTRUCTIONS}{chat_context}"
+            
+            if stream_brd:
+                brd_usage: Dict[str, Optional[int]] = {}
+                brd_chunks: List[str] = []
+                async for chunk in generate_with_openai_stream(
+                    brd_prompt,
+                    enriched_brd_message,
+                    max_tokens=8000,
+                    usage=brd_usage
+                ):
+                    brd_chunks.append(chunk)
+                    yield "brd", chunk
+                brd_content = "".join(brd_chunks)
+            else:
+                # Retries with unchanged inputs reuse the cached BRD
+                brd_content, brd_usage = await generate_with_openai_usage(
+                    brd_prompt,
+                    enriched_brd_message,
+                    max_tokens=8000,
+                    use_cache=True
+                )
         
-        brd_content = await generate_with_openai(brd_prompt, enriched_brd_message, max_tokens=8000)
+        brd_word_count = len(brd_content.split())
         
+        # Ids and timestamps are assigned up front so the stories can reference
+        # the BRD without a mid-request flush and the response can be built from
+        # these in-memory objects; everything is written in the final commit
         brd_artifact = Artifact(
+            id=uuid4(),
+            created_at=datetime.utcnow(),
             project_id=project_id,
             stage=StageType.DEFINE,
             artifact_type=ArtifactType.BRD,
@@ -177,43 +376,47 @@ class DefineService:
                 "model": "gpt-4o-mini",
                 "problem_statement_id": str(problem_artifact.id),
                 "stakeholder_analysis_id": str(stakeholder_artifact.id),
-                "word_count": len(brd_content.split()),
+                "word_count": brd_word_count,
+                "cached_prompt_tokens": brd_usage.get("cached_prompt_tokens"),
                 "chat_messages_used": total_chat_messages,
+                "chat_context_tokens": chat_context_tokens,
                 "chat_stats": chat_stats["by_stage"],
-                "generation_context": "includes_chat_history" if total_chat_messages > 0 else "no_chat_history"
+                "generation_context": "includes_chat_history" if total_chat_messages > 0 else "no_chat_history",
+                "combined_generation": stories_content is not None
             }
         )
         
-        self.db.add(brd_artifact)
-        await self.db.flush()
-        
         # Step 2: Generate User Stories with chat context
-        print(f"📝 Generating User Stories from BRD...")
-        print(f"   └── Chat context: {total_chat_messages} messages for enrichment")
-        
-        stories_prompt = TECH_WRITER_PROMPT.format(brd_content=brd_content)
-        
-        # Enrich with chat history to capture any specific requirements discussed
-        enriched_stories_message = f"""Generate comprehensive user stories based on the BRD. 
-
-**CRITICAL**: Also review the conversation history below.
-- Include stories for EVERY feature discussed
-- Use exact field names and terminology from conversations
-- Capture ALL acceptance criteria mentioned
-- Address ALL edge cases discussed
-- Respect priorities stated by the user
-
-{chat_context}"""
-        
-        stories_content = await generate_with_openai(
-            stories_prompt,
-            enriched_stories_message,
-            max_tokens=8000
-        )
-        
-        story_count = stories_content.count("### STORY-")
+        if stories_content is None:
+            print(f"📝 Generating User Stories from BRD...")
+            print(f"   └── Chat context: {total_chat_messages} messages for enrichment")
+            
+            stories_prompt = TECH_WRITER_PROMPT.format(brd_content=brd_content)
+            
+            # Enrich with chat history to capture any specific requirements discussed
+            enriched_stories_message = f"{STORIES_CHAT_INSTRUCTIONS}{chat_context}"
+            
+            stories_usage: Dict[str, Optional[int]] = {}
+            stories_chunks: List[str] = []
+            story_count = 0
+            carry = ""
+            async for chunk in generate_with_openai_stream(
+                stories_prompt,
+                enriched_stories_message,
+                max_tokens=8000,
+                usage=stories_usage
+            ):
+                stories_chunks.append(chunk)
+                found, carry = _count_story_markers(chunk, carry)
+                story_count += found
+                yield "user_stories", chunk
+            stories_content = "".join(stories_chunks)
+        else:
+            story_count = stories_content.count(STORY_MARKER)
         
         stories_artifact = Artifact(
+            id=uuid4(),
+            created_at=datetime.utcnow(),
             project_id=project_id,
             stage=StageType.DEFINE,
             artifact_type=ArtifactType.USER_STORIES,
@@ -224,55 +427,62 @@ class DefineService:
             meta_data={
                 "model": "gpt-4o-mini",
                 "story_count": story_count,
+                "cached_prompt_tokens": stories_usage.get("cached_prompt_tokens"),
                 "brd_artifact_id": str(brd_artifact.id),
+                "combined_generation": brd_artifact.meta_data["combined_generation"],
                 "chat_messages_used": total_chat_messages,
+                "chat_context_tokens": chat_context_tokens,
                 "chat_stats": chat_stats["by_stage"],
                 "generation_context": "includes_chat_history" if total_chat_messages > 0 else "no_chat_history"
             }
         )
         
-        self.db.add(stories_artifact)
+        self.db.add_all([brd_artifact, stories_artifact])
         
-        # Create commit
-        commit = Commit(
-            project_id=project_id,
-            stage=StageType.DEFINE,
-            author_id=created_by or "AI",
-            message=f"Generated BRD and {story_count} User Stories (with {total_chat_messages} chat messages for context)",
-            changes={
+        # Commit and activity rows for traceability
+        commit_data = {
+            "project_id": project_id,
+            "stage": StageType.DEFINE,
+            "author_id": created_by or "AI",
+            "message": f"Generated BRD and {story_count} User Stories (with {total_chat_messages} chat messages for context)",
+            "changes": {
                 "added": ["BRD", f"User Stories ({story_count})"],
                 "modified": [],
                 "deleted": []
             }
-        )
-        self.db.add(commit)
-        
-        # Log activity
-        await log_activity(
-            self.db,
-            project_id,
-            created_by or "system",
-            "define_completed",
-            {
-                "brd_word_count": len(brd_content.split()),
+        }
+        activity = {
+            "project_id": project_id,
+            "user_id": created_by or "system",
+            "activity_type": "define_completed",
+            "data": {
+                "brd_word_count": brd_word_count,
                 "story_count": story_count,
                 "chat_messages_used": total_chat_messages
             }
-        )
+        }
+        if background_tasks is not None:
+            # Audit rows are written after the response in their own session
+            background_tasks.add_task(write_audit_records, activity, commit_data)
+        else:
+            self.db.add(Commit(**commit_data))
+            await log_activity(self.db, **activity)
         
         # Update project stage
-        project.current_stage = StageType.DESIGN
+        await self.db.execute(
+            update(Project)
+            .where(Project.id == project_uuid)
+            .values(current_stage=StageType.DESIGN)
+        )
         
         await self.db.commit()
-        await self.db.refresh(brd_artifact)
-        await self.db.refresh(stories_artifact)
         
         print(f"✅ Define stage completed for project: {project.name}")
-        print(f"   └── BRD: {len(brd_content.split())} words")
+        print(f"   └── BRD: {brd_word_count} words")
         print(f"   └── User Stories: {story_count} stories")
         print(f"   └── Used {total_chat_messages} chat messages for context")
         
-        return {
+        yield {
             "status": "completed",
             "message": f"Define stage completed successfully (used {total_chat_messages} chat messages for context)",
             "chat_messages_used": total_chat_messages,
@@ -3,23 +3,202 @@
 Service for the Design stage - Architecture generation and selection.
 """
 
-import json
+import asyncio
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
 
-from fastapi import HTTPException
-from sqlalchemy import select
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.project import Project
 from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
-from app.services.ai_service import generate_with_openai
-from app.services.activity_service import log_activity
+from app.services.ai_service import evict_completion, generate_with_openai
+from app.services.activity_service import log_activity, write_audit_records
 from app.prompts import DESIGN_SYSTEM_PROMPT, DESIGN_USER_PROMPT_TEMPLATE
 from app.schemas.stage_design import DesignConstraints
+from app.utils import json_io
+from app.utils.text import prefixed_lines
+
+
+# Design prompt field filled from the latest Discover/Define artifact of each type
+_DESIGN_PROMPT_FIELDS = {
+    ArtifactType.PROBLEM_STATEMENT: "problem_statement",
+    ArtifactType.STAKEHOLDER_ANALYSIS: "stakeholder_analysis",
+    ArtifactType.BRD: "brd_content",
+    ArtifactType.USER_STORIES: "user_stories",
+}
+
+# (DesignConstraints field, prompt label, list-valued, value suffix) in prompt order
+_CONSTRAINT_FIELDS = (
+    ("preferred_tech_stack", "Preferred Tech Stack", True, ""),
+    ("cloud_provider", "Cloud Provider", False, ""),
+    ("budget_range", "Budget Range", False, ""),
+    ("timeline_weeks", "Timeline", False, " weeks"),
+    ("compliance_requirements", "Compliance", True, ""),
+    ("scalability_needs", "Scalability", False, ""),
+    ("team_expertise", "Team Expertise", True, ""),
+    ("existing_systems", "Existing Systems", True, ""),
+    ("additional_notes", "Additional Notes", False, ""),
+)
+
+
+def _freeze_constraints(constraints: Optional[DesignConstraints]) -> Tuple[Any, ...]:
+    """Hashable snapshot of the constraint values, in _CONSTRAINT_FIELDS order."""
+    if constraints is None:
+        return ()
+    frozen = []
+    for field, _, is_list, _ in _CONSTRAINT_FIELDS:
+        value = getattr(constraints, field)
+        frozen.append(tuple(value) if is_list and value is not None else value)
+    return tuple(frozen)
+
+
+@lru_cache(maxsize=256)
+def _render_constraints(frozen: Tuple[Any, ...]) -> str:
+    """Render frozen constraints as prompt lines; memoized for repeated sets."""
+    parts = []
+    for (_, label, is_list, suffix), value in zip(_CONSTRAINT_FIELDS, frozen):
+        if not value:
+            continue
+        parts.append(f"{label}: {', '.join(value) if is_list else value}{suffix}")
+    return "\n".join(parts) or "No specific constraints provided."
+
+
+# Markdown skeleton of the Solution Architecture Document; sections are
+# rendered separately and substituted with a single format_map call
+_ARCHITECTURE_DOCUMENT_TEMPLATE = """# Solution Architecture Document
+
+## Selected Architecture: {name}
+
+> {tagline}
+
+---
+
+## Executive Summary
+
+{analysis_summary}
+
+### Why This Option Was Selected
+{recommendation_reasoning}
+
+---
+
+## Architecture Overview
+
+**Complexity:** {complexity}
+**Estimated Monthly Cost:** {monthly_cost}
+**MVP Timeline:** {mvp_timeline_weeks} weeks
+**Scalability:** {scalability}
+**Compliance Fit:** {compliance_fit}
+
+### Tech Stack
+{tech_stack_list}
+
+---
+
+## Detailed Description
+
+{detailed_description}
+
+---
+
+## System Architecture Diagram
+
+```mermaid
+{architecture_diagram}
+```
+
+---
+
+## Components
+
+{components_list}
+
+---
+
+## Database Design
+
+**Type:** {database_type}
+**Technology:** {database_technology}
+
+### Schema Overview
+{schema_overview}
+
+```mermaid
+{database_diagram}
+```
+
+---
+
+## API Design
+
+**Style:** {api_style}
+
+### Key Endpoints
+{api_endpoints}
+
+---
+
+## Deployment Architecture
+
+```mermaid
+{deployment_diagram}
+```
+
+---
+
+## Security Considerations
+
+{security_list}
+
+---
+
+## Risk Assessment
+
+| Risk | Severity | Mitigation |
+|------|----------|------------|
+{risk_rows}
+
+---
+
+## Implementation Phases
+
+{phases_content}
+
+---
+
+## Strengths
+
+{strengths_list}
+
+---
+
+## Trade-offs & Considerations
+
+{tradeoffs_list}
+
+---
+
+## Alternative Options Considered
+
+### Option Comparison Summary
+
+| Aspect | {comparison_name} | Other Options |
+|--------|---------|---------------|
+| Complexity | {comparison_complexity} | Varies |
+| Cost | {comparison_cost} | Varies |
+| Timeline | {comparison_timeline} weeks | Varies |
+
+---
+
+*Document generated by AI Solution Architect*
+*Selection Date: {selection_date}*
+"""
 
 
 class DesignService:
@@ -50,72 +229,31 @@ class DesignService:
         # Get project
         project_uuid = UUID(project_id)
         result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
+            select(Project.id, Project.name).where(Project.id == project_uuid)
         )
-        project = result.scalar_one_or_none()
+        project = result.one_or_none()
         
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        # Fetch artifacts from Discover stage
-        discover_result = await self.db.execute(
-            select(Artifact).where(
+        # Fetch Discover and Define artifact contents in one query; rows are
+        # oldest first so the latest version of each type wins
+        artifacts_result = await self.db.execute(
+            select(Artifact.artifact_type, Artifact.content)
+            .where(
                 Artifact.project_id == project_id,
-                Artifact.stage == StageType.DISCOVER
+                Artifact.stage.in_([StageType.DISCOVER, StageType.DEFINE]),
+                Artifact.artifact_type.in_(_DESIGN_PROMPT_FIELDS)
             )
+            .order_by(Artifact.created_at)
         )
-        discover_artifacts = discover_result.scalars().all()
         
-        problem_statement = ""
-        stakeholder_analysis = ""
-        for artifact in discover_artifacts:
-            if artifact.artifact_type == ArtifactType.PROBLEM_STATEMENT:
-                problem_statement = artifact.content
-            elif artifact.artifact_type == ArtifactType.STAKEHOLDER_ANALYSIS:
-                stakeholder_analysis = artifact.content
-        
-        # Fetch artifacts from Define stage
-        define_result = await self.db.execute(
-            select(Artifact).where(
-                Artifact.project_id == project_id,
-                Artifact.stage == StageType.DEFINE
-            )
-        )
-        define_artifacts = define_result.scalars().all()
-        
-        brd_content = ""
-        user_stories = ""
-        for artifact in define_artifacts:
-            if artifact.artifact_type == ArtifactType.BRD:
-                brd_content = artifact.content
-            elif artifact.artifact_type == ArtifactType.USER_STORIES:
-                user_stories = artifact.content
+        artifact_contents = dict.fromkeys(_DESIGN_PROMPT_FIELDS.values(), "")
+        for artifact_type, content in artifacts_result.all():
+            artifact_contents[_DESIGN_PROMPT_FIELDS[artifact_type]] = content
         
         # Build constraints string
-        constraints_str = "No specific constraints provided."
-        if constraints:
-            constraints_parts = []
-            if constraints.preferred_tech_stack:
-                constraints_parts.append(f"Preferred Tech Stack: {', '.join(constraints.preferred_tech_stack)}")
-            if constraints.cloud_provider:
-                constraints_parts.append(f"Cloud Provider: {constraints.cloud_provider}")
-            if constraints.budget_range:
-                constraints_parts.append(f"Budget Range: {constraints.budget_range}")
-            if constraints.timeline_weeks:
-                constraints_parts.append(f"Timeline: {constraints.timeline_weeks} weeks")
-            if constraints.compliance_requirements:
-                constraints_parts.append(f"Compliance: {', '.join(constraints.compliance_requirements)}")
-            if constraints.scalability_needs:
-                constraints_parts.append(f"Scalability: {constraints.scalability_needs}")
-            if constraints.team_expertise:
-                constraints_parts.append(f"Team Expertise: {', '.join(constraints.team_expertise)}")
-            if constraints.existing_systems:
-                constraints_parts.append(f"Existing Systems: {', '.join(constraints.existing_systems)}")
-            if constraints.additional_notes:
-                constraints_parts.append(f"Additional Notes: {constraints.additional_notes}")
-            
-            if constraints_parts:
-                constraints_str = "\n".join(constraints_parts)
+        constraints_str = _render_constraints(_freeze_constraints(constraints))
         
         # Build additional context from uploaded files
         additional_context = "None provided."
@@ -127,36 +265,32 @@ class DesignService:
         
         # Build the prompt
         user_message = DESIGN_USER_PROMPT_TEMPLATE.format(
-            problem_statement=problem_statement or "Not available",
-            stakeholder_analysis=stakeholder_analysis or "Not available",
-            brd_content=brd_content or "Not available",
-            user_stories=user_stories or "Not available",
+            problem_statement=artifact_contents["problem_statement"] or "Not available",
+            stakeholder_analysis=artifact_contents["stakeholder_analysis"] or "Not available",
+            brd_content=artifact_contents["brd_content"] or "Not available",
+            user_stories=artifact_contents["user_stories"] or "Not available",
             constraints=constraints_str,
             additional_context=additional_context
         )
         
         print(f"🏗️ Generating architecture options for project: {project.name}")
         
-        # Generate with AI
+        # Generate with AI; retries with unchanged inputs reuse the cached reply
         response_text = await generate_with_openai(
             DESIGN_SYSTEM_PROMPT,
             user_message,
-            max_tokens=8000
+            max_tokens=8000,
+            use_cache=True
         )
         
         # Clean and parse JSON response
-        cleaned_response = response_text.strip()
-        if cleaned_response.startswith("```json"):
-            cleaned_response = cleaned_response[7:]
-        if cleaned_response.startswith("```"):
-            cleaned_response = cleaned_response[3:]
-        if cleaned_response.endswith("```"):
-            cleaned_response = cleaned_response[:-3]
-        cleaned_response = cleaned_response.strip()
+        cleaned_response = json_io.strip_code_fence(response_text)
         
         try:
-            options_data = json.loads(cleaned_response)
-        except json.JSONDecodeError as e:
+            options_data = json_io.loads(cleaned_response)
+        except json_io.JSONDecodeError as e:
+            # Never serve the unparseable reply again on retry
+            evict_completion(DESIGN_SYSTEM_PROMPT, user_message, 8000)
             print(f"❌ JSON Parse Error: {str(e)}")
             print(f"Raw response: {response_text[:500]}...")
             raise HTTPException(status_code=500, detail=f"Failed to parse AI response as JSON: {str(e)}")
@@ -174,7 +308,8 @@ class DesignService:
         project_id: str,
         selected_option_id: str,
         options_data: Dict[str, Any],
-        created_by: str = "AI Solution Architect"
+        created_by: str = "AI Solution Architect",
+        background_tasks: Optional[BackgroundTasks] = None
     ) -> Dict[str, Any]:
         """
         Select an architecture option and create the architecture artifact.
@@ -184,6 +319,8 @@ class DesignService:
             selected_option_id: ID of the selected option (option_1, option_2, option_3)
             options_data: Full options data from generation
             created_by: Creator identifier
+            background_tasks: If given, the Commit and activity rows are written
+                after the response instead of before it
             
         Returns:
             Dictionary containing the architecture artifact
@@ -191,7 +328,7 @@ class DesignService:
         # Get project
         project_uuid = UUID(project_id)
         result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
+            select(Project.id).where(Project.id == project_uuid)
         )
         project = result.scalar_one_or_none()
         
@@ -204,7 +341,9 @@ class DesignService:
             raise HTTPException(status_code=400, detail="Invalid option selected")
         
         # Create comprehensive architecture document
-        architecture_content = self._build_architecture_document(
+        # Pure-Python Markdown assembly; run it off the event loop
+        architecture_content = await asyncio.to_thread(
+            self._build_architecture_document,
             selected_option,
             options_data
         )
@@ -230,38 +369,43 @@ class DesignService:
         )
         self.db.add(architecture_artifact)
         
-        # Create commit
-        commit = Commit(
-            project_id=project_id,
-            stage=StageType.DESIGN,
-            author_id=created_by,
-            message=f"Selected architecture: {selected_option.get('name', 'Architecture')}",
-            changes={
+        # Commit and activity rows for traceability
+        commit_data = {
+            "project_id": project_id,
+            "stage": StageType.DESIGN,
+            "author_id": created_by,
+            "message": f"Selected architecture: {selected_option.get('name', 'Architecture')}",
+            "changes": {
                 "added": ["Solution Architecture Document"],
                 "modified": [],
                 "deleted": []
             }
-        )
-        self.db.add(commit)
-        
-        # Log activity
-        await log_activity(
-            self.db,
-            project_id,
-            created_by or "system",
-            "architecture_selected",
-            {
+        }
+        activity = {
+            "project_id": project_id,
+            "user_id": created_by or "system",
+            "activity_type": "architecture_selected",
+            "data": {
                 "selected_option": selected_option_id,
                 "option_name": selected_option.get('name'),
                 "complexity": selected_option.get('complexity')
             }
-        )
+        }
+        if background_tasks is not None:
+            # Audit rows are written after the response in their own session
+            background_tasks.add_task(write_audit_records, activity, commit_data)
+        else:
+            self.db.add(Commit(**commit_data))
+            await log_activity(self.db, **activity)
         
         # Update project stage to DEVELOP
-        project.current_stage = StageType.DEVELOP
+        await self.db.execute(
+            update(Project)
+            .where(Project.id == project_uuid)
+            .values(current_stage=StageType.DEVELOP)
+        )
         
         await self.db.commit()
-        await self.db.refresh(architecture_artifact)
         
         print(f"✅ Architecture selected: {selected_option.get('name')}")
         
@@ -284,178 +428,48 @@ class DesignService:
         options_data: Dict[str, Any]
     ) -> str:
         """Build the comprehensive architecture document markdown."""
-        
-        # Build tech stack list
-        tech_stack_list = '\n'.join(['- ' + tech for tech in selected_option.get('tech_stack', [])])
-        
-        # Build components section
-        components_list = '\n'.join([
-            f"### {comp.get('name', 'Component')}\n**Technology:** {comp.get('technology', 'TBD')}\n\n{comp.get('description', '')}\n"
-            for comp in selected_option.get('components', [])
-        ])
-        
-        # Build API endpoints list
-        api_endpoints = '\n'.join([
-            '- `' + ep + '`'
-            for ep in selected_option.get('api_design', {}).get('key_endpoints', [])
-        ])
-        
-        # Build security list
-        security_list = '\n'.join([
-            '- ' + sec
-            for sec in selected_option.get('security_considerations', [])
-        ])
-        
-        # Build risk table
-        risk_rows = '\n'.join([
-            f"| {r.get('risk', '')} | {r.get('severity', '')} | {r.get('mitigation', '')} |"
-            for r in selected_option.get('risk_assessment', [])
-        ])
-        
-        # Build implementation phases
-        phases_content = '\n'.join([
-            f"### {phase.get('phase', 'Phase')}\n**Duration:** {phase.get('duration_weeks', 'TBD')} weeks\n\n**Deliverables:**\n" + 
-            '\n'.join(['- ' + d for d in phase.get('deliverables', [])]) + '\n'
-            for phase in selected_option.get('implementation_phases', [])
-        ])
-        
-        # Build strengths list
-        strengths_list = '\n'.join([
-            '✅ ' + s
-            for s in selected_option.get('strengths', [])
-        ])
-        
-        # Build tradeoffs list
-        tradeoffs_list = '\n'.join([
-            '⚠️ ' + t
-            for t in selected_option.get('tradeoffs', [])
-        ])
-        
-        return f"""# Solution Architecture Document
-
-## Selected Architecture: {selected_option.get('name', 'Architecture')}
-
-> {selected_option.get('tagline', '')}
-
----
-
-## Executive Summary
-
-{options_data.get('analysis_summary', '')}
-
-### Why This Option Was Selected
-{options_data.get('recommendation_reasoning', '')}
-
----
-
-## Architecture Overview
-
-**Complexity:** {selected_option.get('complexity', 'Medium')}
-**Estimated Monthly Cost:** {selected_option.get('monthly_cost', 'TBD')}
-**MVP Timeline:** {selected_option.get('mvp_timeline_weeks', 'TBD')} weeks
-**Scalability:** {selected_option.get('scalability', 'Medium')}
-**Compliance Fit:** {selected_option.get('compliance_fit', 'Good')}
-
-### Tech Stack
-{tech_stack_list}
-
----
-
-## Detailed Description
-
-{selected_option.get('detailed_description', '')}
-
----
-
-## System Architecture Diagram
-
-```mermaid
-{selected_option.get('architecture_diagram', 'graph TD\n    A[System] --> B[Component]')}
-```
-
----
-
-## Components
-
-{components_list}
-
----
-
-## Database Design
-
-**Type:** {selected_option.get('database_design', {}).get('type', 'TBD')}
-**Technology:** {selected_option.get('database_design', {}).get('technology', 'TBD')}
-
-### Schema Overview
-{selected_option.get('database_design', {}).get('schema_overview', '')}
-
-```mermaid
-{selected_option.get('database_design', {}).get('diagram', 'erDiagram\n    ENTITY')}
-```
-
----
-
-## API Design
-
-**Style:** {selected_option.get('api_design', {}).get('style', 'REST')}
-
-### Key Endpoints
-{api_endpoints}
-
----
-
-## Deployment Architecture
-
-```mermaid
-{selected_option.get('deployment_diagram', 'graph LR\n    A[Dev] --> B[Prod]')}
-```
-
----
-
-## Security Considerations
-
-{security_list}
-
----
-
-## Risk Assessment
-
-| Risk | Severity | Mitigation |
-|------|----------|------------|
-{risk_rows}
-
----
-
-## Implementation Phases
-
-{phases_content}
-
----
-
-## Strengths
-
-{strengths_list}
-
----
-
-## Trade-offs & Considerations
-
-{tradeoffs_list}
-
----
-
-## Alternative Options Considered
-
-### Option Comparison Summary
-
-| Aspect | {selected_option.get('name', 'Selected')} | Other Options |
-|--------|---------|---------------|
-| Complexity | {selected_option.get('complexity', '-')} | Varies |
-| Cost | {selected_option.get('monthly_cost', '-')} | Varies |
-| Timeline | {selected_option.get('mvp_timeline_weeks', '-')} weeks | Varies |
-
----
-
-*Document generated by AI Solution Architect*
-*Selection Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}*
-"""
+        database_design = selected_option.get('database_design', {})
+        api_design = selected_option.get('api_design', {})
+        
+        return _ARCHITECTURE_DOCUMENT_TEMPLATE.format_map({
+            "name": selected_option.get('name', 'Architecture'),
+            "tagline": selected_option.get('tagline', ''),
+            "analysis_summary": options_data.get('analysis_summary', ''),
+            "recommendation_reasoning": options_data.get('recommendation_reasoning', ''),
+            "complexity": selected_option.get('complexity', 'Medium'),
+            "monthly_cost": selected_option.get('monthly_cost', 'TBD'),
+            "mvp_timeline_weeks": selected_option.get('mvp_timeline_weeks', 'TBD'),
+            "scalability": selected_option.get('scalability', 'Medium'),
+            "compliance_fit": selected_option.get('compliance_fit', 'Good'),
+            "tech_stack_list": prefixed_lines(selected_option.get('tech_stack', []), '- '),
+            "detailed_description": selected_option.get('detailed_description', ''),
+            "architecture_diagram": selected_option.get('architecture_diagram', 'graph TD\n    A[System] --> B[Component]'),
+            "components_list": prefixed_lines(
+                f"### {comp.get('name', 'Component')}\n**Technology:** {comp.get('technology', 'TBD')}\n\n{comp.get('description', '')}\n"
+                for comp in selected_option.get('components', [])
+            ),
+            "database_type": database_design.get('type', 'TBD'),
+            "database_technology": database_design.get('technology', 'TBD'),
+            "schema_overview": database_design.get('schema_overview', ''),
+            "database_diagram": database_design.get('diagram', 'erDiagram\n    ENTITY'),
+            "api_style": api_design.get('style', 'REST'),
+            "api_endpoints": prefixed_lines((f"`{ep}`" for ep in api_design.get('key_endpoints', [])), '- '),
+            "deployment_diagram": selected_option.get('deployment_diagram', 'graph LR\n    A[Dev] --> B[Prod]'),
+            "security_list": prefixed_lines(selected_option.get('security_considerations', []), '- '),
+            "risk_rows": prefixed_lines(
+                f"| {r.get('risk', '')} | {r.get('severity', '')} | {r.get('mitigation', '')} |"
+                for r in selected_option.get('risk_assessment', [])
+            ),
+            "phases_content": prefixed_lines(
+                f"### {phase.get('phase', 'Phase')}\n**Duration:** {phase.get('duration_weeks', 'TBD')} weeks\n\n**Deliverables:**\n"
+                f"{prefixed_lines(phase.get('deliverables', []), '- ')}\n"
+                for phase in selected_option.get('implementation_phases', [])
+            ),
+            "strengths_list": prefixed_lines(selected_option.get('strengths', []), '✅ '),
+            "tradeoffs_list": prefixed_lines(selected_option.get('tradeoffs', []), '⚠️ '),
+            "comparison_name": selected_option.get('name', 'Selected'),
+            "comparison_complexity": selected_option.get('complexity', '-'),
+            "comparison_cost": selected_option.get('monthly_cost', '-'),
+            "comparison_timeline": selected_option.get('mvp_timeline_weeks', '-'),
+            "selection_date": datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')
+        })
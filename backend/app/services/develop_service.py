@@ -3,14 +3,15 @@
 Service for the Develop stage - Ticket generation and implementation.
 """
 
-import json
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
-from uuid import UUID
-
-from fastapi import HTTPException
-from sqlalchemy import select, desc, and_
-from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select, desc, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm.attributes import flag_modified
 
 from app.models.project import Project
@@ -18,8 +19,10 @@ from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
 from app.services.ai_service import AIService
-from app.services.activity_service import log_activity
+from app.services.activity_service import stage_activity
+from app.services.chat_service import build_stage_chat_context
 from app.services.github_service import GitHubClient, GitHubService
+from app.core.database import AsyncSessionLocal
 from app.core.security import decrypt_token
 from app.prompts import (
     DEVELOP_TICKETS_SYSTEM_PROMPT,
@@ -27,19 +30,103 @@ from app.prompts import (
     IMPLEMENT_TICKET_SYSTEM_PROMPT,
     IMPLEMENT_TICKET_USER_PROMPT,
 )
-from app.utils.chat_context import (
-    get_all_chat_history,
-    format_all_chat_history_for_prompt,
-    count_chat_messages
-)
+from app.utils import json_io
+from app.utils.text import prefixed_lines
+from app.utils.chat_context import count_chat_messages
+
+
+logger = logging.getLogger(__name__)
+
+# Ticket prompt field filled from the latest artifact of each type
+_TICKET_PROMPT_FIELDS = {
+    ArtifactType.PROBLEM_STATEMENT: "problem_statement",
+    ArtifactType.STAKEHOLDER_ANALYSIS: "stakeholder_analysis",
+    ArtifactType.BRD: "brd_content",
+    ArtifactType.USER_STORIES: "user_stories",
+    ArtifactType.ARCHITECTURE: "architecture",
+}
+
+
+# Tokens of raw (unsummarized) chat turns sent with the ticket prompt; it
+# spans four stages, so it gets twice the Define budget
+DEVELOP_CHAT_TOKEN_BUDGET = 4000
+
+# Ticket prompt followed by the formatted chat history
+_TICKETS_USER_PROMPT_WITH_CHAT = DEVELOP_TICKETS_USER_PROMPT + "{chat_context}"
+
+# Leading characters of the architecture document included in the
+# implementation prompt; only this much is read from the database
+ARCHITECTURE_PROMPT_CHARS = 3000
+
+# A pending or in-progress implementation job older than this is treated as
+# abandoned (e.g. its worker restarted) and no longer blocks a new one
+IMPLEMENTATION_JOB_TIMEOUT = timedelta(minutes=30)
+
+
+def _find_ticket(tickets_data: Dict[str, Any], ticket_key: str) -> Dict[str, Any]:
+    """
+    Find a ticket by key, stopping at the first match.
+    
+    Each request parses the tickets once and looks up a single key, so a
+    short-circuiting scan is cheaper than building a key index first.
+    
+    Args:
+        tickets_data: Parsed tickets artifact content
+        ticket_key: Key of the ticket (e.g., "DEV-101")
+        
+    Returns:
+        The ticket dict (mutable; part of tickets_data)
+        
+    Raises:
+        HTTPException: If no ticket has the key
+    """
+    ticket = next(
+        (ticket for ticket in tickets_data.get("tickets", []) if ticket["key"] == ticket_key),
+        None
+    )
+    if ticket is None:
+        raise HTTPException(status_code=404, detail=f"Ticket {ticket_key} not found")
+    return ticket
+
+
+def _claim_implementation_job(ticket: Dict[str, Any], job: Dict[str, Any]) -> None:
+    """
+    Set a new implementation job on a ticket unless one is still active.
+    
+    Args:
+        ticket: The ticket dict (updated in place)
+        job: Job state to record
+        
+    Raises:
+        HTTPException: 409 if a pending or in-progress job started less than
+            IMPLEMENTATION_JOB_TIMEOUT ago
+    """
+    active = ticket.get("implementation_job", {})
+    if active.get("status") in ("pending", "in_progress"):
+        since = active.get("started_at") or active.get("queued_at")
+        if since and datetime.utcnow() - datetime.fromisoformat(since) < IMPLEMENTATION_JOB_TIMEOUT:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Implementation of {ticket['key']} is already {active['status']}"
+            )
+    ticket["implementation_job"] = job
 
 
 class DevelopService:
     """Service for Develop stage operations."""
     
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        session_factory: async_sessionmaker = AsyncSessionLocal
+    ):
         self.db = db
+        # Opens short-lived sessions for read-only lookups run concurrently
+        # with queries on self.db (one session cannot run two queries at once)
+        self.session_factory = session_factory
         self.ai_service = AIService()
+        # project_id -> stages_config, read at most once per request
+        self._project_configs: Dict[UUID, Optional[Dict[str, Any]]] = {}
     
     async def generate_tickets(
         self,
@@ -59,9 +146,9 @@ class DevelopService:
         # Get project
         project_uuid = UUID(project_id)
         result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
+            select(Project.name, Project.stages_config).where(Project.id == project_uuid)
         )
-        project = result.scalar_one_or_none()
+        project = result.one_or_none()
         
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -74,62 +161,24 @@ class DevelopService:
                 detail="GitHub must be configured before generating tickets"
             )
         
-        # Fetch ALL chat history from all stages using shared utility
-        all_chat_history = await get_all_chat_history(
-            self.db,
-            project_id,
-            stages=[StageType.DISCOVER, StageType.DEFINE, StageType.DESIGN, StageType.DEVELOP],
-            limit_per_stage=75
+        # The chat context (which may first refresh stage summaries with AI
+        # calls) is built on its own session while the artifacts of previous
+        # stages load on self.db
+        (chat_context, all_chat_history), artifact_contents = await asyncio.gather(
+            self._build_chat_context(project_id),
+            self._get_latest_artifact_contents(project_id)
         )
         
-        # Format chat history with strong emphasis
-        chat_context = format_all_chat_history_for_prompt(all_chat_history)
-        
         # Get stats for logging
         chat_stats = count_chat_messages(all_chat_history)
         total_chat_messages = chat_stats["total_messages"]
         
-        print(f"🎫 Generating development tickets for project: {project.name}")
-        print(f"   └── Chat context: {total_chat_messages} messages from all SDLC stages")
-        for stage, count in chat_stats["by_stage"].items():
-            if count > 0:
-                print(f"       • {stage}: {count} messages")
-        
-        # Gather all artifacts from previous stages - get latest version of each type
-        artifacts_result = await self.db.execute(
-            select(Artifact).where(Artifact.project_id == project_id)
-            .order_by(desc(Artifact.created_at))
-        )
-        all_artifacts = artifacts_result.scalars().all()
-        
-        # Organize artifacts by type - use only the LATEST of each type
-        artifact_contents = {
-            "problem_statement": "",
-            "stakeholder_analysis": "",
-            "brd_content": "",
-            "user_stories": "",
-            "architecture": ""
-        }
-        
-        # Track which types we've already captured (to get only latest version)
-        captured_types = set()
-        
-        for artifact in all_artifacts:
-            if artifact.artifact_type == ArtifactType.PROBLEM_STATEMENT and ArtifactType.PROBLEM_STATEMENT not in captured_types:
-                artifact_contents["problem_statement"] = artifact.content
-                captured_types.add(ArtifactType.PROBLEM_STATEMENT)
-            elif artifact.artifact_type == ArtifactType.STAKEHOLDER_ANALYSIS and ArtifactType.STAKEHOLDER_ANALYSIS not in captured_types:
-                artifact_contents["stakeholder_analysis"] = artifact.content
-                captured_types.add(ArtifactType.STAKEHOLDER_ANALYSIS)
-            elif artifact.artifact_type == ArtifactType.BRD and ArtifactType.BRD not in captured_types:
-                artifact_contents["brd_content"] = artifact.content
-                captured_types.add(ArtifactType.BRD)
-            elif artifact.artifact_type == ArtifactType.USER_STORIES and ArtifactType.USER_STORIES not in captured_types:
-                artifact_contents["user_stories"] = artifact.content
-                captured_types.add(ArtifactType.USER_STORIES)
-            elif artifact.artifact_type == ArtifactType.ARCHITECTURE and ArtifactType.ARCHITECTURE not in captured_types:
-                artifact_contents["architecture"] = artifact.content
-                captured_types.add(ArtifactType.ARCHITECTURE)
+        logger.info("🎫 Generating development tickets for project: %s", project.name)
+        logger.info("   └── Chat context: %d messages from all SDLC stages", total_chat_messages)
+        if logger.isEnabledFor(logging.INFO):
+            for stage, count in chat_stats["by_stage"].items():
+                if count > 0:
+                    logger.info("       • %s: %d messages", stage, count)
         
         # Check we have minimum required artifacts
         if not artifact_contents["brd_content"] and not artifact_contents["user_stories"]:
@@ -144,11 +193,12 @@ class DevelopService:
                 detail="Missing architecture. Complete Design stage first."
             )
         
-        # Build prompt with chat history context
-        user_prompt = DEVELOP_TICKETS_USER_PROMPT.format(**artifact_contents)
-        
-        # Append chat history to provide full context
-        user_prompt += chat_context
+        # Build prompt with chat history context appended for full context.
+        # Rendered in a single format_map pass straight from the dict, so the
+        # prompt is allocated once at its final size.
+        user_prompt = _TICKETS_USER_PROMPT_WITH_CHAT.format_map(
+            {**artifact_contents, "chat_context": chat_context}
+        )
         
         # Call Azure OpenAI
         response_text = await self.ai_service.generate(
@@ -158,31 +208,32 @@ class DevelopService:
         )
         
         # Clean JSON response
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
+        response_text = json_io.strip_code_fence(response_text)
         
         try:
-            tickets_data = json.loads(response_text.strip())
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parse error: {e}")
-            print(f"Response was: {response_text[:500]}")
+            tickets_data = json_io.loads(response_text)
+        except json_io.JSONDecodeError as e:
+            logger.error("❌ JSON parse error: %s", e)
+            logger.error("Response was: %s", response_text[:500])
             raise HTTPException(status_code=500, detail="Failed to parse AI response as JSON")
         
-        # Create artifact to store tickets
+        tickets = tickets_data.get("tickets", [])
+        
+        # Create artifact to store tickets. Content stays indented JSON text: the
+        # workspace file explorer shows artifact content verbatim, and the
+        # Text column keeps SQLite and Postgres on the same schema. The id is
+        # assigned here so the response never needs the row reloaded.
         tickets_artifact = Artifact(
+            id=uuid4(),
             project_id=project_id,
             stage=StageType.DEVELOP,
             artifact_type=ArtifactType.CODE,
             name="Development Tickets",
-            content=json.dumps(tickets_data, indent=2),
+            content=json_io.dumps(tickets_data, indent=True),
             created_by=created_by,
             meta_data={
                 "type": "development_tickets",
-                "total_tickets": len(tickets_data.get("tickets", [])),
+                "total_tickets": len(tickets),
                 "generated_at": datetime.utcnow().isoformat()
             }
         )
@@ -193,7 +244,7 @@ class DevelopService:
             project_id=project_id,
             stage=StageType.DEVELOP,
             author_id=created_by,
-            message=f"Generated {len(tickets_data.get('tickets', []))} development tickets",
+            message=f"Generated {len(tickets)} development tickets",
             changes={
                 "added": ["Development Tickets"],
                 "modified": [],
@@ -203,51 +254,217 @@ class DevelopService:
         self.db.add(commit)
         
         # Log activity
-        await log_activity(
+        stage_activity(
             self.db,
             project_id,
             created_by or "system",
             "tickets_generated",
             {
-                "total_tickets": len(tickets_data.get("tickets", [])),
+                "total_tickets": len(tickets),
                 "summary": tickets_data.get("summary", {})
             }
         )
         
         await self.db.commit()
-        await self.db.refresh(tickets_artifact)
         
-        print(f"✅ Generated {len(tickets_data.get('tickets', []))} tickets")
+        logger.info("✅ Generated %d tickets", len(tickets))
         
         return {
             "status": "success",
-            "message": f"Generated {len(tickets_data.get('tickets', []))} development tickets",
+            "message": f"Generated {len(tickets)} development tickets",
             "artifact_id": str(tickets_artifact.id),
-            "tickets": tickets_data.get("tickets", []),
+            "tickets": tickets,
             "summary": tickets_data.get("summary", {})
         }
     
-    async def get_tickets(self, project_id: str) -> Dict[str, Any]:
+    async def _get_latest_artifact_contents(self, project_id: str) -> Dict[str, str]:
         """
-        Get existing development tickets for a project.
+        Get the content of the latest artifact of each ticket-prompt type.
+        
+        Ranks rows per type in SQL so only one row per type is transferred;
+        ROW_NUMBER() is used rather than DISTINCT ON to stay portable to SQLite.
         
         Args:
             project_id: ID of the project
             
         Returns:
-            Dictionary containing tickets and summary
+            Dictionary of prompt field -> content ("" when the type is missing)
         """
-        # Find tickets artifact - get LATEST version with limit(1)
-        result = await self.db.execute(
-            select(Artifact).where(
+        ranked = (
+            select(
+                Artifact.artifact_type,
+                Artifact.content,
+                func.row_number().over(
+                    partition_by=Artifact.artifact_type,
+                    order_by=desc(Artifact.created_at)
+                ).label("row_rank")
+            )
+            .where(
                 and_(
                     Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DEVELOP,
-                    Artifact.name == "Development Tickets"
+                    Artifact.artifact_type.in_(_TICKET_PROMPT_FIELDS)
                 )
-            ).order_by(desc(Artifact.created_at)).limit(1)
+            )
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(ranked.c.artifact_type, ranked.c.content).where(ranked.c.row_rank == 1)
         )
-        artifact = result.scalars().first()
+        
+        artifact_contents = dict.fromkeys(_TICKET_PROMPT_FIELDS.values(), "")
+        for row in result.all():
+            artifact_contents[_TICKET_PROMPT_FIELDS[row.artifact_type]] = row.content
+        return artifact_contents
+    
+    async def _load_latest_tickets_artifact(
+        self,
+        project_id: str,
+        for_update: bool = False
+    ) -> Optional[Artifact]:
+        """
+        Load the latest Development Tickets artifact of a project.
+        
+        Args:
+            project_id: ID of the project
+            for_update: Lock the row (where supported) and re-read its stored
+                state, even if the session already holds the artifact
+            
+        Returns:
+            The artifact, or None if tickets were never generated
+        """
+        query = select(Artifact).where(
+            and_(
+                Artifact.project_id == project_id,
+                Artifact.stage == StageType.DEVELOP,
+                Artifact.name == "Development Tickets"
+            )
+        ).order_by(desc(Artifact.created_at)).limit(1)
+        if for_update:
+            query = query.with_for_update().execution_options(populate_existing=True)
+        
+        result = await self.db.execute(query)
+        return result.scalars().first()
+    
+    async def _update_ticket(
+        self,
+        project_id: str,
+        ticket_key: str,
+        update: Callable[[Dict[str, Any]], None]
+    ) -> Dict[str, Any]:
+        """
+        Apply an update to one ticket of the latest stored tickets and commit.
+        
+        The tickets are re-read right before the write, so changes made to
+        other tickets meanwhile (e.g. while an implementation ran) are kept.
+        
+        Args:
+            project_id: ID of the project
+            ticket_key: Key of the ticket
+            update: Mutates the ticket dict in place; may raise HTTPException
+                to reject the change
+            
+        Returns:
+            The updated ticket
+        """
+        tickets_artifact = await self._load_latest_tickets_artifact(project_id, for_update=True)
+        if not tickets_artifact:
+            raise HTTPException(status_code=404, detail="Tickets not found")
+        
+        tickets_data = json_io.loads(tickets_artifact.content)
+        ticket = _find_ticket(tickets_data, ticket_key)
+        update(ticket)
+        tickets_artifact.content = json_io.dumps(tickets_data, indent=True)
+        await self.db.commit()
+        return ticket
+    
+    async def _load_project_config(self, project_uuid: UUID) -> Optional[Dict[str, Any]]:
+        """
+        Load a project's stages_config on a short-lived session.
+        
+        Memoized on the service, i.e. for one request: a config saved or
+        deleted by any worker is seen by the next request. Callers must not
+        mutate the result.
+        
+        Args:
+            project_uuid: ID of the project
+            
+        Returns:
+            The stages_config dict, or None if the project does not exist
+        """
+        if project_uuid in self._project_configs:
+            return self._project_configs[project_uuid]
+        
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Project.stages_config).where(Project.id == project_uuid)
+            )
+            project = result.one_or_none()
+        
+        stages_config = (project.stages_config or {}) if project else None
+        self._project_configs[project_uuid] = stages_config
+        return stages_config
+    
+    async def _build_chat_context(
+        self,
+        project_id: str
+    ) -> Tuple[str, Dict[StageType, List[Dict[str, str]]]]:
+        """
+        Build the ticket prompt's chat context on a short-lived session.
+        
+        Chat from all stages: older turns of each stage come from its rolling
+        summary, newer turns are sent raw within DEVELOP_CHAT_TOKEN_BUDGET.
+        
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            Tuple of (formatted chat context, raw turns included by stage)
+        """
+        async with self.session_factory() as session:
+            return await build_stage_chat_context(
+                session,
+                project_id,
+                [StageType.DISCOVER, StageType.DEFINE, StageType.DESIGN, StageType.DEVELOP],
+                DEVELOP_CHAT_TOKEN_BUDGET
+            )
+    
+    async def _load_latest_architecture_excerpt(self, project_id: str) -> Optional[str]:
+        """
+        Load the start of the latest architecture document on a short-lived session.
+        
+        The excerpt is cut in SQL so the full document is never transferred.
+        
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            First ARCHITECTURE_PROMPT_CHARS characters of the architecture
+            markdown, or None if Design was not completed
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(func.substr(Artifact.content, 1, ARCHITECTURE_PROMPT_CHARS)).where(
+                    and_(
+                        Artifact.project_id == project_id,
+                        Artifact.stage == StageType.DESIGN,
+                        Artifact.artifact_type == ArtifactType.ARCHITECTURE
+                    )
+                ).order_by(desc(Artifact.created_at)).limit(1)
+            )
+            return result.scalars().first()
+    
+    async def get_tickets(self, project_id: str) -> Dict[str, Any]:
+        """
+        Get existing development tickets for a project.
+        
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            Dictionary containing tickets and summary
+        """
+        # Find tickets artifact - LATEST version
+        artifact = await self._load_latest_tickets_artifact(project_id)
         
         if not artifact:
             return {
@@ -257,8 +474,8 @@ class DevelopService:
             }
         
         try:
-            tickets_data = json.loads(artifact.content)
-        except json.JSONDecodeError:
+            tickets_data = json_io.loads(artifact.content)
+        except json_io.JSONDecodeError:
             tickets_data = {"tickets": [], "summary": {}}
         
         return {
@@ -292,17 +509,8 @@ class DevelopService:
                 detail="Invalid status. Must be: todo, in_progress, or done"
             )
         
-        # Find tickets artifact - get LATEST version with limit(1)
-        result = await self.db.execute(
-            select(Artifact).where(
-                and_(
-                    Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DEVELOP,
-                    Artifact.name == "Development Tickets"
-                )
-            ).order_by(desc(Artifact.created_at)).limit(1)
-        )
-        artifact = result.scalars().first()
+        # Find tickets artifact - LATEST version
+        artifact = await self._load_latest_tickets_artifact(project_id)
         
         if not artifact:
             raise HTTPException(
@@ -312,25 +520,27 @@ class DevelopService:
         
         # Parse and update ticket status
         try:
-            tickets_data = json.loads(artifact.content)
-        except json.JSONDecodeError:
+            tickets_data = json_io.loads(artifact.content)
+        except json_io.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Failed to parse tickets data")
         
         # Find and update the specific ticket
-        ticket_found = False
-        updated_ticket = None
-        for ticket in tickets_data.get("tickets", []):
-            if ticket["key"] == ticket_key:
-                ticket["status"] = status
-                ticket_found = True
-                updated_ticket = ticket
-                break
-        
-        if not ticket_found:
-            raise HTTPException(status_code=404, detail=f"Ticket {ticket_key} not found")
+        updated_ticket = _find_ticket(tickets_data, ticket_key)
+        
+        # Kanban drags within a column re-send the current status; skip the
+        # full document rewrite and activity row when nothing changes
+        if updated_ticket.get("status") == status:
+            return {
+                "status": "success",
+                "ticket_key": ticket_key,
+                "new_status": status,
+                "ticket": updated_ticket
+            }
+        
+        updated_ticket["status"] = status
         
         # Save updated content
-        artifact.content = json.dumps(tickets_data, indent=2)
+        artifact.content = json_io.dumps(tickets_data, indent=True)
         
         # Update meta_data
         meta = artifact.meta_data or {}
@@ -342,7 +552,7 @@ class DevelopService:
         flag_modified(artifact, "meta_data")
         
         # Log activity
-        await log_activity(
+        stage_activity(
             self.db,
             project_id,
             "user",
@@ -350,7 +560,7 @@ class DevelopService:
             {
                 "ticket_key": ticket_key,
                 "new_status": status,
-                "ticket_summary": updated_ticket.get("summary", "")[:50] if updated_ticket else ""
+                "ticket_summary": updated_ticket.get("summary", "")[:50]
             }
         )
         
@@ -379,17 +589,12 @@ class DevelopService:
             Dictionary containing ticket and GitHub info
         """
         # Get project
-        project_uuid = UUID(project_id)
-        project_result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = project_result.scalar_one_or_none()
+        stages_config = await self._load_project_config(UUID(project_id))
         
-        if not project:
+        if stages_config is None:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Check GitHub is configured
-        stages_config = project.stages_config or {}
         github_config = stages_config.get("github")
         
         if not github_config:
@@ -398,41 +603,25 @@ class DevelopService:
                 detail="GitHub not configured. Please configure GitHub first."
             )
         
-        # Find tickets artifact - get LATEST version with limit(1)
-        result = await self.db.execute(
-            select(Artifact).where(
-                and_(
-                    Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DEVELOP,
-                    Artifact.name == "Development Tickets"
-                )
-            ).order_by(desc(Artifact.created_at)).limit(1)
-        )
-        artifact = result.scalars().first()
+        # Find tickets artifact - LATEST version
+        artifact = await self._load_latest_tickets_artifact(project_id)
         
         if not artifact:
             raise HTTPException(status_code=404, detail="Tickets not found")
         
         # Parse tickets
-        tickets_data = json.loads(artifact.content)
+        tickets_data = json_io.loads(artifact.content)
         
         # Find the specific ticket
-        target_ticket = None
-        for ticket in tickets_data.get("tickets", []):
-            if ticket["key"] == ticket_key:
-                target_ticket = ticket
-                ticket["status"] = "in_progress"
-                break
-        
-        if not target_ticket:
-            raise HTTPException(status_code=404, detail=f"Ticket {ticket_key} not found")
+        target_ticket = _find_ticket(tickets_data, ticket_key)
+        target_ticket["status"] = "in_progress"
         
         # Save updated status
-        artifact.content = json.dumps(tickets_data, indent=2)
+        artifact.content = json_io.dumps(tickets_data, indent=True)
         flag_modified(artifact, "content")
         
         # Log activity
-        await log_activity(
+        stage_activity(
             self.db,
             project_id,
             "user",
@@ -464,9 +653,9 @@ class DevelopService:
     ) -> Dict[str, Any]:
         """
         Full ticket implementation workflow:
-        1. Create feature branch
-        2. Create GitHub Issue
-        3. Generate code with AI
+        1. Generate code with AI
+        2. Create feature branch
+        3. Create GitHub Issue
         4. Commit files to branch
         5. Create Pull Request
         
@@ -478,18 +667,19 @@ class DevelopService:
         Returns:
             Dictionary containing implementation results
         """
-        # Get project with GitHub config
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
+        # Project, tickets and architecture are fetched concurrently. The
+        # read-only lookups use their own sessions; the tickets artifact stays
+        # on self.db because its status is updated and committed below.
+        stages_config, tickets_artifact, architecture_excerpt = await asyncio.gather(
+            self._load_project_config(UUID(project_id)),
+            self._load_latest_tickets_artifact(project_id),
+            self._load_latest_architecture_excerpt(project_id)
         )
-        project = result.scalar_one_or_none()
         
-        if not project:
+        if stages_config is None:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Get GitHub credentials
-        stages_config = project.stages_config or {}
         github_config = stages_config.get("github")
         if not github_config:
             raise HTTPException(status_code=400, detail="GitHub not configured")
@@ -498,111 +688,85 @@ class DevelopService:
         repo = github_config["repo"]
         default_branch = github_config.get("default_branch", "main")
         
-        # Get ticket data - LATEST version with limit(1)
-        tickets_result = await self.db.execute(
-            select(Artifact).where(
-                and_(
-                    Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DEVELOP,
-                    Artifact.name == "Development Tickets"
-                )
-            ).order_by(desc(Artifact.created_at)).limit(1)
-        )
-        tickets_artifact = tickets_result.scalars().first()
         if not tickets_artifact:
             raise HTTPException(status_code=404, detail="Tickets not found")
         
-        tickets_data = json.loads(tickets_artifact.content)
-        ticket = None
-        for t in tickets_data.get("tickets", []):
-            if t["key"] == ticket_key:
-                ticket = t
-                break
+        tickets_data = json_io.loads(tickets_artifact.content)
+        ticket = _find_ticket(tickets_data, ticket_key)
         
-        if not ticket:
-            raise HTTPException(status_code=404, detail=f"Ticket {ticket_key} not found")
-        
-        # Get architecture for context - LATEST version with limit(1)
-        arch_result = await self.db.execute(
-            select(Artifact).where(
-                and_(
-                    Artifact.project_id == project_id,
-                    Artifact.stage == StageType.DESIGN,
-                    Artifact.artifact_type == ArtifactType.ARCHITECTURE
-                )
-            ).order_by(desc(Artifact.created_at)).limit(1)
-        )
-        arch_artifact = arch_result.scalars().first()
-        architecture_content = arch_artifact.content if arch_artifact else "No architecture document available"
+        if architecture_excerpt is None:
+            architecture_excerpt = "No architecture document available"
         
         # Initialize GitHub client
         github = GitHubClient(token, repo)
         
         try:
-            # 1. CREATE BRANCH
             timestamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
             branch_name = f"feature/{ticket['key'].lower()}-{timestamp}"
-            print(f"🌿 Creating branch: {branch_name}")
-            
-            await github.create_branch(branch_name, default_branch)
-            
-            # 2. CREATE GITHUB ISSUE
-            print(f"📋 Creating GitHub Issue...")
-            
-            issue_title = f"[{ticket['key']}] {ticket['summary']}"
-            issue_body = self._build_issue_body(ticket, branch_name)
-            
-            labels = ["automated", ticket['type'], f"priority:{ticket['priority'].lower()}"]
-            issue = await github.create_issue(issue_title, issue_body, labels)
-            issue_number = issue["number"]
-            issue_url = issue["html_url"]
-            print(f"✅ Created Issue #{issue_number}")
-            
-            # 3. GENERATE CODE WITH AI
-            print(f"🤖 Generating code...")
             
+            # 1. GENERATE CODE WITH AI
             user_prompt = IMPLEMENT_TICKET_USER_PROMPT.format(
                 ticket_key=ticket['key'],
                 summary=ticket['summary'],
                 type=ticket['type'],
                 priority=ticket['priority'],
                 description=ticket['description'],
-                acceptance_criteria=chr(10).join(f"- {ac}" for ac in ticket['acceptance_criteria']),
+                acceptance_criteria=prefixed_lines(ticket['acceptance_criteria'], "- "),
                 tech_stack=", ".join(ticket['tech_stack']),
                 dependencies=", ".join(ticket.get('dependencies', [])) or "None",
-                architecture=architecture_content[:3000]
-            )
-            
-            response_text = await self.ai_service.generate(
-                IMPLEMENT_TICKET_SYSTEM_PROMPT,
-                user_prompt,
-                max_tokens=4000
+                architecture=architecture_excerpt
             )
             
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
+            # Generation overlaps only the read-only lookup of the base branch;
+            # the branch and issue are created once usable code exists, so a
+            # failed generation leaves nothing behind on GitHub. A TaskGroup
+            # cancels the other call when either one fails.
+            logger.info("🤖 Generating code...")
+            try:
+                async with asyncio.TaskGroup() as group:
+                    group.create_task(github.get_branch_sha(default_branch))
+                    generation = group.create_task(self.ai_service.generate(
+                        IMPLEMENT_TICKET_SYSTEM_PROMPT,
+                        user_prompt,
+                        max_tokens=4000
+                    ))
+            except ExceptionGroup as errors:
+                raise errors.exceptions[0]
             
-            generated = json.loads(response_text)
+            generated = json_io.loads(json_io.strip_code_fence(generation.result()))
             files_to_commit = {f["path"]: f["content"] for f in generated.get("files", [])}
             
             if not files_to_commit:
                 raise ValueError("No files generated")
             
-            print(f"✅ Generated {len(files_to_commit)} files")
+            # 2. CREATE BRANCH (from the SHA looked up above)
+            logger.info("🌿 Creating branch: %s", branch_name)
+            await github.create_branch(branch_name, default_branch)
+            
+            # 3. CREATE GITHUB ISSUE
+            logger.info("📋 Creating GitHub Issue...")
+            issue_title = f"[{ticket['key']}] {ticket['summary']}"
+            issue_body = self._build_issue_body(ticket, branch_name)
+            labels = ["automated", ticket['type'], f"priority:{ticket['priority'].lower()}"]
+            issue = await github.create_issue(issue_title, issue_body, labels)
+            issue_number = issue["number"]
+            issue_url = issue["html_url"]
+            logger.info("✅ Created Issue #%s", issue_number)
+            
+            file_paths = list(files_to_commit)
+            logger.info("✅ Generated %d files", len(file_paths))
             
             # 4. COMMIT FILES
-            print(f"📝 Committing files...")
+            logger.info("📝 Committing files...")
             
-            commit_message = self._build_commit_message(ticket, generated, issue_number, files_to_commit)
+            commit_message = self._build_commit_message(ticket, generated, issue_number, file_paths)
             
             commit = await github.create_files_batch(files_to_commit, commit_message, branch_name)
             commit_sha = commit.get("sha", "")[:7]
-            print(f"✅ Committed (SHA: {commit_sha})")
+            logger.info("✅ Committed (SHA: %s)", commit_sha)
             
             # 5. CREATE PULL REQUEST
-            print(f"🔀 Creating Pull Request...")
+            logger.info("🔀 Creating Pull Request...")
             
             pr_title = f"[{ticket['key']}] {ticket['summary']}"
             pr_body = self._build_pr_body(ticket, generated, issue_number)
@@ -610,32 +774,34 @@ class DevelopService:
             pr = await github.create_pull_request(pr_title, pr_body, branch_name, default_branch)
             pr_number = pr["number"]
             pr_url = pr["html_url"]
-            print(f"✅ Created PR #{pr_number}")
+            logger.info("✅ Created PR #%s", pr_number)
             
             # 6. ADD COMMENT TO ISSUE
             await github.add_issue_comment(
                 issue_number,
-                self._build_issue_comment(pr_number, pr_url, branch_name, commit_sha, files_to_commit)
+                self._build_issue_comment(pr_number, pr_url, branch_name, commit_sha, file_paths)
             )
             
             # 7. UPDATE TICKET STATUS
-            ticket["status"] = "in_progress"
-            ticket["implementation"] = {
+            implementation = {
                 "branch": branch_name,
                 "issue_number": issue_number,
                 "issue_url": issue_url,
                 "pr_number": pr_number,
                 "pr_url": pr_url,
                 "commit_sha": commit_sha,
-                "files": list(files_to_commit.keys()),
+                "files": file_paths,
                 "implemented_at": datetime.utcnow().isoformat()
             }
             
-            tickets_artifact.content = json.dumps(tickets_data, indent=2)
-            flag_modified(tickets_artifact, "content")
+            def record_implementation(latest: Dict[str, Any]) -> None:
+                latest["status"] = "in_progress"
+                latest["implementation"] = implementation
+                if "implementation_job" in latest:
+                    latest["implementation_job"]["status"] = "completed"
             
             # Log activity
-            await log_activity(
+            stage_activity(
                 self.db, project_id, created_by,
                 "ticket_implemented",
                 {
@@ -643,13 +809,15 @@ class DevelopService:
                     "branch": branch_name,
                     "issue_number": issue_number,
                     "pr_number": pr_number,
-                    "files_created": list(files_to_commit.keys())
+                    "files_created": file_paths
                 }
             )
             
-            await self.db.commit()
+            # The tickets loaded above are minutes old by now; only this
+            # ticket's fields are written onto the latest stored copy
+            await self._update_ticket(project_id, ticket_key, record_implementation)
             
-            print(f"🎉 Implementation complete for {ticket['key']}")
+            logger.info("🎉 Implementation complete for %s", ticket["key"])
             
             return {
                 "status": "success",
@@ -659,18 +827,145 @@ class DevelopService:
                 "issue_url": issue_url,
                 "pr_number": pr_number,
                 "pr_url": pr_url,
-                "files_created": list(files_to_commit.keys()),
+                "files_created": file_paths,
                 "commit_sha": commit_sha,
                 "summary": generated.get("summary", "")
             }
             
         except Exception as e:
             error_msg = f"Implementation failed: {str(e)}"
-            print(f"❌ {error_msg}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ %s", error_msg)
             raise HTTPException(status_code=500, detail=error_msg)
     
+    async def queue_ticket_implementation(
+        self,
+        project_id: str,
+        ticket_key: str,
+        background_tasks: BackgroundTasks,
+        created_by: str = "user"
+    ) -> Dict[str, Any]:
+        """
+        Accept a ticket implementation and run it after the response is sent.
+        
+        The job state is kept on the ticket as "implementation_job"
+        (pending -> in_progress -> completed | failed), so clients poll the
+        tickets endpoint. A ticket whose job is pending or in progress cannot
+        be queued again until the job is older than IMPLEMENTATION_JOB_TIMEOUT.
+        
+        Args:
+            project_id: ID of the project
+            ticket_key: Key of the ticket
+            background_tasks: Request background tasks to run the job on
+            created_by: Creator identifier
+            
+        Returns:
+            Dictionary containing the job id
+            
+        Raises:
+            HTTPException: 409 if the ticket already has an active job
+        """
+        job = {
+            "job_id": str(uuid4()),
+            "status": "pending",
+            "queued_at": datetime.utcnow().isoformat()
+        }
+        await self._update_ticket(
+            project_id, ticket_key, lambda ticket: _claim_implementation_job(ticket, job)
+        )
+        
+        background_tasks.add_task(
+            run_ticket_implementation_job, project_id, ticket_key, created_by
+        )
+        
+        return {
+            "status": "accepted",
+            "job_id": job["job_id"],
+            "ticket_key": ticket_key
+        }
+    
+    async def implement_ticket_exclusive(
+        self,
+        project_id: str,
+        ticket_key: str,
+        created_by: str = "user"
+    ) -> Dict[str, Any]:
+        """
+        Run implement_ticket now, as an implementation job on the ticket.
+        
+        Applies the same active-job check as queue_ticket_implementation, so
+        a ticket is never implemented twice at once by either route.
+        
+        Args:
+            project_id: ID of the project
+            ticket_key: Key of the ticket
+            created_by: Creator identifier
+            
+        Returns:
+            Dictionary containing implementation results
+            
+        Raises:
+            HTTPException: 409 if the ticket already has an active job
+        """
+        now = datetime.utcnow().isoformat()
+        job = {"job_id": str(uuid4()), "status": "in_progress", "queued_at": now, "started_at": now}
+        await self._update_ticket(
+            project_id, ticket_key, lambda ticket: _claim_implementation_job(ticket, job)
+        )
+        return await self._run_implementation_job(project_id, ticket_key, created_by)
+    
+    async def _run_implementation_job(
+        self,
+        project_id: str,
+        ticket_key: str,
+        created_by: str,
+        start: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run implement_ticket for a claimed job, marking the job failed on error.
+        
+        Args:
+            project_id: ID of the project
+            ticket_key: Key of the ticket
+            created_by: Creator identifier
+            start: Job fields to set before the workflow starts, if any
+            
+        Returns:
+            Dictionary containing implementation results
+        """
+        try:
+            if start:
+                await self._update_implementation_job(project_id, ticket_key, start)
+            return await self.implement_ticket(project_id, ticket_key, created_by)
+        except Exception as e:
+            await self.db.rollback()
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            try:
+                await self._update_implementation_job(
+                    project_id, ticket_key, {"status": "failed", "error": error}
+                )
+            except Exception:
+                logger.exception("❌ Could not record failed implementation of %s", ticket_key)
+            raise
+    
+    async def _update_implementation_job(
+        self,
+        project_id: str,
+        ticket_key: str,
+        changes: Dict[str, Any]
+    ) -> None:
+        """
+        Merge changes into a ticket's implementation job state and commit.
+        
+        Args:
+            project_id: ID of the project
+            ticket_key: Key of the ticket
+            changes: Job fields to set on the ticket
+        """
+        def merge(ticket: Dict[str, Any]) -> None:
+            ticket["implementation_job"] = {**ticket.get("implementation_job", {}), **changes}
+        
+        await self._update_ticket(project_id, ticket_key, merge)
+    
     def _build_issue_body(self, ticket: dict, branch_name: str) -> str:
         """Build GitHub issue body."""
         return f"""## {ticket['key']}: {ticket['summary']}
@@ -679,7 +974,7 @@ class DevelopService:
 {ticket['description']}
 
 ### Acceptance Criteria
-{chr(10).join(f'- [ ] {ac}' for ac in ticket['acceptance_criteria'])}
+{prefixed_lines(ticket['acceptance_criteria'], '- [ ] ')}
 
 ### Technical Details
 | Field | Value |
@@ -701,7 +996,7 @@ class DevelopService:
         ticket: dict,
         generated: dict,
         issue_number: int,
-        files: dict
+        file_paths: List[str]
     ) -> str:
         """Build commit message."""
         return f"""feat({ticket['key']}): {ticket['summary']}
@@ -711,7 +1006,7 @@ class DevelopService:
 Closes #{issue_number}
 
 Files:
-{chr(10).join(f'- {f}' for f in files.keys())}
+{prefixed_lines(file_paths, '- ')}
 """
     
     def _build_pr_body(self, ticket: dict, generated: dict, issue_number: int) -> str:
@@ -722,7 +1017,7 @@ Files:
 Closes #{issue_number}
 
 ## Changes
-{chr(10).join(f'- `{f["path"]}`: {f.get("description", "Implementation")}' for f in generated.get("files", []))}
+{prefixed_lines((f'`{f["path"]}`: {f.get("description", "Implementation")}' for f in generated.get("files", [])), '- ')}
 
 ## Ticket Details
 - **Type:** {ticket['type']}
@@ -730,10 +1025,10 @@ Closes #{issue_number}
 - **Estimated Hours:** {ticket['estimated_hours']}
 
 ## Acceptance Criteria
-{chr(10).join(f'- [ ] {ac}' for ac in ticket['acceptance_criteria'])}
+{prefixed_lines(ticket['acceptance_criteria'], '- [ ] ')}
 
 ## Implementation Notes
-{chr(10).join(f'- {n}' for n in generated.get("notes", ["No additional notes"]))}
+{prefixed_lines(generated.get("notes", ["No additional notes"]), '- ')}
 
 ---
 *Auto-generated by SDLC Studio*
@@ -745,7 +1040,7 @@ Closes #{issue_number}
         pr_url: str,
         branch_name: str,
         commit_sha: str,
-        files: dict
+        file_paths: List[str]
     ) -> str:
         """Build issue comment after PR creation."""
         return f"""🔗 **Pull Request Created**
@@ -755,5 +1050,33 @@ Branch: `{branch_name}`
 Commit: `{commit_sha}`
 
 ### Generated Files
-{chr(10).join(f'- `{f}`' for f in files.keys())}
-"""
\ No newline at end of file
+{prefixed_lines((f'`{f}`' for f in file_paths), '- ')}
+"""
+
+
+async def run_ticket_implementation_job(
+    project_id: str,
+    ticket_key: str,
+    created_by: str = "user"
+) -> None:
+    """
+    Run a queued ticket implementation in a dedicated session.
+    
+    Intended for FastAPI BackgroundTasks. On failure the ticket's job is
+    marked failed with the error, since there is no caller to raise to.
+    
+    Args:
+        project_id: ID of the project
+        ticket_key: Key of the ticket
+        created_by: Creator identifier
+    """
+    async with AsyncSessionLocal() as session:
+        service = DevelopService(session)
+        try:
+            await service._run_implementation_job(
+                project_id, ticket_key, created_by,
+                start={"status": "in_progress", "started_at": datetime.utcnow().isoformat()}
+            )
+        except Exception:
+            # Already recorded on the ticket's job
+            pass
@@ -3,19 +3,29 @@
 Service for the Discover stage - Problem Statement and Stakeholder Analysis generation.
 """
 
-from typing import Any, Dict, List, Optional
-from uuid import UUID
+import logging
+import re
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from uuid import UUID, uuid4
 
-from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.project import Project
 from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
-from app.services.ai_service import generate_with_openai
-from app.services.activity_service import log_activity
-from app.prompts import PROBLEM_STATEMENT_PROMPT, STAKEHOLDER_ANALYSIS_PROMPT
+from app.services.ai_service import (
+    generate_with_openai,
+    generate_with_openai_stream,
+    generate_with_openai_usage,
+)
+from app.services.activity_service import stage_activity
+from app.prompts import (
+    PROBLEM_STATEMENT_PROMPT,
+    STAKEHOLDER_ANALYSIS_PROMPT,
+    PROBLEM_AND_STAKEHOLDERS_PROMPT,
+)
 from app.utils.chat_context import (
     get_chat_history_for_stage,
     format_chat_history_for_prompt,
@@ -23,6 +33,40 @@ from app.utils.chat_context import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+# Max tokens for the single call that writes both Discover documents
+COMBINED_MAX_TOKENS = 6000
+
+# Splits the combined response into its problem and stakeholder sections
+_COMBINED_OUTPUT_RE = re.compile(
+    r"<<<PROBLEM>>>(.*?)<<<END_PROBLEM>>>\s*<<<STAKEHOLDERS>>>(.*?)<<<END_STAKEHOLDERS>>>",
+    re.DOTALL
+)
+
+# The problem section alone, kept when the stakeholder part of a reply is cut off
+_COMBINED_PROBLEM_RE = re.compile(r"<<<PROBLEM>>>(.*?)<<<END_PROBLEM>>>", re.DOTALL)
+
+
+_SEP = "=" * 60
+
+# Fixed text around the formatted Discover chat history ({chat}) in both prompts
+_CHAT_CONTEXT_TEMPLATE = (
+    f"\n\n{_SEP}\n## 💬 CONVERSATION CONTEXT (CRITICAL - USE THIS!)\n{_SEP}\n"
+    "**IMPORTANT**: The following conversation contains SPECIFIC details that MUST be incorporated:\n"
+    "- Project requirements and features discussed\n"
+    "- Stakeholders mentioned\n"
+    "- Constraints and priorities stated\n"
+    "- Technical preferences mentioned\n"
+    "- Business rules and edge cases\n\n"
+    "{chat}"
+    f"\n{_SEP}\n"
+    "**INSTRUCTION: Extract and incorporate ALL relevant details from above into the document.**\n"
+    "**If the user mentioned specific features, stakeholders, constraints, or requirements - they MUST appear in the output.**\n"
+    f"{_SEP}\n"
+)
+
+
 class DiscoverService:
     """Service for Discover stage operations."""
     
@@ -40,20 +84,61 @@ class DiscoverService:
         Returns:
             Combined user messages as the project idea
         """
-        if not chat_history:
+        # Filter and format user messages in one pass, with context markers
+        parts = [
+            f"[Message {i}]: {content}\n\n"
+            for i, content in enumerate(
+                (msg["content"] for msg in chat_history if msg["role"] == "user"), 1
+            )
+        ]
+        
+        if not parts:
             return "Project idea not specified. Generate based on available context."
         
-        user_messages = [msg["content"] for msg in chat_history if msg["role"] == "user"]
+        return "".join(["The user discussed the following about their project:\n\n", *parts])
+    
+    async def _generate_problem_and_stakeholders(
+        self,
+        user_idea: str,
+        chat_context: str
+    ) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Generate the Problem Statement and Stakeholder Analysis with a single AI call.
         
-        if not user_messages:
-            return "Project idea not specified. Generate based on available context."
+        The reply is never taken from the completion cache, so a retry after
+        an unusable reply always gets a fresh generation.
+        
+        Args:
+            user_idea: User's idea (provided or extracted from chat)
+            chat_context: Formatted chat context
+            
+        Returns:
+            Tuple of (problem statement, stakeholder analysis). The analysis is
+            None when the reply was cut off (or malformed) after a complete
+            problem section, so only it needs a separate call. None if not
+            even the problem statement could be taken from the reply.
+        """
+        content, usage = await generate_with_openai_usage(
+            PROBLEM_AND_STAKEHOLDERS_PROMPT.format(user_idea=user_idea),
+            f"Generate the Problem Statement and Stakeholder Analysis for:\n\n{user_idea}{chat_context}",
+            max_tokens=COMBINED_MAX_TOKENS
+        )
         
-        # Combine all user messages with context markers
-        combined_idea = "The user discussed the following about their project:\n\n"
-        for i, msg in enumerate(user_messages, 1):
-            combined_idea += f"[Message {i}]: {msg}\n\n"
+        match = _COMBINED_OUTPUT_RE.search(content)
+        if (
+            usage.get("finish_reason") != "length"
+            and match and match.group(1).strip() and match.group(2).strip()
+        ):
+            return match.group(1).strip(), match.group(2).strip()
         
-        return combined_idea
+        # A truncated reply can still carry a finished problem statement
+        problem_match = _COMBINED_PROBLEM_RE.search(content)
+        if problem_match and problem_match.group(1).strip():
+            logger.warning("⚠️ Combined Discover output incomplete; generating the stakeholder analysis separately")
+            return problem_match.group(1).strip(), None
+        
+        logger.warning("⚠️ Combined Discover output could not be split; using separate calls")
+        return None
     
     async def generate_discover_stage(
         self,
@@ -72,12 +157,45 @@ class DiscoverService:
         Returns:
             Dictionary containing both artifacts and status
         """
+        async for item in self._run_discover_stage(project_id, user_idea, created_by, stream=False):
+            result = item
+        return result
+    
+    def generate_discover_stage_stream(
+        self,
+        project_id: str,
+        user_idea: Optional[str] = None,
+        created_by: str = "AI Business Analyst"
+    ) -> AsyncIterator[Union[Tuple[str, str], Dict[str, Any]]]:
+        """
+        Generate both Discover documents, streaming them as they are written.
+        
+        Args:
+            project_id: ID of the project
+            user_idea: User's initial idea/statement (optional - extracted from chat if not provided)
+            created_by: Creator identifier
+            
+        Returns:
+            Async iterator of ("problem_statement" | "stakeholder_analysis", text
+            chunk) tuples, then the same result dictionary as generate_discover_stage
+        """
+        return self._run_discover_stage(project_id, user_idea, created_by, stream=True)
+    
+    async def _run_discover_stage(
+        self,
+        project_id: str,
+        user_idea: Optional[str],
+        created_by: str,
+        stream: bool
+    ) -> AsyncIterator[Union[Tuple[str, str], Dict[str, Any]]]:
+        """
+        Shared Discover pipeline; yields document chunks, then the result.
+        
+        Streaming runs write the two documents with separate streamed calls,
+        since the combined call can only be split once its response is complete.
+        """
         # Get project
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
+        project = await self.db.get(Project, UUID(project_id))
         
         if not project:
             from fastapi import HTTPException
@@ -93,42 +211,96 @@ class DiscoverService:
         # If no user_idea provided, extract from chat history
         if not user_idea or user_idea.strip() == "":
             user_idea = self._extract_user_idea_from_chat(chat_history)
-            print(f"📝 Extracted user idea from {message_count} chat messages")
+            logger.info("📝 Extracted user idea from %d chat messages", message_count)
         
         # Format chat history for prompt with strong emphasis
-        chat_context = ""
-        if chat_history:
-            chat_context = "\n\n" + "=" * 60
-            chat_context += "\n## 💬 CONVERSATION CONTEXT (CRITICAL - USE THIS!)\n"
-            chat_context += "=" * 60 + "\n"
-            chat_context += "**IMPORTANT**: The following conversation contains SPECIFIC details that MUST be incorporated:\n"
-            chat_context += "- Project requirements and features discussed\n"
-            chat_context += "- Stakeholders mentioned\n"
-            chat_context += "- Constraints and priorities stated\n"
-            chat_context += "- Technical preferences mentioned\n"
-            chat_context += "- Business rules and edge cases\n\n"
-            chat_context += format_chat_history_for_prompt(
-                chat_history, 
+        chat_context = _CHAT_CONTEXT_TEMPLATE.format(
+            chat=format_chat_history_for_prompt(
+                chat_history,
                 "Discovery Discussion",
                 include_header=False
             )
-            chat_context += "\n" + "=" * 60
-            chat_context += "\n**INSTRUCTION: Extract and incorporate ALL relevant details from above into the document.**\n"
-            chat_context += "**If the user mentioned specific features, stakeholders, constraints, or requirements - they MUST appear in the output.**\n"
-            chat_context += "=" * 60 + "\n"
+        ) if chat_history else ""
         
-        print(f"📝 Generating Problem Statement for project: {project.name}")
-        print(f"   └── Chat context: {message_count} messages from Discover stage")
+        logger.info("📝 Generating Problem Statement for project: %s", project.name)
+        logger.info("   └── Chat context: %d messages from Discover stage", message_count)
         
-        # Step 1: Generate Problem Statement with chat context
-        problem_prompt = PROBLEM_STATEMENT_PROMPT.format(user_idea=user_idea)
+        # Non-streaming runs ask for both documents in one call so the chat
+        # transcript is sent once; a reply without both documents falls back
+        # to separate calls for whatever is missing
+        problem_content = stakeholder_content = None
+        if not stream:
+            combined = await self._generate_problem_and_stakeholders(user_idea, chat_context)
+            if combined:
+                problem_content, stakeholder_content = combined
+        combined_generation = stakeholder_content is not None
         
-        # Enrich user message with chat history context
-        enriched_user_message = f"Generate a comprehensive Problem Statement for:\n\n{user_idea}{chat_context}"
+        if problem_content is None:
+            # Step 1: Generate Problem Statement with chat context
+            problem_prompt = PROBLEM_STATEMENT_PROMPT.format(user_idea=user_idea)
+            
+            # Enrich user message with chat history context
+            enriched_user_message = f"Generate a comprehensive Problem Statement for:\n\n{user_idea}{chat_context}"
+            
+            if stream:
+                problem_chunks: List[str] = []
+                async for chunk in generate_with_openai_stream(
+                    problem_prompt,
+                    enriched_user_message,
+                    max_tokens=3000
+                ):
+                    problem_chunks.append(chunk)
+                    yield "problem_statement", chunk
+                problem_content = "".join(problem_chunks)
+            else:
+                # Regenerating with an unchanged idea and chat reuses the cached reply
+                problem_content = await generate_with_openai(
+                    problem_prompt,
+                    enriched_user_message,
+                    max_tokens=3000,
+                    use_cache=True
+                )
+        
+        if stakeholder_content is None:
+            # Step 2: Generate Stakeholder Analysis with chat context
+            logger.info("📝 Generating Stakeholder Analysis...")
+            logger.info("   └── Chat context: %d messages from Discover stage", message_count)
+            
+            stakeholder_prompt = STAKEHOLDER_ANALYSIS_PROMPT.format(
+                user_idea=user_idea,
+                problem_statement=problem_content
+            )
+            
+            # Include chat context for stakeholder analysis too
+            stakeholder_user_message = f"Generate comprehensive Stakeholder Analysis based on the context provided.{chat_context}"
+            
+            if stream:
+                stakeholder_chunks: List[str] = []
+                async for chunk in generate_with_openai_stream(
+                    stakeholder_prompt,
+                    stakeholder_user_message,
+                    max_tokens=3000
+                ):
+                    stakeholder_chunks.append(chunk)
+                    yield "stakeholder_analysis", chunk
+                stakeholder_content = "".join(stakeholder_chunks)
+            else:
+                stakeholder_content = await generate_with_openai(
+                    stakeholder_prompt,
+                    stakeholder_user_message,
+                    max_tokens=3000,
+                    use_cache=True
+                )
         
-        problem_content = await generate_with_openai(problem_prompt, enriched_user_message, max_tokens=3000)
+        # Metadata values shared by both artifacts
+        stored_idea = user_idea[:500]  # Limit stored idea length
+        has_chat = message_count > 0
+        generation_context = "includes_chat_history" if has_chat else "no_chat_history"
         
+        # Ids and timestamps are set client-side so the stakeholder metadata can
+        # reference the problem statement before anything is flushed
         problem_artifact = Artifact(
+            id=uuid4(),
             project_id=project_id,
             stage=StageType.DISCOVER,
             artifact_type=ArtifactType.PROBLEM_STATEMENT,
@@ -136,37 +308,18 @@ class DiscoverService:
             content=problem_content,
             version=1,
             created_by=created_by,
+            created_at=datetime.utcnow(),
             meta_data={
-                "original_idea": user_idea[:500],  # Limit stored idea length
+                "original_idea": stored_idea,
                 "model": "gpt-4o-mini",
                 "artifact_subtype": "problem_statement",
                 "chat_messages_used": message_count,
-                "generation_context": "includes_chat_history" if message_count > 0 else "no_chat_history",
-                "idea_source": "chat_history" if message_count > 0 and (not user_idea or "user discussed" in user_idea) else "provided"
+                "generation_context": generation_context,
+                "combined_generation": combined_generation,
+                "idea_source": "chat_history" if has_chat and (not user_idea or "user discussed" in user_idea) else "provided"
             }
         )
         
-        self.db.add(problem_artifact)
-        await self.db.flush()
-        
-        # Step 2: Generate Stakeholder Analysis with chat context
-        print(f"📝 Generating Stakeholder Analysis...")
-        print(f"   └── Chat context: {message_count} messages from Discover stage")
-        
-        stakeholder_prompt = STAKEHOLDER_ANALYSIS_PROMPT.format(
-            user_idea=user_idea,
-            problem_statement=problem_content
-        )
-        
-        # Include chat context for stakeholder analysis too
-        stakeholder_user_message = f"Generate comprehensive Stakeholder Analysis based on the context provided.{chat_context}"
-        
-        stakeholder_content = await generate_with_openai(
-            stakeholder_prompt,
-            stakeholder_user_message,
-            max_tokens=3000
-        )
-        
         stakeholder_artifact = Artifact(
             project_id=project_id,
             stage=StageType.DISCOVER,
@@ -175,18 +328,18 @@ class DiscoverService:
             content=stakeholder_content,
             version=1,
             created_by=created_by,
+            created_at=datetime.utcnow(),
             meta_data={
-                "original_idea": user_idea[:500],
+                "original_idea": stored_idea,
                 "model": "gpt-4o-mini",
                 "artifact_subtype": "stakeholder_analysis",
                 "problem_statement_id": str(problem_artifact.id),
                 "chat_messages_used": message_count,
-                "generation_context": "includes_chat_history" if message_count > 0 else "no_chat_history"
+                "generation_context": generation_context,
+                "combined_generation": combined_generation
             }
         )
         
-        self.db.add(stakeholder_artifact)
-        
         # Create commit
         commit = Commit(
             project_id=project_id,
@@ -199,10 +352,10 @@ class DiscoverService:
                 "deleted": []
             }
         )
-        self.db.add(commit)
+        self.db.add_all([problem_artifact, stakeholder_artifact, commit])
         
         # Log activity
-        await log_activity(
+        stage_activity(
             self.db,
             project_id,
             created_by or "system",
@@ -214,17 +367,15 @@ class DiscoverService:
             }
         )
         
-        # Update project stage
+        # Update project stage; everything above is written in this one commit
         project.current_stage = StageType.DEFINE
         
         await self.db.commit()
-        await self.db.refresh(problem_artifact)
-        await self.db.refresh(stakeholder_artifact)
         
-        print(f"✅ Discover stage completed for project: {project.name}")
-        print(f"   └── Used {message_count} chat messages for context")
+        logger.info("✅ Discover stage completed for project: %s", project.name)
+        logger.info("   └── Used %d chat messages for context", message_count)
         
-        return {
+        yield {
             "status": "completed",
             "message": f"Discover stage completed successfully (used {message_count} chat messages for context)",
             "chat_messages_used": message_count,
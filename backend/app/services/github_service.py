@@ -3,13 +3,15 @@
 Service for GitHub integration including validation, configuration, and API operations.
 """
 
+import asyncio
+import base64
+import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import UUID
 
 import httpx
 from fastapi import HTTPException
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.attributes import flag_modified
 
@@ -18,6 +20,45 @@ from app.core.security import encrypt_token, decrypt_token
 from app.services.activity_service import log_activity
 
 
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Blob uploads in flight at once per commit, kept low for GitHub's
+# secondary rate limits on concurrent content creation
+MAX_CONCURRENT_BLOB_UPLOADS = 10
+
+# One pooled client for all GitHub calls, so consecutive requests (one per
+# blob in create_files_batch) reuse open TLS connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared GitHub HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=30.0
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared GitHub HTTP client (called on application shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _ensure_stages(project: Project) -> Dict[str, Any]:
+    """Return the project's tracked stages_config dict, creating it if unset."""
+    if not project.stages_config:
+        project.stages_config = {}
+    return project.stages_config
+
+
 class GitHubClient:
     """GitHub API client for ticket implementation."""
     
@@ -35,40 +76,54 @@ class GitHubClient:
         else:
             raise ValueError("Repo must be in 'owner/repo' format")
         
-        self.base_url = "https://api.github.com"
+        self.base_url = GITHUB_API_URL
         self.headers = {
             "Authorization": f"Bearer {token}",
             "Accept": "application/vnd.github.v3+json",
             "X-GitHub-Api-Version": "2022-11-28"
         }
+        
+        # Refs this client has read or moved; a client lives for one ticket
+        # implementation, so these cannot go stale from its own writes
+        self._default_branch: Optional[str] = None
+        self._branch_shas: Dict[str, str] = {}
     
     async def _request(self, method: str, endpoint: str, **kwargs) -> dict:
         """Make a request to GitHub API."""
-        async with httpx.AsyncClient() as client:
-            url = f"{self.base_url}{endpoint}"
-            response = await client.request(method, url, headers=self.headers, **kwargs)
-            response.raise_for_status()
-            return response.json() if response.content else {}
+        url = f"{self.base_url}{endpoint}"
+        response = await get_http_client().request(method, url, headers=self.headers, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
     
     async def get_default_branch(self) -> str:
         """Get the default branch of the repository."""
-        repo = await self._request("GET", f"/repos/{self.owner}/{self.repo}")
-        return repo["default_branch"]
+        if self._default_branch is None:
+            repo = await self._request("GET", f"/repos/{self.owner}/{self.repo}")
+            self._default_branch = repo["default_branch"]
+        return self._default_branch
     
     async def get_branch_sha(self, branch: str) -> str:
         """Get the SHA of a branch."""
-        branch_data = await self._request("GET", f"/repos/{self.owner}/{self.repo}/branches/{branch}")
-        return branch_data["commit"]["sha"]
+        if branch not in self._branch_shas:
+            branch_data = await self._request("GET", f"/repos/{self.owner}/{self.repo}/branches/{branch}")
+            self._branch_shas[branch] = branch_data["commit"]["sha"]
+        return self._branch_shas[branch]
+    
+    def invalidate_branch(self, branch: str) -> None:
+        """Forget a branch's cached SHA after it was moved outside this client."""
+        self._branch_shas.pop(branch, None)
     
     async def create_branch(self, name: str, from_branch: str = None) -> dict:
         """Create a new branch."""
         if not from_branch:
             from_branch = await self.get_default_branch()
         sha = await self.get_branch_sha(from_branch)
-        return await self._request(
+        ref = await self._request(
             "POST", f"/repos/{self.owner}/{self.repo}/git/refs",
             json={"ref": f"refs/heads/{name}", "sha": sha}
         )
+        self._branch_shas[name] = sha
+        return ref
     
     async def create_issue(self, title: str, body: str, labels: list = None) -> dict:
         """Create a GitHub issue."""
@@ -92,14 +147,25 @@ class GitHubClient:
         commit = await self._request("GET", f"/repos/{self.owner}/{self.repo}/git/commits/{branch_sha}")
         base_tree = commit["tree"]["sha"]
         
-        # Create blobs for each file
-        tree_items = []
-        for path, content in files.items():
-            blob = await self._request(
-                "POST", f"/repos/{self.owner}/{self.repo}/git/blobs",
-                json={"content": content, "encoding": "utf-8"}
-            )
-            tree_items.append({"path": path, "mode": "100644", "type": "blob", "sha": blob["sha"]})
+        # Create blobs for each file; uploads are independent, so they run
+        # concurrently up to MAX_CONCURRENT_BLOB_UPLOADS
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_BLOB_UPLOADS)
+        
+        async def create_blob(content: Union[str, bytes]) -> dict:
+            # base64 blobs accept any bytes, so binary or non-UTF-8 output
+            # cannot fail GitHub's UTF-8 validation
+            raw = content.encode() if isinstance(content, str) else content
+            async with semaphore:
+                return await self._request(
+                    "POST", f"/repos/{self.owner}/{self.repo}/git/blobs",
+                    json={"content": base64.b64encode(raw).decode(), "encoding": "base64"}
+                )
+        
+        blobs = await asyncio.gather(*[create_blob(content) for content in files.values()])
+        tree_items = [
+            {"path": path, "mode": "100644", "type": "blob", "sha": blob["sha"]}
+            for path, blob in zip(files, blobs)
+        ]
         
         # Create tree
         new_tree = await self._request(
@@ -118,6 +184,7 @@ class GitHubClient:
             "PATCH", f"/repos/{self.owner}/{self.repo}/git/refs/heads/{branch}",
             json={"sha": new_commit["sha"]}
         )
+        self._branch_shas[branch] = new_commit["sha"]
         
         return new_commit
     
@@ -136,6 +203,27 @@ class GitHubService:
     
     def __init__(self, db: AsyncSession):
         self.db = db
+        self._projects: Dict[UUID, Project] = {}
+    
+    async def _get_project(self, project_id: UUID) -> Project:
+        """
+        Load a project once per service instance.
+        
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            The project (later calls reuse the same identity-mapped object)
+        """
+        project = self._projects.get(project_id)
+        if project is None:
+            project = await self.db.get(Project, project_id)
+            
+            if not project:
+                raise HTTPException(status_code=404, detail="Project not found")
+            
+            self._projects[project_id] = project
+        return project
     
     async def validate_config(self, token: str, repo: str) -> Dict[str, Any]:
         """
@@ -154,31 +242,30 @@ class GitHubService:
             "X-GitHub-Api-Version": "2022-11-28"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.github.com/repos/{repo}",
-                headers=headers
-            )
-            
-            if response.status_code == 401:
-                raise HTTPException(status_code=401, detail="Invalid GitHub token")
-            elif response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Repository '{repo}' not found or not accessible")
-            elif response.status_code != 200:
-                raise HTTPException(status_code=response.status_code, detail="GitHub API error")
-            
-            repo_data = response.json()
-            
-            return {
-                "repo_name": repo_data["full_name"],
-                "default_branch": repo_data["default_branch"],
-                "private": repo_data["private"],
-                "permissions": repo_data.get("permissions", {})
-            }
+        response = await get_http_client().get(
+            f"{GITHUB_API_URL}/repos/{repo}",
+            headers=headers
+        )
+        
+        if response.status_code == 401:
+            raise HTTPException(status_code=401, detail="Invalid GitHub token")
+        elif response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Repository '{repo}' not found or not accessible")
+        elif response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail="GitHub API error")
+        
+        repo_data = response.json()
+        
+        return {
+            "repo_name": repo_data["full_name"],
+            "default_branch": repo_data["default_branch"],
+            "private": repo_data["private"],
+            "permissions": repo_data.get("permissions", {})
+        }
     
     async def save_config(
         self,
-        project_id: str,
+        project_id: UUID,
         github_token: str,
         github_repo: str
     ) -> Dict[str, Any]:
@@ -193,14 +280,7 @@ class GitHubService:
         Returns:
             Success response with repo info
         """
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+        project = await self._get_project(project_id)
         
         # Validate repo format
         if "/" not in github_repo or len(github_repo.split("/")) != 2:
@@ -210,9 +290,9 @@ class GitHubService:
             )
         
         # Validate GitHub credentials
-        print(f"🔐 Validating GitHub config for project {project_id}")
+        logger.info("🔐 Validating GitHub config for project %s", project_id)
         repo_info = await self.validate_config(github_token, github_repo)
-        print(f"✅ GitHub validation successful: {repo_info['repo_name']}")
+        logger.info("✅ GitHub validation successful: %s", repo_info["repo_name"])
         
         # Check for required permissions
         permissions = repo_info.get("permissions", {})
@@ -225,23 +305,20 @@ class GitHubService:
         # Encrypt token and store
         encrypted_token = encrypt_token(github_token)
         
-        # Update project's stages_config
-        stages_config = project.stages_config or {}
-        stages_config["github"] = {
+        # Update project's stages_config in place
+        _ensure_stages(project)["github"] = {
             "repo": github_repo,
             "encrypted_token": encrypted_token,
             "default_branch": repo_info["default_branch"],
             "configured_at": datetime.utcnow().isoformat()
         }
-        
-        project.stages_config = stages_config
         flag_modified(project, "stages_config")
         
         await self.db.commit()
         
         await log_activity(
             self.db,
-            project_id,
+            str(project_id),
             "system",
             "github_configured",
             {"repo": github_repo}
@@ -256,7 +333,7 @@ class GitHubService:
             }
         }
     
-    async def get_config(self, project_id: str) -> Dict[str, Any]:
+    async def get_config(self, project_id: UUID) -> Dict[str, Any]:
         """
         Get GitHub configuration status for a project.
         
@@ -266,14 +343,7 @@ class GitHubService:
         Returns:
             GitHub configuration status (without token)
         """
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+        project = await self._get_project(project_id)
         
         stages_config = project.stages_config or {}
         github_config = stages_config.get("github")
@@ -287,7 +357,7 @@ class GitHubService:
             "default_branch": github_config.get("default_branch")
         }
     
-    async def delete_config(self, project_id: str) -> Dict[str, Any]:
+    async def delete_config(self, project_id: UUID) -> Dict[str, Any]:
         """
         Delete GitHub configuration from a project.
         
@@ -297,25 +367,16 @@ class GitHubService:
         Returns:
             Success response
         """
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+        project = await self._get_project(project_id)
         
-        stages_config = project.stages_config or {}
-        if "github" in stages_config:
-            del stages_config["github"]
-            project.stages_config = stages_config
+        if project.stages_config and "github" in project.stages_config:
+            del project.stages_config["github"]
             flag_modified(project, "stages_config")
             await self.db.commit()
         
         return {"status": "success", "message": "GitHub configuration removed"}
     
-    async def get_credentials(self, project_id: str) -> Tuple[str, str, str]:
+    async def get_credentials(self, project_id: UUID) -> Tuple[str, str, str]:
         """
         Get decrypted GitHub credentials for a project.
         
@@ -325,14 +386,7 @@ class GitHubService:
         Returns:
             Tuple of (token, repo, default_branch)
         """
-        project_uuid = UUID(project_id)
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_uuid)
-        )
-        project = result.scalar_one_or_none()
-        
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
+        project = await self._get_project(project_id)
         
         stages_config = project.stages_config or {}
         github_config = stages_config.get("github")
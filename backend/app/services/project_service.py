@@ -56,7 +56,6 @@ class ProjectService(BaseService[Project]):
         
         self.db.add(project)
         await self.db.commit()
-        await self.db.refresh(project)
         
         # Log activity
         await log_activity(
@@ -79,10 +78,7 @@ class ProjectService(BaseService[Project]):
         Returns:
             The project if found, None otherwise
         """
-        result = await self.db.execute(
-            select(Project).where(Project.id == project_id)
-        )
-        return result.scalar_one_or_none()
+        return await self.db.get(Project, project_id)
     
     async def list_projects(
         self,
@@ -124,7 +120,6 @@ class ProjectService(BaseService[Project]):
         """
         project.current_stage = new_stage
         await self.db.commit()
-        await self.db.refresh(project)
         return project
     
     async def update_stages_config(
@@ -147,7 +142,6 @@ class ProjectService(BaseService[Project]):
         project.stages_config = stages_config
         flag_modified(project, "stages_config")
         await self.db.commit()
-        await self.db.refresh(project)
         return project
     
     def to_dict(self, project: Project) -> Dict[str, Any]:
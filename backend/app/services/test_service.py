@@ -3,14 +3,15 @@
 Service for the Test stage - Test plan and test case generation.
 """
 
-import json
+import asyncio
+import logging
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
-from uuid import UUID
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
 
 from fastapi import HTTPException
-from sqlalchemy import select, desc
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, desc, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm.attributes import flag_modified
 
 from app.models.project import Project
@@ -18,7 +19,9 @@ from app.models.artifact import Artifact
 from app.models.commit import Commit
 from app.models.enums import StageType, ArtifactType
 from app.services.ai_service import AIService
-from app.services.activity_service import log_activity
+from app.services.activity_service import stage_activity
+from app.services.artifact_service import compile_template, render_template
+from app.core.database import AsyncSessionLocal
 from app.prompts.test_prompts import (
     TEST_PLAN_SYSTEM_PROMPT,
     TEST_PLAN_USER_PROMPT,
@@ -27,6 +30,7 @@ from app.prompts.test_prompts import (
     RUN_TESTS_SYSTEM_PROMPT,
     RUN_TESTS_USER_PROMPT,
 )
+from app.utils import json_io
 from app.utils.chat_context import (
     get_all_chat_history,
     format_all_chat_history_for_prompt,
@@ -34,12 +38,108 @@ from app.utils.chat_context import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+# Leading characters of the architecture document included in the test run
+# prompt; only this much is read from the database
+ARCHITECTURE_PROMPT_CHARS = 2000
+
+# Leading characters of the serialized test suites included in the test run prompt
+SUITES_PROMPT_CHARS = 6000
+
+# Prompt templates parsed once at import; values are passed in field order
+_TEST_PLAN_PROMPT_FIELDS = (
+    "problem_statement", "brd_content", "user_stories", "architecture",
+    "tickets_summary", "current_date", "chat_context"
+)
+_TEST_PLAN_TEMPLATE = compile_template(
+    TEST_PLAN_USER_PROMPT + "{chat_context}", _TEST_PLAN_PROMPT_FIELDS
+)
+_TEST_CASES_PROMPT_FIELDS = ("user_stories", "brd_content", "architecture", "tickets_summary")
+_TEST_CASES_TEMPLATE = compile_template(TEST_CASES_USER_PROMPT, _TEST_CASES_PROMPT_FIELDS)
+_RUN_TESTS_TEMPLATE = compile_template(
+    RUN_TESTS_USER_PROMPT, ("test_cases", "architecture", "timestamp", "start_time", "end_time")
+)
+
+# Test plan prompt field filled from the latest artifact of each type
+_TEST_PLAN_FIELDS = {
+    ArtifactType.PROBLEM_STATEMENT: "problem_statement",
+    ArtifactType.BRD: "brd_content",
+    ArtifactType.USER_STORIES: "user_stories",
+    ArtifactType.ARCHITECTURE: "architecture",
+}
+
+# Test cases prompt field filled from the latest artifact of each type
+_TEST_CASES_FIELDS = {
+    ArtifactType.USER_STORIES: "user_stories",
+    ArtifactType.BRD: "brd_content",
+    ArtifactType.ARCHITECTURE: "architecture",
+}
+
+
+def _truncate_suites_for_prompt(
+    suites: List[Dict[str, Any]],
+    budget_chars: int = SUITES_PROMPT_CHARS
+) -> str:
+    """
+    Serialize test suites for a prompt, stopping once the budget is filled.
+    
+    Suites are encoded one at a time, so suites past the budget are never
+    serialized only to be cut off.
+    
+    Args:
+        suites: Test suites to include, in order
+        budget_chars: Maximum length of the returned text
+        
+    Returns:
+        JSON array text of the leading suites, cut to budget_chars
+    """
+    parts = []
+    used = 0
+    for suite in suites:
+        if used >= budget_chars:
+            break
+        part = json_io.dumps(suite, indent=True)
+        parts.append(part)
+        used += len(part) + 2
+    return ("[\n" + ",\n".join(parts) + "\n]")[:budget_chars]
+
+
+def _find_test_case(test_data: Dict[str, Any], case_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Find a test case by ID.
+    
+    Args:
+        test_data: Parsed test cases document
+        case_id: ID of the test case
+        
+    Returns:
+        The test case dict (mutable, inside test_data), or None if not found
+    """
+    for suite in test_data.get("test_suites", []):
+        for case in suite.get("test_cases", []):
+            if case.get("case_id") == case_id:
+                return case
+    return None
+
+
 class TestService:
     """Service for Test stage operations."""
     
-    def __init__(self, db: AsyncSession):
+    def __init__(
+        self,
+        db: AsyncSession,
+        session_factory: async_sessionmaker = AsyncSessionLocal
+    ):
         self.db = db
+        # Opens short-lived sessions for read-only lookups run concurrently
+        # with queries on self.db (one session cannot run two queries at once)
+        self.session_factory = session_factory
         self.ai_service = AIService()
+        # artifact id -> (artifact, content, parsed content) for this request;
+        # holding the artifact keeps it in the session's weak identity map, so
+        # a later query for the same row returns the same content string
+        self._parse_cache: Dict[Any, Tuple[Artifact, str, Any]] = {}
     
     async def generate_test_plan(
         self,
@@ -66,7 +166,7 @@ class TestService:
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        print(f"📋 Generating test plan for project: {project.name}")
+        logger.info("📋 Generating test plan for project: %s", project.name)
         
         # Fetch chat history from all stages
         all_chat_history = await get_all_chat_history(
@@ -79,47 +179,10 @@ class TestService:
         chat_context = format_all_chat_history_for_prompt(all_chat_history)
         chat_stats = count_chat_messages(all_chat_history)
         
-        print(f"   └── Chat context: {chat_stats['total_messages']} messages")
-        
-        # Gather all artifacts
-        artifacts_result = await self.db.execute(
-            select(Artifact).where(Artifact.project_id == project_id)
-            .order_by(desc(Artifact.created_at))
-        )
-        all_artifacts = artifacts_result.scalars().all()
-        
-        # Organize artifacts
-        artifact_contents = {
-            "problem_statement": "",
-            "brd_content": "",
-            "user_stories": "",
-            "architecture": "",
-            "tickets_summary": ""
-        }
+        logger.info("   └── Chat context: %s messages", chat_stats["total_messages"])
         
-        captured_types = set()
-        tickets_data = None
-        
-        for artifact in all_artifacts:
-            if artifact.artifact_type == ArtifactType.PROBLEM_STATEMENT and ArtifactType.PROBLEM_STATEMENT not in captured_types:
-                artifact_contents["problem_statement"] = artifact.content
-                captured_types.add(ArtifactType.PROBLEM_STATEMENT)
-            elif artifact.artifact_type == ArtifactType.BRD and ArtifactType.BRD not in captured_types:
-                artifact_contents["brd_content"] = artifact.content
-                captured_types.add(ArtifactType.BRD)
-            elif artifact.artifact_type == ArtifactType.USER_STORIES and ArtifactType.USER_STORIES not in captured_types:
-                artifact_contents["user_stories"] = artifact.content
-                captured_types.add(ArtifactType.USER_STORIES)
-            elif artifact.artifact_type == ArtifactType.ARCHITECTURE and ArtifactType.ARCHITECTURE not in captured_types:
-                artifact_contents["architecture"] = artifact.content
-                captured_types.add(ArtifactType.ARCHITECTURE)
-            elif artifact.artifact_type == ArtifactType.CODE and artifact.meta_data and artifact.meta_data.get("type") == "development_tickets":
-                if tickets_data is None:
-                    try:
-                        tickets_data = json.loads(artifact.content)
-                        artifact_contents["tickets_summary"] = self._summarize_tickets(tickets_data)
-                    except json.JSONDecodeError:
-                        pass
+        # Latest artifact of each type the prompt uses
+        artifact_contents = await self._get_prompt_artifacts(project_id, _TEST_PLAN_FIELDS)
         
         # Check minimum requirements
         if not artifact_contents["brd_content"] and not artifact_contents["user_stories"]:
@@ -128,10 +191,18 @@ class TestService:
                 detail="Missing requirements. Complete Define stage first."
             )
         
+        # One timestamp for the prompt date and every row written below;
+        # columns hold naive UTC
+        now = datetime.now(timezone.utc)
+        created_at = now.replace(tzinfo=None)
+        
         # Build prompt
-        artifact_contents["current_date"] = datetime.utcnow().strftime("%Y-%m-%d")
-        user_prompt = TEST_PLAN_USER_PROMPT.format(**artifact_contents)
-        user_prompt += chat_context
+        artifact_contents["current_date"] = now.strftime("%Y-%m-%d")
+        artifact_contents["chat_context"] = chat_context
+        user_prompt = render_template(
+            _TEST_PLAN_TEMPLATE,
+            [artifact_contents[field] for field in _TEST_PLAN_PROMPT_FIELDS]
+        )
         
         # Call AI
         response_text = await self.ai_service.generate(
@@ -141,30 +212,33 @@ class TestService:
         )
         
         # Clean JSON response
-        response_text = self._clean_json_response(response_text)
+        response_text = json_io.strip_code_fence(response_text)
         
         try:
-            test_plan_data = json.loads(response_text.strip())
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parse error: {e}")
-            print(f"Response was: {response_text[:500]}")
+            test_plan_data = json_io.loads(response_text)
+        except json_io.JSONDecodeError as e:
+            logger.error("❌ JSON parse error: %s", e)
+            logger.error("Response was: %s", response_text[:500])
             raise HTTPException(status_code=500, detail="Failed to parse AI response as JSON")
         
-        # Create artifact
+        # Create artifact; the id is assigned here so the response never needs
+        # the row reloaded
         test_plan_artifact = Artifact(
+            id=uuid4(),
             project_id=project_id,
             stage=StageType.TEST,
             artifact_type=ArtifactType.TEST_PLAN,
             name="Test Plan",
-            content=json.dumps(test_plan_data, indent=2),
+            content=json_io.dumps(test_plan_data, indent=True),
             created_by=created_by,
+            created_at=created_at,
             meta_data={
                 "type": "test_plan",
                 "version": "1.0",
-                "generated_at": datetime.utcnow().isoformat()
+                "generated_at": now.isoformat(),
+                "plan_summary": test_plan_data.get("test_plan", test_plan_data).get("summary")
             }
         )
-        self.db.add(test_plan_artifact)
         
         # Create commit record
         commit = Commit(
@@ -172,16 +246,17 @@ class TestService:
             stage=StageType.TEST,
             author_id=created_by,
             message="Generated comprehensive test plan",
+            created_at=created_at,
             changes={
                 "added": ["Test Plan"],
                 "modified": [],
                 "deleted": []
             }
         )
-        self.db.add(commit)
+        self.db.add_all([test_plan_artifact, commit])
         
-        # Log activity
-        await log_activity(
+        # Log activity in the same transaction
+        stage_activity(
             self.db,
             project_id,
             created_by or "system",
@@ -192,9 +267,8 @@ class TestService:
         )
         
         await self.db.commit()
-        await self.db.refresh(test_plan_artifact)
         
-        print(f"✅ Test plan generated successfully")
+        logger.info("✅ Test plan generated successfully")
         
         return {
             "status": "success",
@@ -206,13 +280,13 @@ class TestService:
     
     async def get_test_plan(self, project_id: str) -> Dict[str, Any]:
         """Get existing test plan for a project."""
-        result = await self.db.execute(
-            select(Artifact)
-            .where(Artifact.project_id == project_id)
-            .where(Artifact.artifact_type == ArtifactType.TEST_PLAN)
-            .order_by(desc(Artifact.created_at))
-        )
-        artifact = result.scalar_one_or_none()
+        try:
+            artifact, test_plan_data = await self._latest_document(project_id, ArtifactType.TEST_PLAN)
+        except json_io.JSONDecodeError:
+            return {
+                "status": "error",
+                "message": "Failed to parse test plan data"
+            }
         
         if not artifact:
             return {
@@ -220,19 +294,12 @@ class TestService:
                 "message": "No test plan found for this project"
             }
         
-        try:
-            test_plan_data = json.loads(artifact.content)
-            return {
-                "status": "success",
-                "artifact_id": str(artifact.id),
-                "test_plan": test_plan_data.get("test_plan", test_plan_data),
-                "generated_at": artifact.created_at.isoformat() if artifact.created_at else None
-            }
-        except json.JSONDecodeError:
-            return {
-                "status": "error",
-                "message": "Failed to parse test plan data"
-            }
+        return {
+            "status": "success",
+            "artifact_id": str(artifact.id),
+            "test_plan": test_plan_data.get("test_plan", test_plan_data),
+            "generated_at": artifact.created_at.isoformat() if artifact.created_at else None
+        }
     
     async def generate_test_cases(
         self,
@@ -259,43 +326,10 @@ class TestService:
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        print(f"🧪 Generating test cases for project: {project.name}")
-        
-        # Gather all artifacts
-        artifacts_result = await self.db.execute(
-            select(Artifact).where(Artifact.project_id == project_id)
-            .order_by(desc(Artifact.created_at))
-        )
-        all_artifacts = artifacts_result.scalars().all()
-        
-        # Organize artifacts
-        artifact_contents = {
-            "user_stories": "",
-            "brd_content": "",
-            "architecture": "",
-            "tickets_summary": ""
-        }
+        logger.info("🧪 Generating test cases for project: %s", project.name)
         
-        captured_types = set()
-        tickets_data = None
-        
-        for artifact in all_artifacts:
-            if artifact.artifact_type == ArtifactType.USER_STORIES and ArtifactType.USER_STORIES not in captured_types:
-                artifact_contents["user_stories"] = artifact.content
-                captured_types.add(ArtifactType.USER_STORIES)
-            elif artifact.artifact_type == ArtifactType.BRD and ArtifactType.BRD not in captured_types:
-                artifact_contents["brd_content"] = artifact.content
-                captured_types.add(ArtifactType.BRD)
-            elif artifact.artifact_type == ArtifactType.ARCHITECTURE and ArtifactType.ARCHITECTURE not in captured_types:
-                artifact_contents["architecture"] = artifact.content
-                captured_types.add(ArtifactType.ARCHITECTURE)
-            elif artifact.artifact_type == ArtifactType.CODE and artifact.meta_data and artifact.meta_data.get("type") == "development_tickets":
-                if tickets_data is None:
-                    try:
-                        tickets_data = json.loads(artifact.content)
-                        artifact_contents["tickets_summary"] = self._summarize_tickets(tickets_data)
-                    except json.JSONDecodeError:
-                        pass
+        # Latest artifact of each type the prompt uses
+        artifact_contents = await self._get_prompt_artifacts(project_id, _TEST_CASES_FIELDS)
         
         # Check minimum requirements
         if not artifact_contents["user_stories"] and not artifact_contents["brd_content"]:
@@ -305,9 +339,13 @@ class TestService:
             )
         
         # Build prompt
-        user_prompt = TEST_CASES_USER_PROMPT.format(**artifact_contents)
+        user_prompt = render_template(
+            _TEST_CASES_TEMPLATE,
+            [artifact_contents[field] for field in _TEST_CASES_PROMPT_FIELDS]
+        )
         
-        # Call AI
+        # Call AI. Not cached: regenerating with unchanged artifacts should
+        # produce a new set of cases, not replay the previous reply
         response_text = await self.ai_service.generate(
             TEST_CASES_SYSTEM_PROMPT,
             user_prompt,
@@ -315,32 +353,39 @@ class TestService:
         )
         
         # Clean JSON response
-        response_text = self._clean_json_response(response_text)
+        response_text = json_io.strip_code_fence(response_text)
         
         try:
-            test_cases_data = json.loads(response_text.strip())
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parse error: {e}")
-            print(f"Response was: {response_text[:500]}")
+            test_cases_data = json_io.loads(response_text)
+        except json_io.JSONDecodeError as e:
+            logger.error("❌ JSON parse error: %s", e)
+            logger.error("Response was: %s", response_text[:500])
             raise HTTPException(status_code=500, detail="Failed to parse AI response as JSON")
         
-        # Create artifact
+        # One timestamp for every row written below; columns hold naive UTC
+        now = datetime.now(timezone.utc)
+        created_at = now.replace(tzinfo=None)
+        
+        # Create artifact; the id is assigned here so the response never needs
+        # the row reloaded
         test_cases_artifact = Artifact(
+            id=uuid4(),
             project_id=project_id,
             stage=StageType.TEST,
             artifact_type=ArtifactType.TEST_CASES,
             name="Test Cases",
-            content=json.dumps(test_cases_data, indent=2),
+            content=json_io.dumps(test_cases_data, indent=True),
             created_by=created_by,
+            created_at=created_at,
             meta_data={
                 "type": "test_cases",
                 "version": "1.0",
-                "generated_at": datetime.utcnow().isoformat(),
+                "generated_at": now.isoformat(),
                 "total_suites": len(test_cases_data.get("test_suites", [])),
-                "total_cases": test_cases_data.get("summary", {}).get("total_test_cases", 0)
+                "total_cases": test_cases_data.get("summary", {}).get("total_test_cases", 0),
+                "summary": test_cases_data.get("summary", {})
             }
         )
-        self.db.add(test_cases_artifact)
         
         # Create commit record
         commit = Commit(
@@ -348,16 +393,17 @@ class TestService:
             stage=StageType.TEST,
             author_id=created_by,
             message=f"Generated {test_cases_data.get('summary', {}).get('total_test_cases', 0)} test cases",
+            created_at=created_at,
             changes={
                 "added": ["Test Cases"],
                 "modified": [],
                 "deleted": []
             }
         )
-        self.db.add(commit)
+        self.db.add_all([test_cases_artifact, commit])
         
-        # Log activity
-        await log_activity(
+        # Log activity in the same transaction
+        stage_activity(
             self.db,
             project_id,
             created_by or "system",
@@ -368,9 +414,11 @@ class TestService:
         )
         
         await self.db.commit()
-        await self.db.refresh(test_cases_artifact)
         
-        print(f"✅ Test cases generated: {test_cases_data.get('summary', {}).get('total_test_cases', 0)} cases")
+        logger.info(
+            "✅ Test cases generated: %s cases",
+            test_cases_data.get("summary", {}).get("total_test_cases", 0)
+        )
         
         return {
             "status": "success",
@@ -382,38 +430,31 @@ class TestService:
     
     async def get_test_cases(self, project_id: str) -> Dict[str, Any]:
         """Get existing test cases for a project."""
-        result = await self.db.execute(
-            select(Artifact)
-            .where(Artifact.project_id == project_id)
-            .where(Artifact.artifact_type == ArtifactType.TEST_CASES)
-            .order_by(desc(Artifact.created_at))
-        )
-        artifact = result.scalar_one_or_none()
-        
-        if not artifact:
+        try:
+            artifact, test_cases_data = await self._latest_document(project_id, ArtifactType.TEST_CASES)
+        except json_io.JSONDecodeError:
             return {
-                "status": "not_found",
-                "message": "No test cases found for this project",
+                "status": "error",
+                "message": "Failed to parse test cases data",
                 "test_suites": [],
                 "summary": None
             }
         
-        try:
-            test_cases_data = json.loads(artifact.content)
-            return {
-                "status": "success",
-                "artifact_id": str(artifact.id),
-                "test_suites": test_cases_data.get("test_suites", []),
-                "summary": test_cases_data.get("summary", {}),
-                "generated_at": artifact.created_at.isoformat() if artifact.created_at else None
-            }
-        except json.JSONDecodeError:
+        if not artifact:
             return {
-                "status": "error",
-                "message": "Failed to parse test cases data",
+                "status": "not_found",
+                "message": "No test cases found for this project",
                 "test_suites": [],
                 "summary": None
             }
+        
+        return {
+            "status": "success",
+            "artifact_id": str(artifact.id),
+            "test_suites": test_cases_data.get("test_suites", []),
+            "summary": test_cases_data.get("summary", {}),
+            "generated_at": artifact.created_at.isoformat() if artifact.created_at else None
+        }
     
     async def run_tests(
         self,
@@ -432,16 +473,27 @@ class TestService:
         Returns:
             Dictionary containing test execution results
         """
-        # Get existing test cases
-        test_cases_result = await self.get_test_cases(project_id)
+        # The test cases artifact stays on self.db because the run is recorded
+        # on it below; the architecture excerpt is read on its own session.
+        test_cases_artifact, architecture = await asyncio.gather(
+            self._latest_artifact(project_id, ArtifactType.TEST_CASES),
+            self._load_latest_architecture_excerpt(project_id)
+        )
+        
+        test_data = None
+        if test_cases_artifact:
+            try:
+                test_data = self._parse_artifact_content(test_cases_artifact)
+            except json_io.JSONDecodeError:
+                pass
         
-        if test_cases_result.get("status") != "success":
+        if test_data is None:
             raise HTTPException(
                 status_code=400,
                 detail="No test cases found. Generate test cases first."
             )
         
-        test_suites = test_cases_result.get("test_suites", [])
+        test_suites = test_data.get("test_suites", [])
         
         # Filter suites if specific ones requested
         if test_suite_ids:
@@ -453,30 +505,22 @@ class TestService:
                 detail="No test suites to execute."
             )
         
-        print(f"🏃 Running tests for project: {project_id}")
-        print(f"   └── Suites: {len(test_suites)}")
+        logger.info("🏃 Running tests for project: %s", project_id)
+        logger.info("   └── Suites: %s", len(test_suites))
         
-        # Get architecture for context
-        artifacts_result = await self.db.execute(
-            select(Artifact)
-            .where(Artifact.project_id == project_id)
-            .where(Artifact.artifact_type == ArtifactType.ARCHITECTURE)
-            .order_by(desc(Artifact.created_at))
-        )
-        arch_artifact = artifacts_result.scalar_one_or_none()
-        architecture = arch_artifact.content if arch_artifact else ""
+        # One timestamp for the prompt and the commit record; columns hold
+        # naive UTC
+        now = datetime.now(timezone.utc)
+        now_iso = now.isoformat()
         
         # Build prompt
-        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        start_time = datetime.utcnow().isoformat()
-        
-        user_prompt = RUN_TESTS_USER_PROMPT.format(
-            test_cases=json.dumps(test_suites, indent=2)[:6000],
-            architecture=architecture[:2000],
-            timestamp=timestamp,
-            start_time=start_time,
-            end_time=datetime.utcnow().isoformat()
-        )
+        user_prompt = render_template(_RUN_TESTS_TEMPLATE, (
+            _truncate_suites_for_prompt(test_suites),
+            architecture or "",
+            now.strftime("%Y%m%d%H%M%S"),
+            now_iso,
+            now_iso
+        ))
         
         # Call AI
         response_text = await self.ai_service.generate(
@@ -486,35 +530,24 @@ class TestService:
         )
         
         # Clean JSON response
-        response_text = self._clean_json_response(response_text)
+        response_text = json_io.strip_code_fence(response_text)
         
         try:
-            run_results = json.loads(response_text.strip())
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON parse error: {e}")
+            run_results = json_io.loads(response_text)
+        except json_io.JSONDecodeError as e:
+            logger.error("❌ JSON parse error: %s", e)
             raise HTTPException(status_code=500, detail="Failed to parse AI response as JSON")
         
-        # Store test run results
-        # Get existing test cases artifact to update
-        test_cases_artifact_result = await self.db.execute(
-            select(Artifact)
-            .where(Artifact.project_id == project_id)
-            .where(Artifact.artifact_type == ArtifactType.TEST_CASES)
-            .order_by(desc(Artifact.created_at))
-        )
-        test_cases_artifact = test_cases_artifact_result.scalar_one_or_none()
-        
-        if test_cases_artifact:
-            try:
-                existing_data = json.loads(test_cases_artifact.content)
-                if "test_runs" not in existing_data:
-                    existing_data["test_runs"] = []
-                existing_data["test_runs"].append(run_results)
-                existing_data["latest_run"] = run_results
-                test_cases_artifact.content = json.dumps(existing_data, indent=2)
-                flag_modified(test_cases_artifact, "content")
-            except json.JSONDecodeError:
-                pass
+        # Store test run results on the test cases artifact
+        test_data.setdefault("test_runs", []).append(run_results)
+        test_data["latest_run"] = run_results
+        test_cases_artifact.content = json_io.dumps(test_data, indent=True)
+        flag_modified(test_cases_artifact, "content")
+        # Kept beside the content so the dashboard never parses it
+        test_cases_artifact.meta_data = {
+            **(test_cases_artifact.meta_data or {}),
+            "latest_run_summary": run_results.get("summary", {})
+        }
         
         # Create commit record
         commit = Commit(
@@ -522,6 +555,7 @@ class TestService:
             stage=StageType.TEST,
             author_id=created_by,
             message=f"Test run completed: {run_results.get('summary', {}).get('passed', 0)} passed, {run_results.get('summary', {}).get('failed', 0)} failed",
+            created_at=now.replace(tzinfo=None),
             changes={
                 "added": [f"Test Run {run_results.get('test_run', {}).get('run_id', 'unknown')}"],
                 "modified": [],
@@ -530,8 +564,8 @@ class TestService:
         )
         self.db.add(commit)
         
-        # Log activity
-        await log_activity(
+        # Log activity in the same transaction
+        stage_activity(
             self.db,
             project_id,
             created_by or "system",
@@ -544,7 +578,10 @@ class TestService:
         
         await self.db.commit()
         
-        print(f"✅ Test execution completed: {run_results.get('summary', {}).get('pass_rate', 0)}% pass rate")
+        logger.info(
+            "✅ Test execution completed: %s%% pass rate",
+            run_results.get("summary", {}).get("pass_rate", 0)
+        )
         
         return {
             "status": "success",
@@ -557,38 +594,78 @@ class TestService:
         }
     
     async def get_test_dashboard(self, project_id: str) -> Dict[str, Any]:
-        """Get overview of test artifacts for a project."""
-        test_plan = await self.get_test_plan(project_id)
-        test_cases = await self.get_test_cases(project_id)
+        """
+        Get overview of test artifacts for a project.
         
-        # Check for test results
-        has_results = False
-        latest_run_summary = None
+        One query reads only the meta_data of the latest test plan and test
+        cases, where their summaries are recorded on write; content is fetched
+        (in a single second query) only for artifacts written before that.
         
-        if test_cases.get("status") == "success":
-            try:
-                artifact_result = await self.db.execute(
-                    select(Artifact)
-                    .where(Artifact.project_id == project_id)
-                    .where(Artifact.artifact_type == ArtifactType.TEST_CASES)
-                    .order_by(desc(Artifact.created_at))
-                )
-                artifact = artifact_result.scalar_one_or_none()
-                if artifact:
-                    data = json.loads(artifact.content)
-                    if "latest_run" in data:
-                        has_results = True
-                        latest_run_summary = data["latest_run"].get("summary", {})
-            except:
-                pass
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            Dictionary with the test stage overview
+        """
+        rows = await self._latest_rows(
+            project_id,
+            (ArtifactType.TEST_PLAN, ArtifactType.TEST_CASES),
+            Artifact.meta_data
+        )
+        meta = {row.artifact_type: row.meta_data or {} for row in rows}
+        
+        # Artifacts written before the summaries were recorded are parsed,
+        # all fetched together in one more query
+        legacy_types = [
+            artifact_type
+            for artifact_type, summary_key in (
+                (ArtifactType.TEST_PLAN, "plan_summary"),
+                (ArtifactType.TEST_CASES, "summary"),
+            )
+            if artifact_type in meta and summary_key not in meta[artifact_type]
+        ]
+        documents = {}
+        if legacy_types:
+            for row in await self._latest_rows(project_id, legacy_types, Artifact.content):
+                try:
+                    documents[row.artifact_type] = json_io.loads(row.content)
+                except json_io.JSONDecodeError:
+                    pass
+        
+        has_test_plan = ArtifactType.TEST_PLAN in meta
+        test_plan_summary = None
+        if has_test_plan:
+            if "plan_summary" in meta[ArtifactType.TEST_PLAN]:
+                test_plan_summary = meta[ArtifactType.TEST_PLAN]["plan_summary"]
+            elif ArtifactType.TEST_PLAN in documents:
+                plan = documents[ArtifactType.TEST_PLAN]
+                test_plan_summary = plan.get("test_plan", plan).get("summary")
+            else:
+                has_test_plan = False
+        
+        has_test_cases = ArtifactType.TEST_CASES in meta
+        test_cases_summary = None
+        latest_run_summary = None
+        if has_test_cases:
+            cases_meta = meta[ArtifactType.TEST_CASES]
+            if "summary" in cases_meta:
+                test_cases_summary = cases_meta["summary"]
+                latest_run_summary = cases_meta.get("latest_run_summary")
+            elif ArtifactType.TEST_CASES in documents:
+                data = documents[ArtifactType.TEST_CASES]
+                test_cases_summary = data.get("summary", {})
+                if "latest_run" in data:
+                    latest_run_summary = data["latest_run"].get("summary", {})
+            else:
+                has_test_cases = False
         
         return {
             "status": "success",
-            "has_test_plan": test_plan.get("status") == "success",
-            "has_test_cases": test_cases.get("status") == "success",
-            "has_test_results": has_results,
-            "test_plan_summary": test_plan.get("test_plan", {}).get("summary") if test_plan.get("status") == "success" else None,
-            "test_cases_summary": test_cases.get("summary") if test_cases.get("status") == "success" else None,
+            "has_test_plan": has_test_plan,
+            "has_test_cases": has_test_cases,
+            "has_test_results": latest_run_summary is not None,
+            "test_plan_summary": test_plan_summary,
+            "test_cases_summary": test_cases_summary,
             "latest_run_summary": latest_run_summary
         }
     
@@ -602,40 +679,28 @@ class TestService:
     ) -> Dict[str, Any]:
         """Manually update a test case's execution status."""
         # Get test cases artifact
-        result = await self.db.execute(
-            select(Artifact)
-            .where(Artifact.project_id == project_id)
-            .where(Artifact.artifact_type == ArtifactType.TEST_CASES)
-            .order_by(desc(Artifact.created_at))
-        )
-        artifact = result.scalar_one_or_none()
+        artifact = await self._latest_artifact(project_id, ArtifactType.TEST_CASES)
         
         if not artifact:
             raise HTTPException(status_code=404, detail="Test cases not found")
         
         try:
-            test_data = json.loads(artifact.content)
-        except json.JSONDecodeError:
+            test_data = self._parse_artifact_content(artifact)
+        except json_io.JSONDecodeError:
             raise HTTPException(status_code=500, detail="Invalid test cases data")
         
         # Find and update the test case
-        updated = False
-        for suite in test_data.get("test_suites", []):
-            for case in suite.get("test_cases", []):
-                if case.get("case_id") == case_id:
-                    case["manual_status"] = status
-                    case["manual_notes"] = notes
-                    case["manual_failure_details"] = failure_details
-                    case["manually_updated_at"] = datetime.utcnow().isoformat()
-                    updated = True
-                    break
-            if updated:
-                break
-        
-        if not updated:
+        case = _find_test_case(test_data, case_id)
+        
+        if case is None:
             raise HTTPException(status_code=404, detail=f"Test case {case_id} not found")
         
-        artifact.content = json.dumps(test_data, indent=2)
+        case["manual_status"] = status
+        case["manual_notes"] = notes
+        case["manual_failure_details"] = failure_details
+        case["manually_updated_at"] = datetime.now(timezone.utc).isoformat()
+        
+        artifact.content = json_io.dumps(test_data, indent=True)
         flag_modified(artifact, "content")
         
         await self.db.commit()
@@ -647,15 +712,189 @@ class TestService:
             "message": f"Test case {case_id} updated to {status}"
         }
     
-    def _clean_json_response(self, response_text: str) -> str:
-        """Clean JSON response from AI."""
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        return response_text.strip()
+    async def _latest_artifact(
+        self,
+        project_id: str,
+        artifact_type: ArtifactType,
+        *criteria
+    ) -> Optional[Artifact]:
+        """
+        Load the most recent artifact of one type.
+        
+        Args:
+            project_id: ID of the project
+            artifact_type: Artifact type to look up
+            *criteria: Extra filter clauses
+            
+        Returns:
+            The newest matching artifact, or None
+        """
+        result = await self.db.execute(
+            select(Artifact)
+            .where(
+                and_(
+                    Artifact.project_id == project_id,
+                    Artifact.artifact_type == artifact_type,
+                    *criteria
+                )
+            )
+            .order_by(desc(Artifact.created_at))
+            .limit(1)
+        )
+        return result.scalars().first()
+    
+    async def _latest_document(
+        self,
+        project_id: str,
+        artifact_type: ArtifactType
+    ) -> Tuple[Optional[Artifact], Any]:
+        """
+        Load the parsed content of the latest artifact of one type.
+        
+        Parsing goes through the per-request _parse_artifact_content memo, so
+        every request sees the committed content, including test runs and
+        status changes written by other workers.
+        
+        Args:
+            project_id: ID of the project
+            artifact_type: Artifact type to look up
+            
+        Returns:
+            Tuple of (artifact, parsed content; shared, must not be mutated),
+            or (None, None) if there is no such artifact
+            
+        Raises:
+            json_io.JSONDecodeError: If the content is not valid JSON
+        """
+        artifact = await self._latest_artifact(project_id, artifact_type)
+        if artifact is None:
+            return None, None
+        return artifact, self._parse_artifact_content(artifact)
+    
+    async def _load_latest_architecture_excerpt(self, project_id: str) -> Optional[str]:
+        """
+        Load the start of the latest architecture document on a short-lived session.
+        
+        The excerpt is cut in SQL so the full document is never transferred.
+        
+        Args:
+            project_id: ID of the project
+            
+        Returns:
+            First ARCHITECTURE_PROMPT_CHARS characters of the architecture
+            markdown, or None if Design was not completed
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(func.substr(Artifact.content, 1, ARCHITECTURE_PROMPT_CHARS)).where(
+                    and_(
+                        Artifact.project_id == project_id,
+                        Artifact.artifact_type == ArtifactType.ARCHITECTURE
+                    )
+                ).order_by(desc(Artifact.created_at)).limit(1)
+            )
+            return result.scalars().first()
+    
+    async def _latest_rows(
+        self,
+        project_id: str,
+        artifact_types: Iterable[ArtifactType],
+        *columns
+    ) -> List[Any]:
+        """
+        Select columns of the latest artifact of each type in one query.
+        
+        Ranks rows per type in SQL so only one row per type is transferred;
+        ROW_NUMBER() is used rather than DISTINCT ON to stay portable to SQLite.
+        
+        Args:
+            project_id: ID of the project
+            artifact_types: Artifact types to look up
+            *columns: Artifact columns to return beside artifact_type
+            
+        Returns:
+            One row per type that exists, with artifact_type and the columns
+        """
+        ranked = (
+            select(
+                Artifact.artifact_type,
+                *columns,
+                func.row_number().over(
+                    partition_by=Artifact.artifact_type,
+                    order_by=desc(Artifact.created_at)
+                ).label("row_rank")
+            )
+            .where(
+                and_(
+                    Artifact.project_id == project_id,
+                    Artifact.artifact_type.in_(artifact_types)
+                )
+            )
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(ranked.c.artifact_type, *(ranked.c[column.key] for column in columns))
+            .where(ranked.c.row_rank == 1)
+        )
+        return result.all()
+    
+    async def _get_prompt_artifacts(
+        self,
+        project_id: str,
+        fields: Dict[ArtifactType, str]
+    ) -> Dict[str, str]:
+        """
+        Get the latest artifact content of each prompt type plus a tickets summary.
+        
+        Args:
+            project_id: ID of the project
+            fields: Artifact type -> prompt field
+            
+        Returns:
+            Dictionary of prompt field -> content ("" when the type is missing)
+        """
+        artifact_contents = dict.fromkeys(fields.values(), "")
+        for row in await self._latest_rows(project_id, fields, Artifact.content):
+            artifact_contents[fields[row.artifact_type]] = row.content
+        
+        artifact_contents["tickets_summary"] = ""
+        tickets_artifact = await self._latest_artifact(
+            project_id,
+            ArtifactType.CODE,
+            Artifact.stage == StageType.DEVELOP,
+            Artifact.name == "Development Tickets"
+        )
+        if tickets_artifact:
+            try:
+                artifact_contents["tickets_summary"] = self._summarize_tickets(
+                    json_io.loads(tickets_artifact.content)
+                )
+            except json_io.JSONDecodeError:
+                pass
+        return artifact_contents
+    
+    def _parse_artifact_content(self, artifact: Artifact) -> Any:
+        """
+        Parse an artifact's JSON content, at most once per content version.
+        
+        The cache entry is reused only while the artifact still holds the very
+        string that was parsed, so rewriting content invalidates it.
+        
+        Args:
+            artifact: Artifact with JSON content
+            
+        Returns:
+            Parsed content (shared; callers that mutate it must rewrite content)
+            
+        Raises:
+            json_io.JSONDecodeError: If the content is not valid JSON
+        """
+        cached = self._parse_cache.get(artifact.id)
+        if cached is not None and cached[1] is artifact.content:
+            return cached[2]
+        parsed = json_io.loads(artifact.content)
+        self._parse_cache[artifact.id] = (artifact, artifact.content, parsed)
+        return parsed
     
     def _summarize_tickets(self, tickets_data: Dict[str, Any]) -> str:
         """Create a summary of development tickets for the test prompts."""
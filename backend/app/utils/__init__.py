@@ -6,6 +6,7 @@ Utility module exports.
 from app.utils.converters import (
     project_to_dict,
     artifact_to_dict,
+    artifacts_to_dicts,
     commit_to_dict,
     activity_to_dict,
     gate_review_to_dict,
@@ -15,6 +16,7 @@ from app.utils.converters import (
 __all__ = [
     "project_to_dict",
     "artifact_to_dict",
+    "artifacts_to_dicts",
     "commit_to_dict",
     "activity_to_dict",
     "gate_review_to_dict",
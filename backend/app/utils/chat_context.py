@@ -5,13 +5,29 @@ All stage services should use these functions to ensure consistent
 and robust chat context is provided to the LLM for document generation.
 """
 
-from typing import Dict, List, Any, Optional
-from sqlalchemy import select, and_
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Union
+from sqlalchemy import select, and_, or_, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.models.chat_message import ChatMessage
 from app.models.enums import StageType
 
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - token counts fall back to an estimate
+    tiktoken = None
+
+
+# Rough characters-per-token ratio used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+# Role of the rolling-summary row kept alongside raw chat turns
+SUMMARY_ROLE = "summary"
+
 
 # Stage display names for formatting
 STAGE_DISPLAY_NAMES = {
@@ -34,6 +50,94 @@ STAGE_DESCRIPTIONS = {
     StageType.DEPLOY: "Release planning and deployment"
 }
 
+# Section header of each stage in the multi-stage chat history
+_STAGE_HEADERS = {
+    stage: STAGE_DISPLAY_NAMES.get(stage, stage.value.title())
+    + (f" ({STAGE_DESCRIPTIONS[stage]})" if stage in STAGE_DESCRIPTIONS else "")
+    for stage in StageType
+}
+
+_STAGE_SEPARATOR = "─" * 50
+
+
+# Speaker labels of formatted chat turns
+_USER_LABEL = "👤 **USER**"
+_AI_LABEL = "🤖 **AI SPECIALIST**"
+
+# Static banner opening the multi-stage chat history in prompts
+_CHAT_HISTORY_BANNER = "\n".join([
+    "\n",
+    "╔" + "═" * 70 + "╗",
+    "║" + " " * 15 + "💬 CONVERSATION HISTORY (CRITICAL CONTEXT)" + " " * 14 + "║",
+    "╚" + "═" * 70 + "╝",
+    "",
+    "┌" + "─" * 70 + "┐",
+    "│ ⚠️  MANDATORY INSTRUCTION: You MUST incorporate ALL relevant         │",
+    "│    information from the conversations below into your output.       │",
+    "├" + "─" * 70 + "┤",
+    "│ The user has already discussed these details with the AI specialist │",
+    "│ and expects ALL of it to appear in the generated document.         │",
+    "│                                                                      │",
+    "│ EXTRACT AND INCLUDE:                                                 │",
+    "│ • Specific requirements mentioned                                    │",
+    "│ • Business rules and constraints                                     │",
+    "│ • Technical preferences                                              │",
+    "│ • Priorities (high/low)                                              │",
+    "│ • Stakeholders identified                                            │",
+    "│ • Edge cases discussed                                               │",
+    "│ • Exact terminology/field names used                                 │",
+    "└" + "─" * 70 + "┘",
+    "",
+])
+
+# Static checklist closing the multi-stage chat history in prompts
+_CHAT_HISTORY_CHECKLIST = "\n".join([
+    "",
+    "┌" + "─" * 70 + "┐",
+    "│ ✅ CHECKLIST - Before finalizing your response, verify:              │",
+    "├" + "─" * 70 + "┤",
+    "│ □ Have I included ALL specific requirements from conversations?      │",
+    "│ □ Have I used the EXACT terminology the user used?                   │",
+    "│ □ Have I addressed ALL constraints mentioned (budget, timeline)?     │",
+    "│ □ Have I included ALL stakeholders identified?                       │",
+    "│ □ Have I noted the priorities the user indicated?                    │",
+    "│ □ Have I covered edge cases and scenarios discussed?                 │",
+    "│ □ Have I respected technical preferences stated?                     │",
+    "└" + "─" * 70 + "┘",
+    "",
+])
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """Load and cache the tiktoken encoding for a model, if available."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown deployment name or encoding files not reachable
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count prompt tokens for a piece of text.
+    
+    Uses tiktoken when installed, otherwise a character-based estimate.
+    
+    Args:
+        text: Text to measure
+        model: Model name (defaults to the configured Azure deployment)
+        
+    Returns:
+        Number of tokens (exact or estimated)
+    """
+    encoding = _get_encoding(model or settings.azure_openai_deployment)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
 
 async def get_chat_history_for_stage(
     db: AsyncSession,
@@ -53,30 +157,60 @@ async def get_chat_history_for_stage(
     Returns:
         List of chat messages with role and content
     """
+    # Range scan on ix_chat_messages_project_stage_created; the LIMIT is
+    # satisfied from the index without sorting the project's messages
     result = await db.execute(
-        select(ChatMessage)
+        select(ChatMessage.role, ChatMessage.content)
         .where(
             and_(
                 ChatMessage.project_id == project_id,
-                ChatMessage.stage == stage
+                ChatMessage.stage == stage,
+                ChatMessage.role != SUMMARY_ROLE
             )
         )
         .order_by(ChatMessage.created_at)
         .limit(limit)
     )
-    messages = result.scalars().all()
     
+    # Plain column rows; no ORM instances are hydrated for a prompt read
     return [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages
+        {"role": role, "content": content}
+        for role, content in result.all()
     ]
 
 
+def created_after_condition(
+    stages: List[StageType],
+    after: Union[datetime, Dict[StageType, Optional[datetime]], None]
+) -> Optional[Any]:
+    """
+    Build the filter keeping chat messages newer than a cutoff.
+    
+    Args:
+        stages: Stages being queried
+        after: One cutoff for all stages, or a dict of per-stage cutoffs
+            (None meaning no cutoff for that stage)
+        
+    Returns:
+        SQL condition, or None when nothing is filtered out
+    """
+    if isinstance(after, dict):
+        return or_(*(
+            ChatMessage.stage == stage if after.get(stage) is None
+            else and_(ChatMessage.stage == stage, ChatMessage.created_at > after[stage])
+            for stage in stages
+        ))
+    if after is not None:
+        return ChatMessage.created_at > after
+    return None
+
+
 async def get_all_chat_history(
     db: AsyncSession,
     project_id: str,
     stages: Optional[List[StageType]] = None,
-    limit_per_stage: int = 50
+    limit_per_stage: int = 50,
+    after: Union[datetime, Dict[StageType, Optional[datetime]], None] = None
 ) -> Dict[StageType, List[Dict[str, str]]]:
     """
     Fetch chat history from multiple stages for comprehensive context.
@@ -86,6 +220,9 @@ async def get_all_chat_history(
         project_id: ID of the project
         stages: List of stages to fetch (defaults to all)
         limit_per_stage: Maximum messages per stage
+        after: Only include messages created after this time (e.g. the
+            point covered by a rolling summary); a dict gives one cutoff per
+            stage, with None meaning no cutoff
         
     Returns:
         Dictionary with stage types as keys and chat messages as values
@@ -98,16 +235,104 @@ async def get_all_chat_history(
             StageType.DEVELOP
         ]
     
-    all_history = {}
+    all_history = {stage: [] for stage in stages}
+    if not stages:
+        return all_history
+    
+    conditions = [
+        ChatMessage.project_id == project_id,
+        ChatMessage.stage.in_(stages),
+        ChatMessage.role != SUMMARY_ROLE
+    ]
+    cutoff = created_after_condition(stages, after)
+    if cutoff is not None:
+        conditions.append(cutoff)
     
-    for stage in stages:
-        all_history[stage] = await get_chat_history_for_stage(
-            db, project_id, stage, limit_per_stage
+    # Fetch every stage in one round trip, numbering messages per stage
+    ranked = (
+        select(
+            ChatMessage.stage,
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.created_at,
+            func.row_number().over(
+                partition_by=ChatMessage.stage,
+                order_by=ChatMessage.created_at
+            ).label("position")
         )
+        .where(and_(*conditions))
+        .subquery()
+    )
+    result = await db.execute(
+        select(ranked.c.stage, ranked.c.role, ranked.c.content)
+        .where(ranked.c.position <= limit_per_stage)
+        .order_by(ranked.c.stage, ranked.c.created_at)
+    )
+    
+    for stage, role, content in result.all():
+        all_history[stage].append({"role": role, "content": content})
     
     return all_history
 
 
+def fit_chat_history(
+    history: Dict[StageType, List[Dict[str, str]]],
+    budget: int
+) -> Dict[StageType, List[Dict[str, str]]]:
+    """
+    Prune chat history to fit a token budget.
+    
+    Messages are kept newest-first until the budget is spent. The first
+    user message of each stage is always kept, and the recent window is
+    trimmed so it starts with a user turn.
+    
+    Args:
+        history: Chat history by stage (oldest message first)
+        budget: Tokens available for chat messages
+        
+    Returns:
+        Pruned chat history with the same stage keys
+    """
+    fitted: Dict[StageType, List[Dict[str, str]]] = {}
+    
+    # Later stages hold the most recent discussion
+    for stage in reversed(list(history)):
+        messages = history[stage]
+        first_user = next(
+            (i for i, msg in enumerate(messages) if msg["role"] == "user"), None
+        )
+        
+        kept: List[Dict[str, str]] = []
+        if first_user is not None:
+            budget -= count_tokens(messages[first_user]["content"])
+        
+        floor = first_user if first_user is not None else -1
+        start = len(messages)
+        for i in range(len(messages) - 1, floor, -1):
+            cost = count_tokens(messages[i]["content"])
+            if cost > budget:
+                break
+            budget -= cost
+            start = i
+        
+        recent = messages[start:]
+        if first_user is not None:
+            while recent and recent[0]["role"] != "user":
+                recent = recent[1:]
+            kept.append(messages[first_user])
+        kept.extend(recent)
+        fitted[stage] = kept
+    
+    return {stage: fitted[stage] for stage in history}
+
+
+def _clip_message(content: str, max_length: int) -> str:
+    """Truncate a very long message but keep its opening context."""
+    if len(content) > max_length:
+        return content[:max_length] + "... [truncated]"
+    return content
+
+
 def format_chat_history_for_prompt(
     chat_history: List[Dict[str, str]],
     stage_name: str = "Discussion",
@@ -129,23 +354,17 @@ def format_chat_history_for_prompt(
     if not chat_history:
         return ""
     
-    formatted_parts = []
+    # One join over a list comprehension; str.join would build the same list
+    # from a generator first
+    body = "\n".join([
+        f"{_USER_LABEL if msg['role'] == 'user' else _AI_LABEL}:\n"
+        f"{_clip_message(msg['content'], max_message_length)}\n"
+        for msg in chat_history
+    ])
     
     if include_header:
-        formatted_parts.append(f"\n### {stage_name}")
-        formatted_parts.append("*Key discussion points and requirements from user conversation:*\n")
-    
-    for i, msg in enumerate(chat_history, 1):
-        role_label = "👤 **USER**" if msg["role"] == "user" else "🤖 **AI SPECIALIST**"
-        content = msg['content']
-        
-        # Truncate very long messages but keep context
-        if len(content) > max_message_length:
-            content = content[:max_message_length] + "... [truncated]"
-        
-        formatted_parts.append(f"{role_label}:\n{content}\n")
-    
-    return "\n".join(formatted_parts)
+        return f"\n### {stage_name}\n*Key discussion points and requirements from user conversation:*\n\n{body}"
+    return body
 
 
 def format_all_chat_history_for_prompt(
@@ -165,77 +384,55 @@ def format_all_chat_history_for_prompt(
     Returns:
         Formatted string of all chat history ready for prompt inclusion
     """
-    total_messages = sum(len(msgs) for msgs in all_history.values())
-    
-    if total_messages == 0:
-        return ""
-    
-    parts = []
-    
-    # Header section with STRONG emphasis
-    if intro_text:
-        parts.append(intro_text)
-    else:
-        parts.append("\n")
-        parts.append("╔" + "═" * 70 + "╗")
-        parts.append("║" + " " * 15 + "💬 CONVERSATION HISTORY (CRITICAL CONTEXT)" + " " * 14 + "║")
-        parts.append("╚" + "═" * 70 + "╝")
-        parts.append("")
-        parts.append("┌" + "─" * 70 + "┐")
-        parts.append("│ ⚠️  MANDATORY INSTRUCTION: You MUST incorporate ALL relevant         │")
-        parts.append("│    information from the conversations below into your output.       │")
-        parts.append("├" + "─" * 70 + "┤")
-        parts.append("│ The user has already discussed these details with the AI specialist │")
-        parts.append("│ and expects ALL of it to appear in the generated document.         │")
-        parts.append("│                                                                      │")
-        parts.append("│ EXTRACT AND INCLUDE:                                                 │")
-        parts.append("│ • Specific requirements mentioned                                    │")
-        parts.append("│ • Business rules and constraints                                     │")
-        parts.append("│ • Technical preferences                                              │")
-        parts.append("│ • Priorities (high/low)                                              │")
-        parts.append("│ • Stakeholders identified                                            │")
-        parts.append("│ • Edge cases discussed                                               │")
-        parts.append("│ • Exact terminology/field names used                                 │")
-        parts.append("└" + "─" * 70 + "┘")
-        parts.append("")
-        parts.append(f"📊 **Total messages across all stages: {total_messages}**")
-        parts.append("")
-    
-    # Format each stage's history
+    # Each stage's history, counting messages in the same pass; slot 0 is
+    # kept for the header, which needs the final count
+    parts = [""]
+    total_messages = 0
     for stage_type, messages in all_history.items():
         if messages:
-            stage_display = STAGE_DISPLAY_NAMES.get(stage_type, stage_type.value.title())
-            stage_desc = STAGE_DESCRIPTIONS.get(stage_type, "")
-            
-            header = f"{stage_display}"
-            if stage_desc:
-                header += f" ({stage_desc})"
-            
+            total_messages += len(messages)
             parts.append(format_chat_history_for_prompt(
                 messages, 
-                header,
+                _STAGE_HEADERS[stage_type],
                 include_header=True
             ))
-            parts.append("─" * 50)
-    
-    # Footer instruction with checklist
-    parts.append("")
-    parts.append("┌" + "─" * 70 + "┐")
-    parts.append("│ ✅ CHECKLIST - Before finalizing your response, verify:              │")
-    parts.append("├" + "─" * 70 + "┤")
-    parts.append("│ □ Have I included ALL specific requirements from conversations?      │")
-    parts.append("│ □ Have I used the EXACT terminology the user used?                   │")
-    parts.append("│ □ Have I addressed ALL constraints mentioned (budget, timeline)?     │")
-    parts.append("│ □ Have I included ALL stakeholders identified?                       │")
-    parts.append("│ □ Have I noted the priorities the user indicated?                    │")
-    parts.append("│ □ Have I covered edge cases and scenarios discussed?                 │")
-    parts.append("│ □ Have I respected technical preferences stated?                     │")
-    parts.append("└" + "─" * 70 + "┘")
-    parts.append("")
+            parts.append(_STAGE_SEPARATOR)
+    
+    if total_messages == 0:
+        return ""
+    
+    # Header section with STRONG emphasis; only the message count varies
+    if intro_text:
+        parts[0] = intro_text
+    else:
+        parts[0] = f"{_CHAT_HISTORY_BANNER}\n📊 **Total messages across all stages: {total_messages}**\n"
+    parts.append(_CHAT_HISTORY_CHECKLIST)
     
     return "\n".join(parts)
 
 
+# Indicator substrings of each key-point category, matched case-insensitively
+# in user messages
+_KEY_POINT_INDICATORS = {
+    "requirements": ("must", "need", "should", "require", "want", "has to", "we need"),
+    "constraints": ("budget", "timeline", "deadline", "can't", "cannot", "limit", "maximum", "minimum", "by", "within"),
+    "preferences": ("prefer", "like", "want to use", "rather", "ideally", "would be nice"),
+    "priorities": ("important", "critical", "priority", "first", "later", "mvp", "essential", "nice to have"),
+    "stakeholders": ("user", "admin", "manager", "team", "department", "customer", "client", "stakeholder", "role"),
+    "technical": ("api", "database", "frontend", "backend", "server", "cloud", "aws", "azure", "react", "python", "authentication"),
+}
+
+# Maximum number of unique key points kept per category
+KEY_POINTS_PER_CATEGORY = 10
+
+# One alternation per category, so a message is scanned once per category
+# (IGNORECASE spares lowercasing a copy of every message)
+_KEY_POINT_PATTERNS = {
+    category: re.compile("|".join(map(re.escape, indicators)), re.IGNORECASE)
+    for category, indicators in _KEY_POINT_INDICATORS.items()
+}
+
+
 def extract_key_points_from_history(
     chat_history: List[Dict[str, str]]
 ) -> Dict[str, List[str]]:
@@ -260,50 +457,31 @@ def extract_key_points_from_history(
         "questions_answered": []
     }
     
-    # Extract user messages (these contain the requirements)
-    user_messages = [msg for msg in chat_history if msg["role"] == "user"]
+    # Unique points per category in first-seen order; a category stops
+    # collecting (and is no longer scanned) once it holds the limit
+    collected = {category: {} for category in key_points}
+    open_patterns = dict(_KEY_POINT_PATTERNS)
     
-    # Simple extraction based on message content
+    # Simple extraction based on the content of user messages (these contain
+    # the requirements); each category is one compiled substring scan
     # In a more sophisticated implementation, you could use NLP here
-    for msg in user_messages:
-        content = msg["content"].lower()
-        original = msg["content"]
-        
-        # Look for requirement indicators
-        if any(word in content for word in ["must", "need", "should", "require", "want", "has to", "we need"]):
-            key_points["requirements"].append(original[:300])
+    for msg in chat_history:
+        if not open_patterns:
+            break
+        if msg["role"] != "user":
+            continue
+        content = msg["content"]
+        # One bounded copy per message, shared by every matching category
+        snippet = content[:300]
         
-        # Look for constraint indicators
-        if any(word in content for word in ["budget", "timeline", "deadline", "can't", "cannot", "limit", "maximum", "minimum", "by", "within"]):
-            key_points["constraints"].append(original[:300])
-        
-        # Look for preference indicators
-        if any(word in content for word in ["prefer", "like", "want to use", "rather", "ideally", "would be nice"]):
-            key_points["preferences"].append(original[:300])
-        
-        # Look for priority indicators
-        if any(word in content for word in ["important", "critical", "priority", "first", "later", "mvp", "essential", "nice to have"]):
-            key_points["priorities"].append(original[:300])
-        
-        # Look for stakeholder indicators
-        if any(word in content for word in ["user", "admin", "manager", "team", "department", "customer", "client", "stakeholder", "role"]):
-            key_points["stakeholders"].append(original[:300])
-        
-        # Look for technical indicators
-        if any(word in content for word in ["api", "database", "frontend", "backend", "server", "cloud", "aws", "azure", "react", "python", "authentication"]):
-            key_points["technical"].append(original[:300])
-    
-    # Remove duplicates while preserving order
-    for category in key_points:
-        seen = set()
-        unique = []
-        for item in key_points[category]:
-            if item not in seen:
-                seen.add(item)
-                unique.append(item)
-        key_points[category] = unique[:10]  # Limit to 10 per category
-    
-    return key_points
+        for category, pattern in list(open_patterns.items()):
+            if pattern.search(content):
+                points = collected[category]
+                points[snippet] = None
+                if len(points) >= KEY_POINTS_PER_CATEGORY:
+                    del open_patterns[category]
+    
+    return {category: list(points) for category, points in collected.items()}
 
 
 def count_chat_messages(
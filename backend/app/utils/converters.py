@@ -4,9 +4,16 @@ Model to dictionary converters for API responses.
 Preserves exact format from original main.py.
 """
 
-from typing import Any, Dict, Optional
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional
 from app.models import Project, Artifact
 
+# Every artifact attribute the API response reads, fetched in one call
+_ARTIFACT_FIELDS = attrgetter(
+    "id", "project_id", "stage", "artifact_type", "name", "content",
+    "version", "created_by", "meta_data", "created_at", "updated_at",
+)
+
 
 def project_to_dict(project: Project) -> Dict[str, Any]:
     """
@@ -39,21 +46,40 @@ def artifact_to_dict(artifact: Artifact) -> Dict[str, Any]:
     Returns:
         Dictionary representation matching original API contract
     """
-    artifact_id_str = str(artifact.id)
-    return {
-        "id": artifact_id_str,
-        "artifact_id": artifact_id_str,  # Alias for frontend compatibility
-        "project_id": str(artifact.project_id) if artifact.project_id else None,
-        "stage": artifact.stage.value if artifact.stage else None,
-        "artifact_type": artifact.artifact_type.value if artifact.artifact_type else None,
-        "name": artifact.name,
-        "content": artifact.content,
-        "version": artifact.version,
-        "created_by": artifact.created_by,
-        "meta_data": artifact.meta_data or {},
-        "created_at": artifact.created_at.isoformat() if artifact.created_at else None,
-        "updated_at": artifact.updated_at.isoformat() if artifact.updated_at else None,
-    }
+    return artifacts_to_dicts((artifact,))[0]
+
+
+def artifacts_to_dicts(artifacts: Iterable[Artifact]) -> List[Dict[str, Any]]:
+    """
+    Convert many Artifact models to API response dictionaries.
+    
+    Args:
+        artifacts: Artifact model instances
+        
+    Returns:
+        Dictionaries in the same order, each matching artifact_to_dict
+    """
+    converted = []
+    for (
+        artifact_id, project_id, stage, artifact_type, name, content,
+        version, created_by, meta_data, created_at, updated_at,
+    ) in map(_ARTIFACT_FIELDS, artifacts):
+        artifact_id_str = str(artifact_id)
+        converted.append({
+            "id": artifact_id_str,
+            "artifact_id": artifact_id_str,  # Alias for frontend compatibility
+            "project_id": str(project_id) if project_id else None,
+            "stage": stage.value if stage else None,
+            "artifact_type": artifact_type.value if artifact_type else None,
+            "name": name,
+            "content": content,
+            "version": version,
+            "created_by": created_by,
+            "meta_data": meta_data or {},
+            "created_at": created_at.isoformat() if created_at else None,
+            "updated_at": updated_at.isoformat() if updated_at else None,
+        })
+    return converted
 
 
 def commit_to_dict(commit) -> Dict[str, Any]:
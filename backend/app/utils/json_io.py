@@ -0,0 +1,54 @@
+# app/utils/json_io.py
+"""
+Fast JSON helpers backed by orjson.
+"""
+
+import re
+from typing import Any, Union
+
+import orjson
+
+JSONDecodeError = orjson.JSONDecodeError
+
+# Optional ```json / ``` fences around an AI JSON response, stripped in one pass
+_CODE_FENCE_RE = re.compile(r"\A\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*\Z", re.DOTALL)
+
+
+def dumps(obj: Any, *, indent: bool = False) -> str:
+    """
+    Serialize an object to a JSON string.
+    
+    Args:
+        obj: Object to serialize
+        indent: Pretty-print with two-space indentation
+        
+    Returns:
+        JSON string (decoded so it can be stored in text columns)
+    """
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse a JSON string or bytes.
+    
+    Args:
+        data: JSON document
+        
+    Returns:
+        Parsed Python object
+    """
+    return orjson.loads(data)
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Remove optional markdown code fences around an AI JSON response.
+    
+    Args:
+        text: Raw model output
+        
+    Returns:
+        The fenced body (or the whole text, trimmed, when unfenced)
+    """
+    return _CODE_FENCE_RE.match(text).group(1)
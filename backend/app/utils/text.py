@@ -0,0 +1,11 @@
+# app/utils/text.py
+"""
+Plain-text helpers shared by the prompt and GitHub body builders.
+"""
+
+from typing import Any, Iterable
+
+
+def prefixed_lines(items: Iterable[Any], prefix: str = "") -> str:
+    """Join list items one per line, each behind a prefix."""
+    return "\n".join([f"{prefix}{item}" for item in items])
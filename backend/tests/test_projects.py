@@ -28,10 +28,25 @@ async def test_get_project(client):
 
 
 @pytest.mark.asyncio
-async def test_update_project(client):
+async def test_update_project(client, test_db):
     """Test updating a project."""
-    # TODO: Implement
-    pass
+    from app.models import Project
+    
+    project = Project(name="Portal", created_by="tester", stages_config={})
+    test_db.add(project)
+    await test_db.commit()
+    created_updated_at = project.updated_at
+    
+    response = await client.put(
+        f"/api/projects/{project.id}",
+        json={"name": "Portal v2", "stages_config": {"discover": {"status": "done"}}}
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["name"] == "Portal v2"
+    assert data["stages_config"] == {"discover": {"status": "done"}}
+    assert data["updated_at"] > created_updated_at.isoformat()
 
 
 @pytest.mark.asyncio